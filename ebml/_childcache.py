@@ -0,0 +1,90 @@
+import collections
+import threading
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ("hits", "misses", "evictions", "count", "size", "maxsize"))
+
+
+class ChildCache(object):
+    """
+    Least-recently-used cache of children decoded from the file of a root
+    EBMLMasterElementInFile, holding strong references to them until more
+    than 'maxsize' bytes (counted as encoded in the file) are cached.
+
+    Children are looked up through the child indices of their parents (which
+    hold weak references to them), so the cache only has to keep them (and
+    their parents, which children only reference weakly) alive, and is keyed
+    by the children themselves.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, child):
+        return id(child) in self._entries
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         len(self._entries), self.size, self.maxsize)
+
+    def hit(self, child, size):
+        """Records a lookup of 'child' that was found in memory."""
+        with self._lock:
+            self.hits += 1
+            self._put(child, size)
+
+    def miss(self, child, size):
+        """Records a lookup that had 'child' read from the file."""
+        with self._lock:
+            self.misses += 1
+            self._put(child, size)
+
+    def _put(self, child, size):
+        entries = self._entries
+        key = id(child)
+
+        if key in entries:
+            entries.move_to_end(key)
+            return
+
+        if size > self.maxsize:
+            return
+
+        entries[key] = (child, child.parent, size)
+        self.size += size
+
+        while self.size > self.maxsize:
+            (_, (_, _, evicted)) = entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def discard(self, child):
+        """Drops 'child' from the cache, if present."""
+        with self._lock:
+            entry = self._entries.pop(id(child), None)
+
+            if entry is not None:
+                self.size -= entry[2]
+
+    def discardFrom(self, offset):
+        """Drops every child starting at or past file offset 'offset'."""
+        with self._lock:
+            for (key, (child, parent, size)) in list(self._entries.items()):
+                if (parent.parent is None or parent.dataOffsetInFile
+                        + child.offsetInParent >= offset):
+                    del self._entries[key]
+                    self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,526 @@
+import bisect
+import itertools
+import operator
+
+
+class ChildIndex(object):
+    """
+    Ordered index of the children of an EBMLMasterElementInFile, mapping the
+    offset of each child to an (ebmlID, ref, endOffset) tuple.
+
+    Entries are kept in a list of sorted blocks (a B-tree with a single level
+    of internal nodes), so that inserts, deletes and neighbor lookups cost
+    O(log n) comparisons plus moving at most 2*load entries, rather than O(n)
+    as with a single sorted list.
+
+    Offsets and end offsets are stored relative to a per-block delta, kept as
+    a difference array over the blocks and summed with a Fenwick tree, so
+    that shift() (used by collapseRange and insertRange) only has to touch a
+    single block instead of every entry that follows. Once lookups outnumber
+    shifts, the block deltas are flattened into a cached list so that
+    searches are back to plain bisection.
+    """
+
+    def __init__(self, load=512):
+        self._load = load
+        self._keys = []
+        self._values = []
+        self._maxes = []
+        self._diff = []
+        self._tree = None
+        self._anyDelta = False
+        self._invalidate()
+        self._len = 0
+
+    @classmethod
+    def fromSorted(cls, offsets, values, load=512):
+        """
+        Builds an index from a list of strictly increasing offsets and a list
+        of corresponding values.
+        """
+        self = cls(load)
+        self.extend(offsets, values)
+        return self
+
+    def __len__(self):
+        return self._len
+
+    def __bool__(self):
+        return self._len > 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())})"
+
+    # Block deltas
+
+    def _invalidate(self):
+        self._cum = None
+        self._absmaxes = None
+        self._misses = 0
+
+    def _structureChanged(self):
+        self._tree = None
+        self._invalidate()
+
+        if self._anyDelta:
+            self._anyDelta = any(self._diff)
+
+    def _setMax(self, i):
+        self._maxes[i] = self._keys[i][-1]
+
+        if self._absmaxes is not None:
+            self._absmaxes[i] = self._maxes[i] + self._cum[i]
+
+    def _delta(self, i):
+        """Returns the delta applied to block i."""
+        if not self._anyDelta:
+            return 0
+
+        if self._cum is not None:
+            return self._cum[i]
+
+        tree = self._tree
+
+        if tree is None:
+            # Build the Fenwick tree over the difference array in O(n).
+            n = len(self._diff)
+            tree = self._tree = [0] + self._diff
+
+            for k in range(1, n + 1):
+                p = k + (k & -k)
+
+                if p <= n:
+                    tree[p] += tree[k]
+
+        s = 0
+        i += 1
+
+        while i > 0:
+            s += tree[i]
+            i -= i & -i
+
+        return s
+
+    def _addDelta(self, i, delta):
+        """Adds 'delta' to blocks i and above."""
+        self._diff[i] += delta
+        self._anyDelta = True
+        self._invalidate()
+        tree = self._tree
+
+        if tree is not None:
+            n = len(self._diff)
+            i += 1
+
+            while i <= n:
+                tree[i] += delta
+                i += i & -i
+
+    def _bisect(self, offset, right=False):
+        """
+        Returns the first block whose largest offset is >= 'offset' (or
+        > 'offset' if 'right').
+        """
+        maxes = self._maxes
+
+        if self._anyDelta:
+            if self._absmaxes is None:
+                self._misses += 1
+
+                if self._misses > 16:
+                    self._cum = list(itertools.accumulate(self._diff))
+                    self._absmaxes = list(map(operator.add, maxes, self._cum))
+
+            maxes = self._absmaxes
+
+        if maxes is not None:
+            if right:
+                return bisect.bisect_right(maxes, offset)
+
+            return bisect.bisect_left(maxes, offset)
+
+        maxes = self._maxes
+        lo = 0
+        hi = len(maxes)
+
+        while lo < hi:
+            mid = (lo + hi)//2
+            m = maxes[mid] + self._delta(mid)
+
+            if m < offset or (right and m == offset):
+                lo = mid + 1
+
+            else:
+                hi = mid
+
+        return lo
+
+    # Mapping interface
+
+    def _locate(self, offset):
+        """
+        Returns (i, j, delta) such that self._keys[i][j] + delta == offset,
+        or None.
+        """
+        i = self._bisect(offset)
+
+        if i < len(self._maxes):
+            d = self._delta(i)
+            keys = self._keys[i]
+            j = bisect.bisect_left(keys, offset - d)
+
+            if keys[j] + d == offset:
+                return (i, j, d)
+
+    @staticmethod
+    def _shifted(value, d):
+        if d:
+            (ebmlID, ref, end) = value
+            return (ebmlID, ref, end + d)
+
+        return value
+
+    def __contains__(self, offset):
+        return isinstance(offset, int) and self._locate(offset) is not None
+
+    def __getitem__(self, offset):
+        loc = self._locate(offset)
+
+        if loc is None:
+            raise KeyError(offset)
+
+        (i, j, d) = loc
+        return self._shifted(self._values[i][j], d)
+
+    def get(self, offset, default=None):
+        if not isinstance(offset, int):
+            return default
+
+        loc = self._locate(offset)
+
+        if loc is None:
+            return default
+
+        (i, j, d) = loc
+        return self._shifted(self._values[i][j], d)
+
+    def __setitem__(self, offset, value):
+        maxes = self._maxes
+
+        if not maxes:
+            self._keys.append([offset])
+            self._values.append([value])
+            maxes.append(offset)
+            self._diff = [0]
+            self._tree = None
+            self._anyDelta = False
+            self._invalidate()
+            self._len = 1
+            return
+
+        i = self._bisect(offset)
+
+        if i == len(maxes):
+            i -= 1
+
+        d = self._delta(i)
+        keys = self._keys[i]
+        j = bisect.bisect_left(keys, offset - d)
+        value = self._shifted(value, -d)
+
+        if j < len(keys) and keys[j] + d == offset:
+            self._values[i][j] = value
+            return
+
+        keys.insert(j, offset - d)
+        self._values[i].insert(j, value)
+        self._setMax(i)
+        self._len += 1
+
+        if len(keys) > 2*self._load:
+            self._split(i)
+
+    def append(self, offset, value):
+        """Adds an entry with an offset greater than any already present."""
+        last = self.last()
+
+        if last is not None and offset <= last:
+            raise ValueError(f"Offset {offset} is not past the last child.")
+
+        if not self._keys or len(self._keys[-1]) >= self._load:
+            self._keys.append([])
+            self._values.append([])
+            self._maxes.append(None)
+            self._diff.append(0)
+            self._structureChanged()
+
+        d = self._delta(len(self._keys) - 1)
+        self._keys[-1].append(offset - d)
+        self._values[-1].append(self._shifted(value, -d))
+        self._setMax(len(self._keys) - 1)
+        self._len += 1
+
+    def extend(self, offsets, values):
+        """
+        Adds entries from a list of strictly increasing offsets, all greater
+        than any already present, and a list of corresponding values.
+        """
+        if not len(offsets):
+            return
+
+        last = self.last()
+
+        if last is not None and offsets[0] <= last:
+            raise ValueError(
+                f"Offset {offsets[0]} is not past the last child.")
+
+        load = self._load
+        k = 0
+        d = 0
+
+        if self._keys:
+            # Fill up the last block first. New blocks get the same delta.
+            i = len(self._keys) - 1
+            d = self._delta(i)
+            k = max(load - len(self._keys[i]), 0)
+
+            if k:
+                self._keys[i].extend([offset - d for offset in offsets[:k]])
+                self._values[i].extend([self._shifted(value, -d)
+                                        for value in values[:k]])
+                self._setMax(i)
+
+        n = len(offsets)
+
+        for s in range(k, n, load):
+            keys = list(offsets[s:s + load])
+            blockvalues = list(values[s:s + load])
+
+            if d:
+                keys = [offset - d for offset in keys]
+                blockvalues = [self._shifted(value, -d)
+                               for value in blockvalues]
+
+            self._keys.append(keys)
+            self._values.append(blockvalues)
+            self._maxes.append(keys[-1])
+            self._diff.append(0)
+
+        if k < n:
+            self._structureChanged()
+
+        self._len += n
+
+    def _split(self, i):
+        load = self._load
+        keys = self._keys[i]
+        values = self._values[i]
+        self._keys[i:i + 1] = [keys[:load], keys[load:]]
+        self._values[i:i + 1] = [values[:load], values[load:]]
+        self._maxes[i:i + 1] = [keys[load - 1], keys[-1]]
+
+        # Both halves keep the delta of the original block.
+        self._diff.insert(i + 1, 0)
+        self._structureChanged()
+
+    def _dropBlock(self, i):
+        diff = self._diff
+
+        if i + 1 < len(diff):
+            diff[i + 1] += diff[i]
+
+        del self._keys[i]
+        del self._values[i]
+        del self._maxes[i]
+        del diff[i]
+        self._structureChanged()
+
+    def __delitem__(self, offset):
+        loc = self._locate(offset)
+
+        if loc is None:
+            raise KeyError(offset)
+
+        (i, j, _) = loc
+        keys = self._keys[i]
+        del keys[j]
+        del self._values[i][j]
+        self._len -= 1
+
+        if not keys:
+            self._dropBlock(i)
+            return
+
+        self._setMax(i)
+
+        if len(keys) < self._load//2 and i + 1 < len(self._keys):
+            # Merge with the next block, splitting again if that makes it
+            # too large.
+            d = self._diff[i + 1]
+            nextkeys = self._keys[i + 1]
+            nextvalues = self._values[i + 1]
+
+            if d:
+                nextkeys = [key + d for key in nextkeys]
+                nextvalues = [self._shifted(value, d) for value in nextvalues]
+
+            keys.extend(nextkeys)
+            self._values[i].extend(nextvalues)
+            self._dropBlock(i + 1)
+            self._setMax(i)
+
+            if len(keys) > 2*self._load:
+                self._split(i)
+
+    def pop(self, offset, *default):
+        try:
+            value = self[offset]
+
+        except KeyError:
+            if default:
+                return default[0]
+
+            raise
+
+        del self[offset]
+        return value
+
+    # Ordered queries
+
+    def _iterBlocks(self, i=0):
+        """Yields (keys, values, delta) for blocks i and above."""
+        if i >= len(self._keys):
+            return
+
+        d = self._delta(i) - self._diff[i]
+
+        for k in range(i, len(self._keys)):
+            d += self._diff[k]
+            yield (self._keys[k], self._values[k], d)
+
+    def __iter__(self):
+        for (keys, _, d) in self._iterBlocks():
+            if d:
+                for key in keys:
+                    yield key + d
+
+            else:
+                yield from keys
+
+    keys = __iter__
+
+    def values(self):
+        for (_, values, d) in self._iterBlocks():
+            for value in values:
+                yield self._shifted(value, d)
+
+    def items(self):
+        for (keys, values, d) in self._iterBlocks():
+            for (key, value) in zip(keys, values):
+                yield (key + d, self._shifted(value, d))
+
+    def first(self):
+        """Returns the smallest offset, or None if empty."""
+        if self._keys:
+            return self._keys[0][0] + self._diff[0]
+
+    def last(self):
+        """Returns the largest offset, or None if empty."""
+        if self._keys:
+            i = len(self._keys) - 1
+            return self._keys[i][-1] + self._delta(i)
+
+    def next(self, offset):
+        """Returns the smallest offset greater than 'offset', or None."""
+        i = self._bisect(offset, right=True)
+
+        if i < len(self._maxes):
+            d = self._delta(i)
+            keys = self._keys[i]
+            return keys[bisect.bisect_right(keys, offset - d)] + d
+
+    def prev(self, offset):
+        """Returns the largest offset less than 'offset', or None."""
+        i = self._bisect(offset)
+
+        if i < len(self._maxes):
+            d = self._delta(i)
+            keys = self._keys[i]
+            j = bisect.bisect_left(keys, offset - d)
+
+            if j > 0:
+                return keys[j - 1] + d
+
+        if i > 0:
+            return self._keys[i - 1][-1] + self._delta(i - 1)
+
+    def irange(self, start=None, stop=None):
+        """Yields offsets 'o' with start <= o < stop in increasing order."""
+        i = 0 if start is None else self._bisect(start)
+        j = None
+
+        for (keys, _, d) in self._iterBlocks(i):
+            if j is None and start is not None:
+                j = bisect.bisect_left(keys, start - d)
+
+            else:
+                j = 0
+
+            for key in keys[j:]:
+                offset = key + d
+
+                if stop is not None and offset >= stop:
+                    return
+
+                yield offset
+
+    def at(self, k):
+        """Returns the k-th smallest offset."""
+        if k < 0:
+            k += self._len
+
+        if not 0 <= k < self._len:
+            raise IndexError("Child index out of range.")
+
+        for (keys, _, d) in self._iterBlocks():
+            if k < len(keys):
+                return keys[k] + d
+
+            k -= len(keys)
+
+    def shift(self, offset, delta):
+        """
+        Adds 'delta' to the offset and end offset of every entry at or past
+        'offset'. The caller is responsible for ensuring that this does not
+        change the order of entries.
+
+        Only the entries of the block containing 'offset' are updated
+        directly; blocks past it receive the delta through the Fenwick tree,
+        so this costs O(load + log n).
+        """
+        if not delta:
+            return
+
+        i = self._bisect(offset)
+
+        if i == len(self._maxes):
+            return
+
+        d = self._delta(i)
+        keys = self._keys[i]
+        j = bisect.bisect_left(keys, offset - d)
+
+        if j == 0:
+            self._addDelta(i, delta)
+            return
+
+        values = self._values[i]
+
+        for k in range(j, len(keys)):
+            keys[k] += delta
+            values[k] = self._shifted(values[k], delta)
+
+        self._setMax(i)
+
+        if i + 1 < len(self._keys):
+            self._addDelta(i + 1, delta)
@@ -1,27 +1,87 @@
 from .base import Void
-from .vint import parseFile
+from .offsetindex import OffsetIndex
+from .vint import scanFile
+from ._childindex import ChildIndex
 
 def _scan(self):
-    self._children = {}
-    self._childoffsets = []
+    self._children = ChildIndex()
+    self._free = None
+    self._scanned = 0
+    self._indexOffset = self._indexEnd = None
+    self._indexCurrent = False
+    _scanmore(self, self.dataSize)
 
-    self.file.seek(self.dataOffsetInFile)
+def _scanmore(self, stop):
+    """
+    Resumes scanning at the scan watermark (self._scanned), until headers
+    have been read at least up to offset 'stop'.
+    """
+    scanned = self._scanned
+    self.file.seek(self.dataOffsetInFile + scanned)
+    headers = scanFile(self.file, self.dataSize - scanned,
+                       stop=stop - scanned)
+    _scanheaders(self, headers)
 
-    for (offsetInFile, ebmlID, vsize,
-            dataOffsetInFile, isize) in parseFile(
-                self.file, self.dataSize):
+    if self._scanned < stop:
+        # scanFile stopped short, so there is nothing left to find.
+        self._scanned = self.dataSize
 
-        if ebmlID != Void.ebmlID:
-            self._scanchild(
-                offsetInFile - self.dataOffsetInFile, ebmlID, vsize,
-                dataOffsetInFile - self.dataOffsetInFile, isize)
+def _scanheaders(self, headers):
+    """
+    Adds children to the child index from an array of headers returned by
+    scanFile, skipping Void elements and noting the location of any
+    OffsetIndex. Advances the scan watermark to where scanFile left off.
+    """
+    cdef unsigned long long dataOffsetInFile = self.dataOffsetInFile
+    cdef unsigned long long voidID = int.from_bytes(Void.ebmlID, "big")
+    cdef unsigned long long indexID = int.from_bytes(OffsetIndex.ebmlID, "big")
 
-def _scanchild(self, offset, ebmlID, vsize, dataoffset, isize):
-    self._children[offset] = (
-        ebmlID, None, dataoffset + isize)
-    # bisect.insort(self._childoffsets, offset)
+    isindex = headers["ebmlID"] == indexID
+
+    if isindex.any():
+        index = headers[isindex][-1]
+        self._indexOffset = int(index["offset"]) - dataOffsetInFile
+        self._indexEnd = (self._indexOffset + int(index["headerLength"])
+                          + int(index["dataSize"]))
+
+        # An index found by scanning may be out of date.
+        self._indexCurrent = False
+
+    self._scanned = self.file.tell() - dataOffsetInFile
+
+    headers = headers[(headers["ebmlID"] != voidID) & ~isindex]
+    offsets = (headers["offset"] - dataOffsetInFile).tolist()
+    ends = (headers["offset"] - dataOffsetInFile + headers["headerLength"]
+            + headers["dataSize"]).tolist()
+    ebmlIDs = headers["ebmlID"].tolist()
+    idLengths = headers["idLength"].tolist()
+
+    # Only a handful of distinct IDs are expected, so convert each of them
+    # to bytes only once.
+    idbytes = {ebmlID: ebmlID.to_bytes(k, "big")
+               for (ebmlID, k) in set(zip(ebmlIDs, idLengths))}
 
+    values = [(idbytes[ebmlID], None, end)
+              for (ebmlID, end) in zip(ebmlIDs, ends)]
+
+    if not offsets:
+        return
+
+    children = self._children
+    last = children.last()
+
+    # Offsets come out of scanFile in increasing order, and normally start
+    # past every child found so far.
+    if last is None or offsets[0] > last:
+        children.extend(offsets, values)
+
+    else:
+        for (offset, value) in zip(offsets, values):
+            if offset not in children:
+                children[offset] = value
+
+def _scanchild(self, offset, ebmlID, vsize, dataoffset, isize):
     # It is safe to assume that this function is being called on
     # increasing values of offset, so we will go with the less-
     # expensive append operation.
-    self._childoffsets.append(offset)
+    self._children.append(offset, (ebmlID, None, dataoffset + isize))
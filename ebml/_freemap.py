@@ -0,0 +1,324 @@
+import bisect
+import itertools
+
+
+class FreeSpaceMap(object):
+    """
+    Index of the gaps between the children of an EBMLMasterElementInFile
+    (and before the first and after the last child), used to answer
+    allocation requests without walking the children.
+
+    Gaps are kept in offset order in a list of sorted blocks of starts (as
+    in ChildIndex), along with the size of the largest gap in each block, so
+    that a search for the first gap of at least a given size from a given
+    offset skips whole blocks of smaller gaps. Gaps are also kept by exact
+    size (a dict of sorted lists of starts, and a sorted list of the sizes
+    present), for exact and best-fit requests.
+
+    No gap of size 1 can be left behind, as it could not be covered by a
+    Void element: a request of size 'size' fits in a gap of that exact size,
+    or of at least size + 2.
+    """
+
+    def __init__(self, load=256):
+        self._load = load
+        self._ends = {}
+        self._blocks = []
+        self._maxes = []
+        self._largest = []
+        self._bySize = {}
+        self._sizes = []
+
+    @classmethod
+    def fromChildren(cls, children, size, load=256):
+        """
+        Builds the map from (offset, (ebmlID, ref, endOffset)) pairs in
+        increasing order of offset, for an element of data size 'size'.
+        """
+
+        self = cls(load)
+        end = 0
+
+        for (offset, (_, _, endOffset)) in children:
+            if offset > end:
+                self._insert(end, offset)
+
+            end = endOffset
+
+        if size > end:
+            self._insert(end, size)
+
+        return self
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __iter__(self):
+        """Yields (start, end) for each gap in increasing order."""
+        for block in self._blocks:
+            for start in block:
+                yield (start, self._ends[start])
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r})"
+
+    @staticmethod
+    def fits(size, space):
+        """Checks if 'size' bytes can be allocated in 'space' bytes."""
+        return space == size or space >= size + 2
+
+    def _blockSizes(self, block):
+        ends = self._ends
+        return max(ends[start] - start for start in block)
+
+    def _insert(self, start, end):
+        size = end - start
+        self._ends[start] = end
+        blocks = self._blocks
+
+        if not blocks:
+            blocks.append([start])
+            self._maxes.append(start)
+            self._largest.append(size)
+
+        else:
+            i = min(bisect.bisect_left(self._maxes, start), len(blocks) - 1)
+            block = blocks[i]
+            bisect.insort(block, start)
+            self._maxes[i] = block[-1]
+            self._largest[i] = max(self._largest[i], size)
+
+            if len(block) > 2*self._load:
+                half = block[self._load:]
+                del block[self._load:]
+                blocks.insert(i + 1, half)
+                self._maxes[i:i + 1] = [block[-1], half[-1]]
+                self._largest[i:i + 1] = [self._blockSizes(block),
+                                          self._blockSizes(half)]
+
+        starts = self._bySize.get(size)
+
+        if starts is None:
+            starts = self._bySize[size] = []
+            bisect.insort(self._sizes, size)
+
+        bisect.insort(starts, start)
+
+    def _delete(self, start):
+        end = self._ends.pop(start)
+        size = end - start
+
+        i = bisect.bisect_left(self._maxes, start)
+        block = self._blocks[i]
+        del block[bisect.bisect_left(block, start)]
+
+        if not block:
+            del self._blocks[i], self._maxes[i], self._largest[i]
+
+        else:
+            self._maxes[i] = block[-1]
+
+            if size == self._largest[i]:
+                self._largest[i] = self._blockSizes(block)
+
+        starts = self._bySize[size]
+        del starts[bisect.bisect_left(starts, start)]
+
+        if not starts:
+            del self._bySize[size]
+            del self._sizes[bisect.bisect_left(self._sizes, size)]
+
+        return end
+
+    def containing(self, offset):
+        """
+        Returns (start, end) of the gap with start <= offset < end, or
+        None.
+        """
+
+        i = bisect.bisect_left(self._maxes, offset)
+
+        if i < len(self._blocks):
+            block = self._blocks[i]
+            j = bisect.bisect_right(block, offset)
+            start = block[j - 1] if j else None
+
+        else:
+            start = None
+
+        if start is None and i > 0:
+            start = self._maxes[i - 1]
+
+        if start is not None and offset < self._ends[start]:
+            return (start, self._ends[start])
+
+    def free(self, start, end):
+        """Marks [start, end) as free, merging it with adjacent gaps."""
+        if end <= start:
+            return
+
+        gap = self.containing(start - 1)
+
+        if gap is not None and gap[1] == start:
+            start = gap[0]
+            self._delete(start)
+
+        if end in self._ends:
+            end = self._delete(end)
+
+        self._insert(start, end)
+
+    def allocate(self, start, end):
+        """Marks [start, end), which must lie within a gap, as used."""
+        if end <= start:
+            return
+
+        gap = self.containing(start)
+
+        if gap is None or gap[1] < end:
+            raise ValueError(f"Range [{start}, {end}) is not free.")
+
+        (gapStart, gapEnd) = gap
+        self._delete(gapStart)
+
+        if start > gapStart:
+            self._insert(gapStart, start)
+
+        if gapEnd > end:
+            self._insert(end, gapEnd)
+
+    def resize(self, oldsize, newsize):
+        """Updates the map for a change of the element's data size."""
+        if newsize > oldsize:
+            self.free(oldsize, newsize)
+
+        else:
+            self.allocate(newsize, oldsize)
+
+    def _iterFrom(self, start, size):
+        """
+        Yields (start, end) of gaps starting at or after 'start' that are no
+        smaller than 'size', in increasing order.
+        """
+
+        ends = self._ends
+        i = bisect.bisect_left(self._maxes, start)
+
+        for k in range(i, len(self._blocks)):
+            if self._largest[k] < size:
+                continue
+
+            block = self._blocks[k]
+            j = bisect.bisect_left(block, start) if k == i else 0
+
+            for gapStart in block[j:]:
+                if ends[gapStart] - gapStart >= size:
+                    yield (gapStart, ends[gapStart])
+
+    def _start(self, start):
+        """
+        Returns the lowest offset an allocation at or after 'start' may begin
+        at in the gap containing 'start', and the end of that gap, or None.
+        """
+
+        gap = self.containing(start)
+
+        if gap is not None:
+            # Leaving a single byte before the allocation is not allowed.
+            return (start + 1 if start == gap[0] + 1 else start, gap[1])
+
+    def firstFit(self, size, start=0):
+        """
+        Returns the lowest offset >= start at which 'size' bytes can be
+        allocated, or None. In the gap containing 'start', only 'start'
+        itself is tried (or start + 1, to avoid a 1-byte gap before it).
+        """
+
+        gap = self._start(start)
+
+        if gap is not None:
+            if self.fits(size, gap[1] - gap[0]):
+                return gap[0]
+
+            start = gap[1]
+
+        found = None
+        exact = self._bySize.get(size)
+
+        if exact:
+            j = bisect.bisect_left(exact, start)
+
+            if j < len(exact):
+                found = exact[j]
+
+        for (gapStart, _) in self._iterFrom(start, size + 2):
+            if found is None or gapStart < found:
+                found = gapStart
+
+            break
+
+        return found
+
+    def bestFit(self, size, start=0, stop=None):
+        """
+        Returns the start of the smallest gap at or after 'start' (and
+        starting before 'stop', if given) that can hold 'size' bytes (lowest
+        offset first among gaps of equal size), or None. As with firstFit(),
+        the gap containing 'start' is considered from 'start' on.
+        """
+
+        best = None
+        gap = self._start(start)
+
+        if gap is not None:
+            if (self.fits(size, gap[1] - gap[0])
+                    and (stop is None or gap[0] < stop)):
+                best = (gap[1] - gap[0], gap[0])
+
+            start = gap[1]
+
+        sizes = self._sizes
+
+        for k in range(bisect.bisect_left(sizes, size), len(sizes)):
+            space = sizes[k]
+
+            if best is not None and space > best[0]:
+                break
+
+            if not self.fits(size, space):
+                continue
+
+            starts = self._bySize[space]
+            j = bisect.bisect_left(starts, start)
+
+            if j < len(starts) and (stop is None or starts[j] < stop):
+                if best is None or (space, starts[j]) < best:
+                    best = (space, starts[j])
+
+                break
+
+        if best is not None:
+            return best[1]
+
+    def alignedFit(self, size, start=0, align=1, base=0):
+        """
+        Returns the lowest offset >= start at which 'size' bytes can be
+        allocated, such that base + offset is a multiple of 'align', or
+        None.
+        """
+
+        gap = self.containing(start)
+        gaps = self._iterFrom(start if gap is None else gap[1], size)
+
+        if gap is not None:
+            gaps = itertools.chain([gap], gaps)
+
+        for (gapStart, gapEnd) in gaps:
+            offset = max(gapStart, start)
+            offset += -(base + offset) % align
+
+            while offset + size <= gapEnd:
+                if offset != gapStart + 1 and gapEnd - offset - size != 1:
+                    return offset
+
+                offset += align
@@ -0,0 +1,160 @@
+import collections
+import threading
+
+from .util import _willneed
+
+
+class Prefetcher(object):
+    """
+    Iterator over the children of an EBMLMasterElementInFile, read and
+    decoded ahead of the consumer by a worker thread.
+
+    The worker advises the kernel (POSIX_FADV_WILLNEED) of the next
+    'readahead' bytes of children, and queues decoded children until
+    'readahead' bytes of them (as encoded in the file) are waiting to be
+    consumed. Errors raised by the worker are raised again by __next__().
+
+    The worker reads under readLock, so it could wait on a consumer holding
+    a lock on the file (or on a writer waiting on such a consumer). Once
+    the consumer is found to hold one, the worker is stopped without
+    waiting for it, and the remaining children are read inline, after the
+    last one returned, as by iterChildren().
+    """
+
+    def __init__(self, element, readahead):
+        self.element = element
+        self.readahead = readahead
+        self._queue = collections.deque()
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._done = False
+        self._closed = False
+        self._error = None
+        self._inline = False
+        self._last = None
+        self._thread = threading.Thread(
+            target=self._run, name="ebml-prefetch", daemon=True)
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._inline or self._locked():
+            return self._nextInline()
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self._done)
+
+            if self._queue:
+                (child, size) = self._queue.popleft()
+                self._queued -= size
+                self._cond.notify_all()
+                self._last = child
+                return child
+
+            if self._error is not None:
+                (error, self._error) = (self._error, None)
+                raise error
+
+            raise StopIteration
+
+    def _locked(self):
+        return self.element.root._lock.isHeld()
+
+    def _nextInline(self):
+        if not self._inline:
+            self._inline = True
+            self._stop()
+
+        element = self.element
+        last = self._last
+
+        with element.readLock:
+            with element.root._metaLock:
+                offset = element._nextChild(
+                    -1 if last is None else last.offsetInParent)
+
+            if offset is None:
+                raise StopIteration
+
+            self._last = element._getChildElement(offset)
+
+        return self._last
+
+    def _stop(self):
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._queued = 0
+            self._error = None
+            self._cond.notify_all()
+
+    def close(self):
+        """
+        Stops the worker, discarding children not consumed yet. Waits for
+        the worker to finish, unless called with a lock on the file held.
+        """
+
+        self._stop()
+
+        if (self._thread is not threading.current_thread()
+                and not self._locked()):
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def _room(self, size):
+        # A child larger than the whole budget is still queued, by itself.
+        return (self._closed or not self._queue
+                or self._queued + size <= self.readahead)
+
+    def _run(self):
+        element = self.element
+        metaLock = element.root._metaLock
+        advised = 0
+        child = None
+
+        try:
+            while True:
+                with element.readLock:
+                    with metaLock:
+                        offset = element._nextChild(
+                            -1 if child is None else child.offsetInParent)
+
+                        if offset is None:
+                            break
+
+                        (_, _, endOffset) = element._children[offset]
+                        start = element.dataOffsetInFile + offset
+                        end = element.dataOffsetInFile + endOffset
+
+                    if end > advised:
+                        advised = start + max(self.readahead, end - start)
+                        _willneed(element.file, start, advised - start)
+
+                    child = element._getChildElement(offset)
+
+                size = endOffset - offset
+
+                with self._cond:
+                    self._cond.wait_for(lambda: self._room(size))
+
+                    if self._closed:
+                        return
+
+                    self._queue.append((child, size))
+                    self._queued += size
+                    self._cond.notify_all()
+
+        except BaseException as exc:
+            self._error = exc
+
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
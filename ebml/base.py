@@ -11,15 +11,6 @@ import io
 
 from .util import Constant
 
-try:
-    import astor
-except ModuleNotFoundError:
-    """
-    This module is used only for diagnostic purposes.
-    This module can still be used without the astor module.
-    """
-    astor = None
-
 import types
 import sys
 from ebml.exceptions import NoMatch, DecodeError, UnexpectedEndOfData, EncodeError
@@ -30,7 +21,8 @@ __all__ = ["Constant", "EBMLProperty", "EBMLList", "EBMLElement", "EBMLData", "E
 epoch = datetime.datetime(2001, 1, 1)
 
 class EBMLProperty(object):
-    def __init__(self, attrname, cls, optional=False, sethook=None, default=None):
+    def __init__(self, attrname, cls, optional=False, sethook=None, default=None,
+                 encoded=True):
         self.attrname = attrname
         self._attrname = f"_{attrname}"
         self.cls = cls
@@ -38,6 +30,11 @@ class EBMLProperty(object):
         self.default = default
         self._sethook = sethook
 
+        # Set to False for properties that are not part of the encoded data
+        # (e.g., offsetInParent), so that setting them does not invalidate
+        # cached sizes.
+        self.encoded = encoded
+
         if hasattr(cls, "data") and isinstance(cls.data, EBMLProperty):
             self._get = self.getdata
             self._set = self.setdata
@@ -158,9 +155,17 @@ class EBMLProperty(object):
 
         setattr(inst, self._attrname, value)
 
+        if self.encoded:
+            inst._invalidateSize()
+
     def setdata(self, inst, value):
         if value is None and self.optional:
-            return setattr(inst, self._attrname, value)
+            setattr(inst, self._attrname, value)
+
+            if self.encoded:
+                inst._invalidateSize()
+
+            return
 
         if hasattr(inst, "readonly") and inst.readonly:
             raise AttributeError("Cannot change attribute for read-only element.")
@@ -212,6 +217,7 @@ class EBMLList(list):
             cls.append = cls.appendobject
             cls.extend = cls.extendobject
             cls.insert = cls.insertobject
+            cls.pop = cls.popobject
 
     def __init_data__(self, items=[], parent=None):
         self.parent = parent
@@ -224,7 +230,7 @@ class EBMLList(list):
             if not isinstance(item, self.itemclass):
                 raise TypeError(f"Item must be of class {self.itemclass.__name__}, got {item.__class__.__name__} instead.")
 
-            if isinstance(item, EBMLElement):
+            if isinstance(item, EBMLElement) and item.parent is not parent:
                 item.parent = parent
 
         list.__init__(self, items)
@@ -235,7 +241,9 @@ class EBMLList(list):
 
     def _wrapitem(self, data):
         if isinstance(data, self.itemclass):
-            data.parent = self.parent
+            if data.parent is not self.parent:
+                data.parent = self.parent
+
             return data
 
         return self.itemclass(data=data, parent=self.parent)
@@ -252,6 +260,7 @@ class EBMLList(list):
         self._checkReadOnly()
 
         list.extend(self, [self._wrapitem(item) for item in items])
+        self._invalidateSize()
 
     def extendobject(self, items):
         self._checkReadOnly()
@@ -264,12 +273,14 @@ class EBMLList(list):
                 item.parent = self.parent
 
         list.extend(self, items)
+        self._invalidateSize()
 
     def appenddata(self, item):
         self._checkReadOnly()
 
         item = self._wrapitem(item)
         list.append(self, item)
+        self._invalidateSize()
 
     def appendobject(self, item):
         self._checkReadOnly()
@@ -281,11 +292,13 @@ class EBMLList(list):
             item.parent = self.parent
 
         list.append(self, item)
+        self._invalidateSize()
 
     def insertdata(self, index, item):
         self._checkReadOnly()
         item = self._wrapitem(item)
         list.insert(self, index, item)
+        self._invalidateSize()
 
     def insertobject(self, index, item):
         self._checkReadOnly()
@@ -297,6 +310,7 @@ class EBMLList(list):
             item.parent = self.parent
 
         list.insert(self, index, item)
+        self._invalidateSize()
 
     def getdata(self, index):
         item = list.__getitem__(self, index)
@@ -304,14 +318,16 @@ class EBMLList(list):
 
     getobject = list.__getitem__
 
-    def popdata(self, index):
+    def popdata(self, index=-1):
         self._checkReadOnly()
         item = self.popobject(index)
         return item.data
 
-    def popobject(self, index):
+    def popobject(self, index=-1):
         self._checkReadOnly()
-        return list.pop(self, index)
+        item = list.pop(self, index)
+        self._invalidateSize()
+        return item
 
     def setobject(self, index, item):
         self._checkReadOnly()
@@ -326,6 +342,7 @@ class EBMLList(list):
             item.parent = self.parent
 
         list.__setitem__(self, index, item)
+        self._invalidateSize()
 
     def setdata(self, index, item):
         self._checkReadOnly()
@@ -335,15 +352,38 @@ class EBMLList(list):
     def __delitem__(self, key):
         self._checkReadOnly()
         list.__delitem__(self, key)
+        self._invalidateSize()
 
     def remove(self, item):
         self._checkReadOnly()
         list.remove(self, item)
+        self._invalidateSize()
+
+    def clear(self):
+        self._checkReadOnly()
+        list.clear(self)
+        self._invalidateSize()
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __imul__(self, n):
+        self._checkReadOnly()
+        list.__imul__(self, n)
+        self._invalidateSize()
+        return self
 
     def _checkReadOnly(self):
         if self.readonly:
             raise TypeError("List is read-only. Use .copy() method to create an editable copy.")
 
+    def _invalidateSize(self):
+        parent = self.parent
+
+        if isinstance(parent, EBMLElement):
+            parent._invalidateSize()
+
     @property
     def parent(self):
         if isinstance(self._parent, weakref.ref):
@@ -375,6 +415,7 @@ class EBMLElementMetaClass(type):
         if "_childTypes" not in dct:
             dct["_childTypes"] = {}
 
+        cls._generate__slots__(bases, dct)
         newcls = super().__new__(cls, name, bases, dct)
         newcls._prepare()
         return newcls
@@ -469,6 +510,43 @@ class EBMLElementMetaClass(type):
         return fcn
 
     def _generate__init__(cls):
+        # The generated __init__ only depends on the names and optionality of
+        # properties, and on whether ebmlID is a constant, so classes with the
+        # same signature share compiled code.
+        __ebmlproperties__ = cls.__ebmlproperties__
+        signature = (tuple((prop.attrname, prop.optional, isinstance(prop.cls, EBMLElement))
+                           for prop in __ebmlproperties__),
+                     isinstance(cls.__dict__.get("ebmlID"), Constant))
+
+        module_code = ebml.util.compileCached(
+            f"__init__{signature!r}",
+            lambda: ast.Module(body=[cls._make__init__()], type_ignores=[]),
+            'Automatically-generated __init__')
+
+        func_code = [c for c in module_code.co_consts
+            if isinstance(c, types.CodeType)][0]
+
+        defaults = (None,)*sum(1 for prop in __ebmlproperties__ if prop.optional) + (False, None)
+        cls.__init__ = types.FunctionType(func_code, {},
+            argdefs=defaults)
+
+    @property
+    def __init__body__(cls):
+        """Source of the generated __init__ method (requires astor)."""
+        try:
+            # This module is used only for diagnostic purposes.
+            # This module can still be used without the astor module.
+            import astor
+
+        except ModuleNotFoundError:
+            raise AttributeError("__init__body__ requires the astor module.")
+
+        if cls.__init__.__code__.co_filename != 'Automatically-generated __init__':
+            raise AttributeError(f"{cls.__name__}.__init__ is not automatically generated.")
+
+        return astor.to_source(cls._make__init__())
+
+    def _make__init__(cls):
         optional = []
         defaults = []
         required = []
@@ -534,19 +612,47 @@ class EBMLElementMetaClass(type):
 
         optional.extend(["readonly", "parent"])
         defaults.extend([False, None])
-        __init__ = cls._makeFcnDef("__init__", required+optional, defaults, __init__body)
+        return cls._makeFcnDef("__init__", required+optional, defaults, __init__body)
 
-        mod = ast.Module(body=[__init__], type_ignores=[])
-        module_code = compile(mod, 'Automatically-generated __init__', 'exec')
+    @staticmethod
+    def _declaredProperties(dct):
+        return dct.get("__ebmlproperties__", ())
 
-        func_code = [c for c in module_code.co_consts
-            if isinstance(c, types.CodeType)][0]
+    @staticmethod
+    def _wantsSlots(bases, dct):
+        # Instances keep a __dict__, so that arbitrary attributes can be set on
+        # them, unless the class (or a base) sets __compact__ = True.
+        if "__compact__" in dct:
+            return bool(dct["__compact__"])
 
-        cls.__init__ = types.FunctionType(func_code, {},
-            argdefs=tuple(defaults))
+        return any(getattr(base, "__compact__", False) for base in bases)
 
-        if astor is not None:
-            cls.__init__body__ = astor.to_source(__init__)
+    @classmethod
+    def _generate__slots__(mcs, bases, dct):
+        """
+        Adds storage for properties declared in the class body to __slots__.
+        __slots__ is generated only for classes that either declare __slots__
+        themselves, or opt in with __compact__ = True (directly or through a
+        base), so that their instances do not carry a __dict__.
+        """
+        if "__slots__" in dct:
+            slots = dct["__slots__"]
+            slots = (slots,) if isinstance(slots, str) else tuple(slots)
+
+        elif mcs._wantsSlots(bases, dct):
+            slots = ()
+
+        else:
+            return
+
+        for prop in mcs._declaredProperties(dct):
+            if (prop._attrname in slots or prop._attrname in dct
+                    or any(hasattr(base, prop._attrname) for base in bases)):
+                continue
+
+            slots += (prop._attrname,)
+
+        dct["__slots__"] = slots
 
     def _prepare(cls):
         if "ebmlID" in cls.__dict__ and isinstance(cls.ebmlID, bytes):
@@ -555,19 +661,37 @@ class EBMLElementMetaClass(type):
         __ebmlproperties__ = cls.__ebmlproperties__
 
         for prop in __ebmlproperties__:
+            if not cls.__dictoffset__ and not hasattr(cls, prop._attrname):
+                raise TypeError(f"{cls.__name__} has no storage for property '{prop.attrname}'. "
+                                f"Add '{prop._attrname}' to {cls.__name__}.__slots__.")
+
             setattr(cls, prop.attrname, prop)
 
         if "__init__" not in cls.__dict__:
             cls._generate__init__()
 
 class EBMLElement(object, metaclass=EBMLElementMetaClass):
+    # _undecoded maps attribute names (e.g., "_data") to payloads that have
+    # not yet been decoded. Only populated on instances created with
+    # lazy=True.
+    #
+    # _cachedSize is the size of contents, as last computed by _size(). Reset
+    # to None (on this element and all of its ancestors) by _invalidateSize().
+    __slots__ = ("_parent", "_readonly", "_ebmlID", "_cachedSize", "_undecoded", "__weakref__")
     _parentEbmlID = None
     __ebmlproperties__ = (
-            EBMLProperty("offsetInParent", int, optional=True),
-            EBMLProperty("dataOffsetInParent", int, optional=True),
-            EBMLProperty("dataSize", int, optional=True)
+            EBMLProperty("offsetInParent", int, optional=True, encoded=False),
+            EBMLProperty("dataOffsetInParent", int, optional=True, encoded=False),
+            EBMLProperty("dataSize", int, optional=True, encoded=False)
         )
 
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls)
+        self._readonly = False
+        self._cachedSize = None
+        self._undecoded = None
+        return self
+
     def __init__(self, data, ebmlID=None, readonly=False, parent=None):
         if ebmlID is not None:
             self.ebmlID = ebmlID
@@ -576,6 +700,24 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
         self._init(data)
         self.readonly = readonly
 
+    def __getattr__(self, attrname):
+        # Only called when normal attribute lookup fails, so decoded
+        # elements pay nothing for this.
+        undecoded = self._undecoded
+
+        if undecoded and attrname in undecoded:
+            return self._materialize(attrname)
+
+        raise AttributeError(
+            f"'{type(self).__name__}' object has no attribute '{attrname}'")
+
+    def _materialize(self, attrname):
+        """
+        Decodes undecoded payload stored for 'attrname', stores and returns
+        result. To be implemented in subclasses that support lazy decoding.
+        """
+        raise NotImplementedError()
+
     @property
     def body(self):
         if self.parent is not None:
@@ -605,6 +747,12 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
     @property
     def ebmlID(self):
+        if isinstance(self, type):
+            # Accessed on a class that does not set ebmlID (see
+            # EBMLElementMetaClass.__getattribute__), where _ebmlID is
+            # a slot descriptor.
+            return None
+
         try:
             return self._ebmlID
 
@@ -628,6 +776,7 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
             if value[0] & (1 << (8 - k)) and (value[0] != 2**(8 - k) - 1 or value[1:] != b"\xff"*(k - 1)):
                 self._ebmlID = value
+                self._invalidateSize()
                 return
             else:
                 raise ValueError(f"Not a valid EBML ID: {repr(value)}.")
@@ -637,6 +786,7 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
             if isinstance(ebmlID, bytes):
                 self._ebmlID = ebmlID
+                self._invalidateSize()
                 return
             else:
                 raise ValueError(f"Integer value too big.")
@@ -697,14 +847,38 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
     def size(self):
         """Returns total size (in bytes) of element, including header and size element"""
-        contentsize = self._size()
+        contentsize = self._contentSize()
+        return len(self.ebmlID) + len(ebml.util.toVint(contentsize)) + contentsize
 
-        if not isinstance(contentsize, int):
-            raise TypeError(
-                f"Invalid return value for {self.__class__.__name__}._size(). "
-                f"Got '{type(contentsize).__name__}' instead.")
+    def _contentSize(self):
+        """
+        Returns size of contents, calling _size() only if it is not already
+        cached.
+        """
+        contentsize = self._cachedSize
 
-        return len(self.ebmlID) + len(ebml.util.toVint(contentsize)) + contentsize
+        if contentsize is None:
+            contentsize = self._size()
+
+            if not isinstance(contentsize, int):
+                raise TypeError(
+                    f"Invalid return value for {self.__class__.__name__}._size(). "
+                    f"Got '{type(contentsize).__name__}' instead.")
+
+            self._cachedSize = contentsize
+
+        return contentsize
+
+    def _invalidateSize(self):
+        """
+        Discards cached size of this element and all of its ancestors. Must be
+        called whenever something that affects the output of _size() changes.
+        """
+        element = self
+
+        while isinstance(element, EBMLElement):
+            element._cachedSize = None
+            element = getattr(element, "parent", None)
 
     def _size(self):
         """To be implemented in subclasses"""
@@ -712,37 +886,111 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
     def toFile(self, file):
         """
-        Writes EBML data to file.
+        Writes EBML data to file. Master elements are streamed child by child,
+        so the encoded element is never held in memory as a whole.
         """
-        contentsize = self._size()
-        file.write(self.ebmlID)
-        file.write(ebml.util.toVint(contentsize))
-        self._toFile(file)
+        writer = ebml.util.VectorWriter(file)
+        self._writeElement(writer)
+        writer.flush()
 
     def _toFile(self, file):
         """Override if desired."""
-        file.write(self._toBytes())
+        writer = ebml.util.VectorWriter(file)
+        self._writeContents(writer)
+        writer.flush()
+
+    def _writeElement(self, writer):
+        contentsize = self._contentSize()
+        head = self.ebmlID + ebml.util.toVint(contentsize)
+
+        if self.offsetInParent is not None and not self.readonly:
+            self.dataOffsetInParent = self.offsetInParent + len(head)
+
+        writer.write(head)
+        self._writeContents(writer)
+
+    def _writeContents(self, writer):
+        """
+        Passes contents to 'writer' (an ebml.util.VectorWriter) as one or more
+        buffers. Override to avoid building the encoded contents in memory.
+        """
+        cls = type(self)
+
+        if cls._toFile is not EBMLElement._toFile:
+            writer.flush()
+            self._toFile(writer.file)
+            return
+
+        contentsize = self._contentSize()
+
+        if cls._encodeInto is not EBMLElement._encodeInto:
+            data = bytearray(contentsize)
+            self._encodeInto(memoryview(data), 0)
+
+        else:
+            data = self._toBytes()
+
+            if len(data) != contentsize:
+                raise EncodeError(f"{self}: Length of data ({len(data)}) does not match advertised length ({contentsize}).")
+
+        writer.write(data)
 
     def toBytes(self):
         """
         Returns the EBML data as a byte string.
         """
-        contentsize = self._size()
-        data = self._toBytes()
+        data = bytearray(self.size())
+        self._encodeElementInto(memoryview(data), 0)
+        return bytes(data)
 
-        if len(data) != contentsize:
-            raise EncodeError(f"{self}: Length of data ({len(data)}) does not match advertised length ({contentsize}).")
+    def _toBytes(self, file):
+        """To be implemented in subclasses"""
+        raise NotImplementedError()
 
+    def encodeInto(self, buffer, offset=0):
+        """
+        Writes the EBML data into a writable buffer (bytearray, memoryview,
+        mmap, ...) starting at 'offset'. Returns the offset immediately
+        following the element.
+        """
+        buffer = ebml.util.asBuffer(buffer)
+        size = self.size()
+
+        if offset < 0 or offset + size > len(buffer):
+            raise EncodeError(f"{self}: Buffer too small to encode element of size {size} at offset {offset}.")
+
+        return self._encodeElementInto(buffer, offset)
+
+    def _encodeElementInto(self, buffer, offset):
+        contentsize = self._contentSize()
         head = self.ebmlID + ebml.util.toVint(contentsize)
+        dataoffset = offset + len(head)
+        buffer[offset:dataoffset] = head
 
         if self.offsetInParent is not None and not self.readonly:
             self.dataOffsetInParent = self.offsetInParent + len(head)
 
-        return head + data
+        end = self._encodeInto(buffer, dataoffset)
 
-    def _toBytes(self, file):
-        """To be implemented in subclasses"""
-        raise NotImplementedError()
+        if end - dataoffset != contentsize:
+            raise EncodeError(f"{self}: Length of data ({end - dataoffset}) does not match advertised length ({contentsize}).")
+
+        return end
+
+    def _encodeInto(self, buffer, offset):
+        """
+        Writes contents into 'buffer' (a memoryview) at 'offset' and returns
+        the offset immediately following. Defaults to copying the result of
+        _toBytes(). Override to write directly into the buffer.
+        """
+        data = self._toBytes()
+        contentsize = self._contentSize()
+
+        if len(data) != contentsize:
+            raise EncodeError(f"{self}: Length of data ({len(data)}) does not match advertised length ({contentsize}).")
+
+        buffer[offset:offset + contentsize] = data
+        return offset + contentsize
 
     @classmethod
     def _readHead(cls, file):
@@ -767,15 +1015,24 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
                 cls, offset, *sys.exc_info())
 
     @classmethod
-    def fromFile(cls, file, parent=None):
+    def fromFile(cls, file, parent=None, lazy=False):
         """
         Creates an instance using data from file.
+
+        If 'lazy' is True, decoding of child elements and data is deferred
+        until they are first accessed.
         """
         (offset, ebmlID, size) = cls._readHead(file)
 
         try:
             size = ebml.util.fromVint(size)
 
+            if lazy:
+                if cls.ebmlID is not None:
+                    return cls._fromFileLazy(file, size, parent=parent)
+
+                return cls._fromFileLazy(file, size, ebmlID=ebmlID, parent=parent)
+
             if cls.ebmlID is not None:
                 return cls._fromFile(file, size, parent=parent)
 
@@ -802,6 +1059,23 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
 
         return cls._fromBytes(data, parent=parent)
 
+    @classmethod
+    def _fromFileLazy(cls, file, size, ebmlID=None, parent=None):
+        if cls._fromFile.__func__ is not EBMLElement._fromFile.__func__:
+            # _fromFile is overridden, so reading the payload ourselves
+            # may not be appropriate.
+            if ebmlID is not None:
+                return cls._fromFile(file, size, ebmlID=ebmlID, parent=parent)
+
+            return cls._fromFile(file, size, parent=parent)
+
+        data = file.read(size)
+
+        if len(data) < size:
+            raise UnexpectedEndOfData
+
+        return cls._fromBytesLazy(data, ebmlID=ebmlID, parent=parent)
+
     @classmethod
     def sniff(cls, file):
         """
@@ -838,20 +1112,36 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
         return (ebmlID, len(sizevint), ebml.util.fromVint(sizevint))
 
     @classmethod
-    def fromBytes(cls, data, parent=None):
+    def fromBytes(cls, data, parent=None, lazy=False):
+        """
+        Creates an instance from bytes (or any object supporting the buffer
+        protocol).
+
+        If 'lazy' is True, decoding of child elements and data is deferred
+        until they are first accessed.
+        """
         try:
-            ebmlID, data = ebml.util.parseVint(data)
-            size, data = ebml.util.parseVint(data)
+            data = ebml.util.asBuffer(data)
+            (offset, ebmlID, sizesize, start, end) = next(
+                ebml.util.parseElements(data, offsets=True))
 
             if cls.ebmlID is not None and cls.ebmlID != ebmlID:
                 h = "".join([f"[{x:02x}]" for x in cls.ebmlID])
                 g = "".join([f"[{x:02x}]" for x in ebmlID])
                 raise NoMatch(f"Expected EBML ID {h}, got {g} instead.")
 
-            if len(data) != ebml.util.fromVint(size):
+            if end != len(data):
                 raise DecodeError(
-                    f"Data length ({len(data)}) does not match encoded size "
-                    f"({ebml.util.fromVint(size)}).")
+                    f"Data length ({len(data) - start}) does not match encoded size "
+                    f"({end - start}).")
+
+            data = data[start:end]
+
+            if lazy:
+                if cls.ebmlID is None:
+                    return cls._fromBytesLazy(data, ebmlID=ebmlID, parent=parent)
+
+                return cls._fromBytesLazy(data, parent=parent)
 
             if cls.ebmlID is None:
                 return cls._fromBytes(data, ebmlID=ebmlID, parent=parent)
@@ -867,6 +1157,17 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
         raise NotImplementedError(
             f"Please implement {cls.__module__}.{cls.__name__}._fromBytes")
 
+    @classmethod
+    def _fromBytesLazy(cls, data, ebmlID=None, parent=None):
+        """
+        Override to defer decoding of 'data' until first accessed.
+        Decodes immediately by default.
+        """
+        if ebmlID is not None:
+            return cls._fromBytes(data, ebmlID=ebmlID, parent=parent)
+
+        return cls._fromBytes(data, parent=parent)
+
     def __repr__(self):
         params = []
 
@@ -911,6 +1212,7 @@ class EBMLElement(object, metaclass=EBMLElementMetaClass):
         return f"{self.__class__.__name__}(ebmlID=[{ebml.util.formatBytes(self.ebmlID)}])"
 
 class EBMLData(EBMLElement):
+    __slots__ = ()
     __ebmlproperties__ = (EBMLProperty("data", bytes),)
 
     def _size(self):
@@ -921,7 +1223,7 @@ class EBMLData(EBMLElement):
 
     @staticmethod
     def _decodeData(data):
-        return data
+        return bytes(data)
 
     @classmethod
     def _fromBytes(cls, data, ebmlID=None, parent=None):
@@ -931,6 +1233,83 @@ class EBMLData(EBMLElement):
 
         return cls(cls._decodeData(data), parent=parent)
 
+    @classmethod
+    def _fromBytesLazy(cls, data, ebmlID=None, parent=None):
+        if (cls._fromBytes.__func__ is not EBMLData._fromBytes.__func__
+                or len(cls.__ebmlproperties__) != 1):
+            return super()._fromBytesLazy(data, ebmlID=ebmlID, parent=parent)
+
+        self = cls.__new__(cls)
+
+        if ebmlID is not None:
+            self.ebmlID = ebmlID
+
+        self.parent = parent
+        (prop,) = cls.__ebmlproperties__
+        self._undecoded = {prop._attrname: (prop, data)}
+        return self
+
+    @classmethod
+    def _fromView(cls, data, ebmlID=None, parent=None):
+        """
+        Like _fromBytes, but keeps the memoryview 'data' as the data of the
+        new instance instead of copying it, where the class does not decode
+        its payload.
+        """
+        if (cls._fromBytes.__func__ is not EBMLData._fromBytes.__func__
+                or cls._decodeData is not EBMLData._decodeData
+                or len(cls.__ebmlproperties__) != 1):
+            return cls._fromBytes(data, ebmlID=ebmlID, parent=parent)
+
+        self = cls.__new__(cls)
+
+        if ebmlID is not None:
+            self.ebmlID = ebmlID
+
+        self.parent = parent
+        (prop,) = cls.__ebmlproperties__
+        setattr(self, prop._attrname, data)
+        return self
+
+    def _detachView(self):
+        """
+        Replaces a payload kept as a memoryview (see _fromView) with a copy,
+        before the memory it refers to changes or goes away.
+        """
+
+        undecoded = getattr(self, "_undecoded", None)
+
+        for prop in type(self).__ebmlproperties__:
+            if undecoded and prop._attrname in undecoded:
+                (prop, data) = undecoded[prop._attrname]
+
+                if isinstance(data, memoryview):
+                    undecoded[prop._attrname] = (prop, bytes(data))
+
+                continue
+
+            data = getattr(self, prop._attrname, None)
+
+            if isinstance(data, memoryview):
+                setattr(self, prop._attrname, bytes(data))
+
+    def _materialize(self, attrname):
+        (prop, data) = self._undecoded.pop(attrname)
+
+        if not self._undecoded:
+            self._undecoded = None
+
+        ro = self.readonly
+        self._readonly = False
+
+        try:
+            prop.__set__(self, self._decodeData(data))
+
+        finally:
+            self._readonly = ro
+
+        return getattr(self, attrname)
+
     @classmethod
     def _sniff(cls, file, size):
         data = file.read(size)
@@ -949,6 +1328,7 @@ class EBMLData(EBMLElement):
         return float(self.data)
 
 class EBMLString(EBMLData):
+    __slots__ = ()
     __ebmlproperties__ = (EBMLProperty("data", str),)
     encoding = "utf8"
 
@@ -960,10 +1340,11 @@ class EBMLString(EBMLData):
 
     @classmethod
     def _decodeData(cls, data):
-        return data.decode(cls.encoding)
+        return str(data, cls.encoding)
 
 
 class EBMLDateTime(EBMLData):
+    __slots__ = ()
     data = EBMLProperty("data", datetime.datetime)
     __ebmlproperties__ = (data,)
     
@@ -1000,6 +1381,7 @@ class EBMLDateTime(EBMLData):
 
 
 class Void(EBMLData):
+    __slots__ = ()
     ebmlID = Constant(b"\xec")
     __ebmlproperties__ = (EBMLProperty("voidsize", int),)
 
@@ -1035,6 +1417,7 @@ class Void(EBMLData):
         return cls(size, parent=parent)
 
 class EBMLInteger(EBMLData):
+    __slots__ = ()
     data = EBMLProperty("data", int)
     signed = False
     __ebmlproperties__ = (data,)
@@ -1073,6 +1456,7 @@ class EBMLInteger(EBMLData):
 
 
 class EBMLFloat(EBMLData):
+    __slots__ = ()
     __ebmlproperties__ = (EBMLProperty("data", float),)
 
     def _toBytes(self):
@@ -1119,7 +1503,38 @@ def _addChildType(prop, cls, childTypes, __ebmlpropertiesbyid__):
     else:
         raise TypeError("Expected EBMLElement subclass, EBMLList subclass, or list/tuple thereof. Got {cls} instead.")
 
+def _typeName(cls):
+    if isinstance(cls, type) and issubclass(cls, EBMLList):
+        cls = cls.itemclass
+
+    if isinstance(cls, tuple):
+        return "|".join(subcls.__name__ for subcls in cls)
+
+    return cls.__name__
+
+def _raiseMissing(element, missing):
+    """Raises DecodeError listing required child properties in 'missing'."""
+    l = [_typeName(prop.cls) for prop in missing]
+
+    if len(missing) == 1:
+        raise DecodeError(f"Error decoding {element.__class__.__name__} element: Missing required element: {l[0]}.")
+    elif len(missing) == 2:
+        raise DecodeError(f"Error decoding {element.__class__.__name__} element: Missing required elements: {l[0]} and {l[1]}.")
+    elif len(missing) > 2:
+        raise DecodeError(f"Error decoding {element.__class__.__name__} element: Missing required elements: {', '.join(l[:-1])}, and {l[-1]}.")
+
 class EBMLMasterElementMetaClass(EBMLElementMetaClass):
+    @staticmethod
+    def _declaredProperties(dct):
+        return tuple(dct.get("__ebmlchildren__", ())) + tuple(dct.get("__ebmladdproperties__", ()))
+
+    @staticmethod
+    def _wantsSlots(bases, dct):
+        # Children are often assigned after the class is created (e.g., to
+        # allow for recursive definitions), and can then only be stored in a
+        # __dict__.
+        return "__ebmlchildren__" in dct and EBMLElementMetaClass._wantsSlots(bases, dct)
+
     def _prepare(cls):
         __ebmladdproperties__ = cls.__ebmladdproperties__
         __ebmlchildren__ = cls.__ebmlchildren__
@@ -1145,8 +1560,160 @@ class EBMLMasterElementMetaClass(EBMLElementMetaClass):
             cls._childTypes = childTypes
 
         super()._prepare()
+        cls._generate_decodeData()
+
+    def _generate_decodeData(cls):
+        """
+        Generates a _decodeData method specialized for the children of this
+        class. Child classes and properties are bound when the method is
+        generated, so that EBML ID dispatch, list accumulation and checks for
+        required children are compiled in rather than looked up per child.
+
+        Classes that provide their own _decodeData or _getChildCls are left
+        alone.
+        """
+        base = globals().get("EBMLMasterElement")
+
+        if base is None:
+            # EBMLMasterElement itself is being created.
+            return
+
+        generic = base.__dict__["_decodeData"]
+        current = cls._decodeData
+
+        if current is not generic and not getattr(current, "__generated__", False):
+            return
+
+        if cls._getChildCls.__func__ is not base._getChildCls.__func__:
+            # Child classes are chosen at decode time.
+            if current is not generic:
+                cls._decodeData = generic
+
+            return
+
+        namespace = {"parseElements": ebml.util.parseElements, "formatBytes": ebml.util.formatBytes,
+                     "DecodeError": DecodeError, "EBMLData": EBMLData, "weakref": weakref,
+                     "_raiseMissing": _raiseMissing, "_generic": generic, "_cls": cls}
+
+        __ebmlpropertiesbyid__ = cls.__ebmlpropertiesbyid__
+        default = __ebmlpropertiesbyid__.get(0)
+        variables = {}
+
+        for k, prop in enumerate(cls.__ebmlchildren__):
+            variables[prop] = f"v{k}"
+            namespace[f"prop{k}"] = prop
+
+        def islist(prop):
+            return isinstance(prop.cls, type) and issubclass(prop.cls, EBMLList)
+
+        def construct(j, childcls, indent):
+            # Children that would only go through EBMLData._fromBytes and the
+            # generated __init__ are constructed in place. The value is
+            # still type-checked, falling back to _fromBytes if needed.
+            props = childcls.__ebmlproperties__
+
+            if not (issubclass(childcls, EBMLData)
+                    and childcls._fromBytes.__func__ is EBMLData._fromBytes.__func__
+                    and childcls.__init__.__code__.co_filename == "Automatically-generated __init__"
+                    and childcls._parentEbmlID is None
+                    and len(props) == 1 and props[0]._sethook is None
+                    and isinstance(props[0].cls, type)
+                    and not issubclass(props[0].cls, (EBMLElement, EBMLList))):
+                return [f"{indent}child = cls{j}._fromBytes(data, parent=self)"]
+
+            namespace[f"type{j}"] = props[0].cls
+            return [f"{indent}value = cls{j}._decodeData(data)",
+                    f"{indent}if isinstance(value, type{j}):",
+                    f"{indent}    child = cls{j}.__new__(cls{j})",
+                    f"{indent}    child.{props[0]._attrname} = value",
+                    f"{indent}    child._parent = selfref",
+                    f"{indent}else:",
+                    f"{indent}    child = cls{j}._fromBytes(data, parent=self)"]
+
+        def accumulate(prop, childcls, indent):
+            if prop is None:
+                if issubclass(childcls, (Void, CRC32)):
+                    return []
+
+                return [f"{indent}raise TypeError({repr(f'Unexpected child type {repr(childcls.__name__)} for EBML Element {repr(cls.__name__)}.')})"]
+
+            v = variables[prop]
+
+            if islist(prop):
+                return [f"{indent}{v}.append(child)"]
+
+            return [f"{indent}if {v} is not None:",
+                    f"{indent}    raise TypeError({repr(f'Too many child elements of type {repr(_typeName(prop.cls))} provided.')})",
+                    f"{indent}{v} = child"]
+
+        lines = ["def _decodeData(self, data):",
+                 "    if type(self) is not _cls:",
+                 "        # Subclass calling super()._decodeData().",
+                 "        return _generic(self, data)",
+                 "",
+                 "    children = []",
+                 "    selfref = weakref.ref(self)"]
+
+        for prop, v in variables.items():
+            lines.append(f"    {v} = {'[]' if islist(prop) else 'None'}")
+
+        lines.extend(["",
+                      "    for (offset, ebmlID, sizesize, data) in parseElements(data):"])
+        keyword = "if"
+
+        for j, (ebmlID, childcls) in enumerate(cls._childTypes.items()):
+            if not isinstance(ebmlID, bytes):
+                continue
+
+            namespace[f"cls{j}"] = childcls
+            lines.append(f"        {keyword} ebmlID == {repr(ebmlID)}:")
+            lines.extend(construct(j, childcls, " "*12))
+            lines.extend(accumulate(__ebmlpropertiesbyid__.get(ebmlID, default), childcls, " "*12))
+            keyword = "elif"
+
+        lines.append("        else:")
+
+        if cls.allowunknown:
+            lines.append("            child = EBMLData._fromBytes(data, parent=self)")
+            lines.extend(accumulate(default, EBMLData, " "*12))
+
+        else:
+            lines.append(f"            raise DecodeError(f\"Unrecognized EBML ID {{formatBytes(ebmlID)}} "
+                         f"while attempting to decode {cls.__name__} Element.\")")
+
+        lines.extend(["",
+                      "        child._offsetInParent = offset",
+                      "        child._dataOffsetInParent = offset + len(ebmlID) + sizesize",
+                      "        child._dataSize = len(data)",
+                      "        children.append(child)",
+                      "",
+                      "    missing = []"])
+
+        for prop, v in variables.items():
+            if not prop.optional:
+                lines.append(f"    if {'not ' + v if islist(prop) else v + ' is None'}:")
+                lines.append(f"        missing.append(prop{v[1:]})")
+
+        lines.extend(["    if missing:",
+                      "        _raiseMissing(self, missing)",
+                      ""])
+
+        for prop, v in variables.items():
+            lines.append(f"    prop{v[1:]}.__set__(self, {v + ' or None' if islist(prop) else v})")
+
+        lines.append("    self.children = children")
+        source = "\n".join(lines) + "\n"
+
+        code = ebml.util.compileCached(source, lambda: source, f"Automatically-generated {cls.__name__}._decodeData")
+        exec(code, namespace)
+        _decodeData = namespace["_decodeData"]
+        _decodeData.__qualname__ = f"{cls.__qualname__}._decodeData"
+        _decodeData.__generated__ = True
+        cls._decodeData = _decodeData
+        cls.__decodeData__body__ = source
 
 class EBMLMasterElement(EBMLElement, metaclass=EBMLMasterElementMetaClass):
+    __slots__ = ("_children", "_undecodedView", "_decodedChildren")
     __ebmlchildren__ = ()
     __ebmladdproperties__ = ()
     allowunknown = False
@@ -1179,7 +1746,14 @@ class EBMLMasterElement(EBMLElement, metaclass=EBMLMasterElementMetaClass):
             raise AttributeError("Cannot change read-only status of read-only element. Use .copy() method.")
         self._readonly = bool(value)
 
-        if self.children is not None:
+        if self._undecoded:
+            # Children that have yet to be decoded will inherit read-only
+            # status when they are.
+            for child in self._decodedChildren.values():
+                if not child.readonly:
+                    child.readonly = value
+
+        elif self.children is not None:
             for child in list.__iter__(self.children):
                 child.readonly = value
 
@@ -1188,15 +1762,42 @@ class EBMLMasterElement(EBMLElement, metaclass=EBMLMasterElementMetaClass):
         return sum(childrensizes)
 
     def _toBytes(self):
-        data = b""
+        data = bytearray(self._contentSize())
+        self._encodeInto(memoryview(data), 0)
+        return bytes(data)
+
+    def _encodeInto(self, buffer, offset):
+        if type(self)._toBytes is not EBMLMasterElement._toBytes:
+            return super()._encodeInto(buffer, offset)
+
+        start = offset
+        readonly = self.readonly
 
         for child in self.iterchildren():
-            if not self.readonly and not child.readonly:
-                child.offsetInParent = len(data)
+            if not readonly and not child.readonly:
+                child.offsetInParent = offset - start
+
+            offset = child._encodeElementInto(buffer, offset)
 
-            data += child.toBytes()
+        return offset
+
+    def _writeContents(self, writer):
+        cls = type(self)
 
-        return data
+        if (cls._toBytes is not EBMLMasterElement._toBytes
+                or cls._encodeInto is not EBMLMasterElement._encodeInto
+                or cls._toFile is not EBMLElement._toFile):
+            return super()._writeContents(writer)
+
+        offset = 0
+        readonly = self.readonly
+
+        for child in self.iterchildren():
+            if not readonly and not child.readonly:
+                child.offsetInParent = offset
+
+            child._writeElement(writer)
+            offset += child.size()
 
     def _decodeData(self, data):
         children = []
@@ -1246,25 +1847,135 @@ class EBMLMasterElement(EBMLElement, metaclass=EBMLMasterElementMetaClass):
                 else:
                     prop.__set__(self, None)
 
-        l = [prop.cls.itemclass.__name__ if issubclass(prop.cls, EBMLList) else prop.cls.__name__ for prop in missing]
-
-        if len(missing) == 1:
-            raise DecodeError(f"Error decoding {self.__class__.__name__} element: Missing required element: {l[0]}.")
-        elif len(missing) == 2:
-            raise DecodeError(f"Error decoding {self.__class__.__name__} element: Missing required elements: {l[0]} and {l[1]}.")
-        elif len(missing) > 2:
-            raise DecodeError(f"Error decoding {self.__class__.__name__} element: Missing required elements: {', '.join(l[:-1])}, and {l[-1]}.")
+        _raiseMissing(self, missing)
 
         self.children = children
 
         if type(self).ebmlID is None:
             self.ebmlID = ebmlID
 
+    def _indexData(self, data):
+        """
+        Lazy counterpart to _decodeData. Only element headers are read and
+        validated, and the location of each child is recorded by property.
+        """
+        data = ebml.util.asBuffer(data)
+        children = []
+        undecoded = {}
+        default = self.__ebmlpropertiesbyid__.get(0)
+
+        for entry in ebml.util.parseElements(data, offsets=True):
+            (offset, ebmlID, sizesize, start, end) = entry
+            childcls = self._getChildCls(ebmlID)
+
+            if childcls is None:
+                raise DecodeError(f"Unrecognized EBML ID {ebml.util.formatBytes(ebmlID)} while attempting to decode {self.__class__.__name__} Element.")
+
+            children.append(entry)
+            prop = self.__ebmlpropertiesbyid__.get(ebmlID, default)
+
+            if prop is not None:
+                if prop._attrname not in undecoded:
+                    undecoded[prop._attrname] = (prop, [entry])
+
+                elif isinstance(prop.cls, type) and issubclass(prop.cls, EBMLList):
+                    undecoded[prop._attrname][1].append(entry)
+
+                else:
+                    raise TypeError(f"Too many child elements of type '{prop.cls.__name__}' provided.")
+
+            elif not issubclass(childcls, (Void, CRC32)):
+                raise TypeError(f"Unexpected child type '{childcls.__name__}' for EBML Element '{self.__class__.__name__}'.")
+
+        missing = []
+
+        for prop in self.__ebmlchildren__:
+            if prop._attrname not in undecoded:
+                if not prop.optional:
+                    missing.append(prop)
+                else:
+                    prop.__set__(self, None)
+
+        _raiseMissing(self, missing)
+
+        childrenprop = type(self).children
+        undecoded[childrenprop._attrname] = (childrenprop, children)
+
+        self._undecodedView = data
+        self._decodedChildren = {}
+        self._undecoded = undecoded
+
+    def _decodeChild(self, entry):
+        (offset, ebmlID, sizesize, start, end) = entry
+        child = self._decodedChildren.get(offset)
+
+        if child is None:
+            childcls = self._getChildCls(ebmlID)
+            child = childcls._fromBytesLazy(self._undecodedView[start:end],
+                                            parent=self)
+            child.offsetInParent = offset
+            child.dataOffsetInParent = start
+            child.dataSize = end - start
+            self._decodedChildren[offset] = child
+
+        return child
+
+    def _materialize(self, attrname):
+        (prop, entries) = self._undecoded.pop(attrname)
+        children = [self._decodeChild(entry) for entry in entries]
+
+        if isinstance(prop.cls, type) and issubclass(prop.cls, EBMLList):
+            value = prop.cls(children, parent=self)
+
+        else:
+            (value,) = children
+
+        setattr(self, attrname, value)
+
+        if self.readonly:
+            for child in children:
+                if not child.readonly:
+                    child.readonly = True
+
+        if prop is type(self).children:
+            # Every child has now been decoded, so the remaining properties
+            # are cheap to fill in.
+            for attrname in list(self._undecoded):
+                self._materialize(attrname)
+
+        if not self._undecoded:
+            # Everything has been decoded. Release the data.
+            self._undecoded = None
+            self._undecodedView = None
+            self._decodedChildren = None
+
+        return value
+
     @classmethod
     def _fromBytes(cls, data, ebmlID=None, parent=None):
         self = cls.__new__(cls)
         self.parent = parent
         self._decodeData(data)
+
+        if ebmlID is not None and type(self).ebmlID is None:
+            self.ebmlID = ebmlID
+
+        return self
+
+    @classmethod
+    def _fromBytesLazy(cls, data, ebmlID=None, parent=None):
+        if (cls._fromBytes.__func__ is not EBMLMasterElement._fromBytes.__func__
+                or (cls._decodeData is not EBMLMasterElement._decodeData
+                    and not getattr(cls._decodeData, "__generated__", False))):
+            return super()._fromBytesLazy(data, ebmlID=ebmlID, parent=parent)
+
+        self = cls.__new__(cls)
+        self.parent = parent
+        self._indexData(data)
+
+        if ebmlID is not None and type(self).ebmlID is None:
+            self.ebmlID = ebmlID
+
         return self
 
     def copy(self, parent=None):
@@ -0,0 +1,309 @@
+"""
+Planned, incremental compaction of master elements in a file.
+
+A Compactor first compacts the master children of an element (depth first),
+then plans the compaction of the element itself from a snapshot of its
+children:
+
+1. Children no larger than 'maxsize' are moved, smallest first, into the
+   smallest earlier gap that can take them, but only when this allows at
+   least as many bytes to be reclaimed as are copied.
+2. The element is shrunk to the end of its last child.
+3. The whole file blocks spanned by each remaining gap are removed with
+   collapseRange(), from the last gap to the first, so that the offsets of
+   the remaining steps stay valid.
+
+Steps are carried out one at a time by Compactor.step(), each under the
+lock of the element (of the root element, for collapse steps), so that other
+threads can read and write in between.
+A step that no longer applies to the children as they are when it runs
+(because of edits made in the meantime) is skipped. Compactor.run() carries
+out the steps, sleeping in between to keep the bytes copied under 'rate'
+bytes per second.
+"""
+
+import bisect
+import heapq
+import time
+
+from ._freemap import FreeSpaceMap
+from .exceptions import WriteError, ResizeError
+
+__all__ = ["Compactor"]
+
+
+class _Throttle(object):
+    """Keeps track of bytes copied, limiting them to 'rate' per second."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.copied = 0
+        self._start = time.monotonic()
+
+    def delay(self):
+        """Returns the time to wait before copying any more."""
+        if not self.rate:
+            return 0
+
+        return max(0, self.copied/self.rate
+                   - (time.monotonic() - self._start))
+
+
+class Compactor(object):
+    """
+    Compactor(element, maxsize=4*1024**2, rate=None)
+
+    Compacts 'element' (an EBMLMasterElementInFile) and its descendants,
+    moving only children of up to 'maxsize' bytes, and copying at most
+    'rate' bytes per second in run() (no limit if None).
+    """
+
+    def __init__(self, element, maxsize=4*1024**2, rate=None,
+                 _throttle=None):
+        self.element = element
+        self.maxsize = maxsize
+        self._throttle = _throttle or _Throttle(rate)
+        self._masters = None
+        self._sub = None
+        self._steps = None
+        self.done = False
+
+    @property
+    def copied(self):
+        """Number of bytes copied so far."""
+        return self._throttle.copied
+
+    def step(self):
+        """
+        Carries out a single step of compaction. Returns False once there
+        is nothing left to do.
+        """
+
+        if self.done:
+            return False
+
+        element = self.element
+
+        with element.lock:
+            if element.parent is None:
+                # Removed in the meantime.
+                self.done = True
+                return False
+
+            if self._masters is None:
+                element._scanAll()
+                self._masters = [
+                    element._getChildElement(offset)
+                    for offset in element._children
+                    if element._childIsElementInFile(offset)]
+                self._masters.reverse()
+                return True
+
+            if self._sub is None and self._masters:
+                self._sub = Compactor(self._masters.pop(), self.maxsize,
+                                      _throttle=self._throttle)
+
+        if self._sub is not None:
+            if not self._sub.step():
+                self._sub = None
+
+            return True
+
+        lock = element.lock
+
+        if self._steps and self._steps[-1][0] == "collapse":
+            # Collapsing shifts everything after the range in the file.
+            lock = element.root.lock
+
+        with lock:
+            if self._steps is None:
+                self._steps = self.plan()
+                self._steps.reverse()
+                return True
+
+            if not self._steps:
+                self.done = True
+                return False
+
+            (op, *args) = self._steps.pop()
+            getattr(self, f"_{op}")(*args)
+            return True
+
+    def run(self, timeout=None):
+        """
+        Carries out steps until done (returning True), or until 'timeout'
+        seconds have passed (returning False).
+        """
+
+        if timeout is not None:
+            timeout += time.monotonic()
+
+        while self.step():
+            if timeout is not None and time.monotonic() >= timeout:
+                return False
+
+            time.sleep(self._throttle.delay())
+
+        return True
+
+    def plan(self):
+        """
+        Returns the steps planned for the element itself, as a list of
+        ("move", offset, size, newoffset), ("resize", newsize) and
+        ("collapse", offset, size) tuples, in order.
+        """
+
+        element = self.element
+
+        with element.lock:
+            element._scanAll()
+            children = list(element._children.items())
+            dataSize = element.dataSize
+            bsize = element.bsize or 1
+            base = element.dataOffsetInFile
+
+        offsets = [offset for (offset, _) in children]
+        ends = {offset: end for (offset, (_, _, end)) in children}
+        free = FreeSpaceMap.fromChildren(children, dataSize)
+
+        def reclaimable(start, end):
+            if end == dataSize:
+                # Removed by shrinking the element.
+                return end - start
+
+            collapse = _collapsible(start, end, bsize, base)
+            return collapse[1] - collapse[0] if collapse else 0
+
+        def neighbors(k):
+            prevEnd = ends[offsets[k - 1]] if k else 0
+            nextStart = offsets[k + 1] if k + 1 < len(offsets) else dataSize
+            return (prevEnd, nextStart)
+
+        steps = []
+
+        # Candidates, cheapest first. When a child is moved away, its former
+        # neighbors are reconsidered, as the gaps next to them have grown.
+        heap = [(end - offset, offset) for (offset, end) in ends.items()
+                if end - offset <= self.maxsize]
+        heapq.heapify(heap)
+
+        while heap:
+            (size, offset) = heapq.heappop(heap)
+
+            if ends.get(offset) != offset + size:
+                continue
+
+            k = bisect.bisect_left(offsets, offset)
+            (prevEnd, nextStart) = neighbors(k)
+            gain = (reclaimable(prevEnd, nextStart)
+                    - reclaimable(prevEnd, offset)
+                    - reclaimable(offset + size, nextStart))
+
+            if gain < size:
+                continue
+
+            newoffset = free.bestFit(size, stop=prevEnd)
+
+            if newoffset is None:
+                continue
+
+            (gapStart, gapEnd) = free.containing(newoffset)
+            loss = (reclaimable(gapStart, gapEnd)
+                    - reclaimable(newoffset + size, gapEnd))
+
+            if gain - loss < size:
+                continue
+
+            steps.append(("move", offset, size, newoffset))
+            free.free(offset, offset + size)
+            free.allocate(newoffset, newoffset + size)
+            del offsets[k], ends[offset]
+            bisect.insort(offsets, newoffset)
+            ends[newoffset] = newoffset + size
+
+            for neighbor in offsets[max(k - 1, 0):k + 2]:
+                if neighbor != newoffset:
+                    heapq.heappush(heap, (ends[neighbor] - neighbor, neighbor))
+
+        lastEnd = ends[offsets[-1]] if offsets else 0
+
+        if lastEnd < dataSize:
+            steps.append(("resize", lastEnd))
+
+        for (start, end) in reversed(list(free)):
+            collapse = (_collapsible(start, end, bsize, base)
+                        if end < dataSize else None)
+
+            if collapse:
+                steps.append(("collapse", collapse[0],
+                              collapse[1] - collapse[0]))
+
+        return steps
+
+    def _move(self, offset, size, newoffset):
+        element = self.element
+        entry = element._children.get(offset)
+
+        if entry is None or entry[2] - offset != size:
+            return
+
+        try:
+            element._canMoveChildElement(offset, newoffset)
+
+        except WriteError:
+            return
+
+        element._moveChildElement(offset, newoffset)
+        self._throttle.copied += size
+
+    def _resize(self, newsize):
+        element = self.element
+
+        for size in (newsize, newsize + 2):
+            if size >= element.dataSize:
+                return
+
+            try:
+                element._canResize(size)
+
+            except (ResizeError, WriteError):
+                continue
+
+            element._resize(size)
+            return
+
+    def _collapse(self, offset, size):
+        element = self.element
+        bsize = element.bsize
+
+        if bsize is None or (element.dataOffsetInFile + offset) % bsize:
+            return
+
+        try:
+            element._canCollapseRange(offset, size)
+
+        except WriteError:
+            return
+
+        element._collapseRange(offset, size)
+
+
+def _collapsible(start, end, bsize, base):
+    """
+    Returns the (start, end) of the whole blocks in the gap [start, end)
+    (relative to an element whose data starts at file offset 'base') that
+    can be removed without leaving a 1-byte gap, or None.
+    """
+
+    first = start + -(base + start) % bsize
+
+    if first == start + 1:
+        first += bsize
+
+    last = end - (base + end) % bsize
+
+    if last > first and (first - start) + (end - last) == 1:
+        last -= bsize
+
+    if last > first:
+        return (first, last)
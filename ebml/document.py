@@ -1,6 +1,9 @@
 from ebml.base import EBMLMasterElement, EBMLElement, Void, EBMLData
 from ebml.head import EBMLHead
-from ebml.util import readVint, fromVint, toVint, formatBytes, peekVint
+from ebml.offsetindex import OffsetIndex, readIndex
+from ebml.util import (readVint, fromVint, toVint, formatBytes, peekVint,
+                       PagedFile)
+from ebml.vint import scanFile
 from ebml.exceptions import UnexpectedEndOfData
 import io
 import threading
@@ -15,6 +18,10 @@ class EBMLBody(EBMLMasterElement):
 
     allowunknown = True
 
+    # Write an OffsetIndex (see ebml.offsetindex) at the end of the body on
+    # close, so that it can later be opened without a scan.
+    indexed = False
+
     def __init__(self, file, ebmlID=None, parent=None):
         self._file = file
         self.lock = threading.RLock()
@@ -24,6 +31,8 @@ class EBMLBody(EBMLMasterElement):
 
         self.parent = parent
         self._knownChildren = {}
+        self._childIDs = {}
+        self._indexOffset = self._indexEnd = None
         self._modified = False
 
         if "r" in file.mode:
@@ -71,9 +80,71 @@ class EBMLBody(EBMLMasterElement):
         self._contentsOffset = self._file.tell()
 
         if self._file.writable():
+            if not self._loadIndex():
+                self.seek(0)
+                self.scan()
+
             self.seek(0)
-            self.scan()
-            self.seek(0)
+
+    def _loadIndex(self):
+        """
+        Reads known children from the OffsetIndex at the end of the body.
+        Returns False if there is none, or if it is out of date.
+        """
+        index = readIndex(self._file, self._contentsOffset, self._contentssize)
+
+        if index is None:
+            return False
+
+        (offset, offsets, ebmlIDs, ends) = index
+        self._knownChildren = dict(zip(offsets, ends))
+        self._childIDs = dict(zip(offsets, ebmlIDs))
+        self._indexOffset = offset
+        self._indexEnd = self._contentssize
+        return True
+
+    def _dropIndex(self):
+        """
+        Overwrites the OffsetIndex, if any, with a Void element, so that it
+        is not trusted if the file is not closed properly after being
+        modified. The space of a trailing index is given back, to be reused
+        by later writes.
+        """
+        if self._indexOffset is not None:
+            pos = self._file.tell()
+            self.seek(self._indexOffset)
+            self._writeVoid(self._indexEnd - self._indexOffset)
+            self._file.seek(pos)
+
+            if self._indexEnd >= self._contentssize:
+                self._contentssize = self._indexOffset
+
+            self._indexOffset = self._indexEnd = None
+
+    def _end(self):
+        """
+        Returns the end of the data, not counting a trailing OffsetIndex,
+        which the next write drops.
+        """
+        if (self._indexOffset is not None
+                and self._indexEnd >= self._contentssize):
+            return self._indexOffset
+
+        return self._contentssize
+
+    def _writeIndex(self, offset):
+        """Writes an OffsetIndex at 'offset', returning its end offset."""
+        L = sorted((s, e) for (s, e) in self._knownChildren.items()
+                   if s in self._childIDs)
+        index = OffsetIndex.fromChildren([s for (s, e) in L],
+                                         [self._childIDs[s] for (s, e) in L],
+                                         [e for (s, e) in L], 0)
+        index.indexedSize = offset + index.indexLength
+        self.seek(offset)
+        index.toFile(self._file)
+        self._indexOffset = offset
+        self._indexEnd = index.indexedSize
+        return self._indexEnd
 
     def _writeVoid(self, size):
         for k in range(1, 9):
@@ -88,8 +159,14 @@ class EBMLBody(EBMLMasterElement):
         return self
 
     def close(self):
-        """Writes Void elements in unallocated space and closes file."""
-        if self._modified and self._file.writable():
+        """
+        Writes Void elements in unallocated space (and an OffsetIndex, if
+        'indexed' is set) and closes file.
+        """
+        if self._file.writable() and (
+                self._modified or self.indexed and self._indexOffset is None):
+            self._dropIndex()
+
             L = sorted(self._knownChildren.items())
             for (s1, e1), (s2, e2) in zip([(0, 0)] + L[:-1], L):
                 if e1 < s2:
@@ -102,6 +179,9 @@ class EBMLBody(EBMLMasterElement):
             else:
                 e = 0
 
+            if self.indexed:
+                e = self._writeIndex(e)
+
             self.seek(e)
             self._file.truncate()
             self.seek(-self._sizesize)
@@ -117,7 +197,7 @@ class EBMLBody(EBMLMasterElement):
         if whence == 1:
             return self._file.seek(offset + self._contentsOffset, whence)
         elif whence == 2:
-            return self._file.seek(offset + self._contentsOffset + self._contentssize)
+            return self._file.seek(offset + self._contentsOffset + self._end())
         return self._file.seek(offset + self._contentsOffset, whence)
 
     def tell(self):
@@ -154,13 +234,16 @@ class EBMLBody(EBMLMasterElement):
         if offset + childsize > 2**(7*self._sizesize) - 2:
             raise WriteError(f"Element extends past maximum possible element size.")
 
+        self._dropIndex()
         child.toFile(self._file)
 
         if not child.readonly:
             child.readonly = True
 
         self._knownChildren[offset] = self.tell()
+        self._childIDs[offset] = child.ebmlID
         self._contentssize = max(self._contentssize, self.tell())
+        self._invalidateSize()
         self._modified = True
         return offset
 
@@ -175,7 +258,9 @@ class EBMLBody(EBMLMasterElement):
         if not self._file.writable():
             raise io.UnsupportedOperation("write")
 
+        self._dropIndex()
         del self._knownChildren[offset]
+        self._childIDs.pop(offset, None)
 
         children = list(self._knownChildren.items())
 
@@ -185,6 +270,7 @@ class EBMLBody(EBMLMasterElement):
         else:
             self._contentssize = 0
 
+        self._invalidateSize()
         self._modified = True
 
     def readElement(self, withclass, parent=None, ignore=()):
@@ -217,7 +303,7 @@ class EBMLBody(EBMLMasterElement):
         ebmlID = peekVint(self._file)
         size = peekVint(self._file, len(ebmlID))
 
-        if ebmlID in ignore or ebmlID == Void.ebmlID:
+        if ebmlID in ignore or ebmlID in (Void.ebmlID, OffsetIndex.ebmlID):
             self._file.seek(len(ebmlID) + len(size) + fromVint(size), 1)
             return
 
@@ -259,7 +345,10 @@ class EBMLBody(EBMLMasterElement):
             else:
                 raise
 
-        self._knownChildren[offset] = self.tell()
+        if child is not None:
+            self._knownChildren[offset] = self.tell()
+            self._childIDs[offset] = child.ebmlID
+
         return child
 
     def flush(self):
@@ -276,24 +365,30 @@ class EBMLBody(EBMLMasterElement):
 
         childrenbefore = {(s, e) for (s, e) in self._knownChildren.items() if s <= offset}
         if len(childrenbefore):
-            (s, e) = max(childrenbefore)
-            self.seek(e)
+            (s, start) = max(childrenbefore)
         else:
-            self.seek(0)
+            start = 0
 
         if until is None:
             until = self._contentssize
 
-        while offset < until:
-            with self.lock:
-                self.seek(offset)
-                ebmlID = peekVint(self._file)
-                size = peekVint(self._file, len(ebmlID))
-
-            if ebmlID != Void.ebmlID:
-                self._knownChildren[offset] = offset + len(ebmlID) + len(size) + fromVint(size)
+        if start >= until:
+            return
 
-            offset += len(ebmlID) + len(size) + fromVint(size)
+        with self.lock:
+            self.seek(start)
+            headers = scanFile(self._file, until - start)
+
+        headers = headers[
+            (headers["ebmlID"] != int.from_bytes(Void.ebmlID, "big"))
+            & (headers["ebmlID"] != int.from_bytes(OffsetIndex.ebmlID, "big"))]
+        starts = (headers["offset"] - self._contentsOffset).tolist()
+        ends = (headers["offset"] - self._contentsOffset
+                + headers["headerLength"] + headers["dataSize"]).tolist()
+        ebmlIDs = [ebmlID.to_bytes(k, "big") for (ebmlID, k) in
+                   zip(headers["ebmlID"].tolist(), headers["idLength"].tolist())]
+        self._knownChildren.update(zip(starts, ends))
+        self._childIDs.update(zip(starts, ebmlIDs))
 
     @classmethod
     def _fromBytes(cls, data, ebmlID=None, parent=None):
@@ -310,11 +405,20 @@ class EBMLBody(EBMLMasterElement):
 
 
 class EBMLDocument(object):
+    # If set, reads go through a PagedFile (see ebml.util) caching up to
+    # pageCacheSize bytes of pageSize-byte pages of the file.
+    pageCacheSize = 0
+    pageSize = 64*1024
+
     def __init__(self, file, mode="r", bodycls=EBMLBody):
         if "b" not in mode:
             mode += "b"
 
         self._file = open(file, mode)
+
+        if self.pageCacheSize:
+            self._file = PagedFile(self._file, self.pageSize,
+                                   self.pageCacheSize)
         self._bodycls = bodycls
 
         if "r" in mode:
@@ -40,3 +40,6 @@ class ReadError(Exception):
 
 class ResizeError(Exception):
     pass
+
+class JournalError(Exception):
+    pass
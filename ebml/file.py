@@ -1,15 +1,26 @@
 from .base import (EBMLMasterElement, EBMLElement, Void, CRC32, EBMLData,
                    EBMLProperty)
 from .vint import parseFile, readVint, fromVint, toVint, detectVintSize
-from .util import (_fallocate, NoInterrupt, FALLOC_FL_KEEP_SIZE,
-                   FALLOC_FL_PUNCH_HOLE, FALLOC_FL_COLLAPSE_RANGE,
-                   FALLOC_FL_INSERT_RANGE)
+from .util import (_fallocate, _copyRange, _pread, NoInterrupt, MappedFile,
+                   PagedFile, IntentLock,
+                   FALLOC_FL_KEEP_SIZE, FALLOC_FL_PUNCH_HOLE,
+                   FALLOC_FL_COLLAPSE_RANGE, FALLOC_FL_INSERT_RANGE)
 from .exceptions import *
-from threading import RLock as Lock
+from ._childindex import ChildIndex
+from ._freemap import FreeSpaceMap
+from ._childcache import ChildCache
+from ._prefetch import Prefetcher
+from .compact import Compactor
+from .offsetindex import OffsetIndex, readIndex
+from .journal import Journal
+from threading import RLock
+import contextlib
+import bisect
 import weakref
 import signal
+import threading
 import os
-import bisect
+import sys
 import time
 from . import _file
 
@@ -20,6 +31,186 @@ def isfile(value):
             and hasattr(value, "write") and callable(value.write)
             and hasattr(value, "read") and callable(value.read))
 
+class _PendingWrites(object):
+    """
+    Writes queued by EBMLMasterElementInFile.batch(), keyed by file offset.
+    A write replaces whatever part of earlier queued writes it overlaps.
+
+    Void elements are not queued as writes. Instead, the ranges they were
+    meant to cover are noted for each element, and one Void is written for
+    each gap between children overlapping those ranges on commit, so that
+    Void headers that later edits would overwrite or move are never written
+    at all.
+    """
+
+    def __init__(self, file, journal=None):
+        self.file = file
+        self.journal = journal
+        self._starts = []
+        self._data = {}
+        self._voids = {}
+
+    def write(self, offset, data):
+        data = bytes(data)
+        end = offset + len(data)
+
+        if not data:
+            return
+
+        starts = self._starts
+        pending = self._data
+        i = bisect.bisect_left(starts, offset)
+        j = bisect.bisect_left(starts, end, i)
+        tail = None
+
+        if i > 0:
+            s = starts[i - 1]
+            d = pending[s]
+
+            if s + len(d) > offset:
+                pending[s] = d[:offset - s]
+
+                if s + len(d) > end:
+                    tail = d[end - s:]
+
+        if j > i:
+            s = starts[j - 1]
+            d = pending[s]
+
+            if s + len(d) > end:
+                tail = d[end - s:]
+
+            for s in starts[i:j]:
+                del pending[s]
+
+        starts[i:j] = [offset] if tail is None else [offset, end]
+        pending[offset] = data
+
+        if tail is not None:
+            pending[end] = tail
+
+    def void(self, element, start, end):
+        """Notes that [start, end) is free space in the data of 'element'."""
+        ranges = self._voids.get(element)
+
+        if ranges is None:
+            ranges = self._voids[element] = []
+
+        ranges.append((start, end))
+
+    def commit(self):
+        """Performs queued writes in order of offset, joining adjacent ones."""
+        voids = self._voids
+        self._voids = {}
+
+        for (element, ranges) in voids.items():
+            if element.parent is None:
+                # Removed (and destroyed) since.
+                continue
+
+            offset = element.dataOffsetInFile
+
+            for (start, end) in element._gaps(ranges):
+                self.write(offset + start, element._voidHeader(end - start))
+
+        starts = self._starts
+        pending = self._data
+        runs = []
+        k = 0
+
+        while k < len(starts):
+            offset = end = starts[k]
+            run = []
+
+            while k < len(starts) and starts[k] == end:
+                run.append(pending[end])
+                end += len(run[-1])
+                k += 1
+
+            runs.append((offset, run[0] if len(run) == 1 else b"".join(run)))
+
+        starts.clear()
+        pending.clear()
+
+        if not runs:
+            return
+
+        if self.journal is not None:
+            self.journal.append(runs)
+
+        for (offset, data) in runs:
+            self.file.seek(offset)
+            self.file.write(data)
+
+        if self.journal is not None:
+            self.journal.applied(self.file)
+
+class _SubtreeLock(object):
+    """
+    Locks the subtree of 'element' in 'mode' ("S" or "X"): its own
+    IntentLock in that mode, and those of its ancestors in the matching
+    intent mode, from the root down.
+    """
+
+    __slots__ = ("element", "mode")
+
+    def __init__(self, element, mode):
+        self.element = element
+        self.mode = mode
+
+    def acquire(self):
+        element = self.element
+        path = [element]
+
+        while isinstance(path[-1].parent, EBMLMasterElementInFile):
+            path.append(path[-1].parent)
+
+        path.reverse()
+        root = path[0]
+
+        if self.mode == "X" and root._journal is not None:
+            # Every write goes through the one journal of the file.
+            locks = [(root._lock, "X")]
+
+        else:
+            locks = [(node._lock, "I" + self.mode) for node in path[:-1]]
+            locks.append((element._lock, self.mode))
+
+        acquired = []
+
+        try:
+            for (lock, mode) in locks:
+                lock.acquire(mode)
+                acquired.append((lock, mode))
+
+        except BaseException:
+            for (lock, mode) in reversed(acquired):
+                lock.release(mode)
+
+            raise
+
+        # The path is kept for release(), as the element may be removed
+        # from its parent in the meantime.
+        element._lockPaths.setdefault(threading.get_ident(), []).append(locks)
+
+    def release(self):
+        paths = self.element._lockPaths
+        me = threading.get_ident()
+        locks = paths[me].pop()
+
+        if not paths[me]:
+            del paths[me]
+
+        for (lock, mode) in reversed(locks):
+            lock.release(mode)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
 class EBMLMasterElementInFile(EBMLElement):
     # TODO:
     # * Allow instances to be created without being immediately written to
@@ -29,9 +220,42 @@ class EBMLMasterElementInFile(EBMLElement):
     __ebmlchildren__ = ()
     _childTypes = {Void.ebmlID: Void, CRC32.ebmlID: CRC32}
     allowunknown = True
+
+    # Write an OffsetIndex (see ebml.offsetindex) at the end of the element
+    # on flush(), so that it can later be opened without a scan.
+    indexed = False
+
+    # Wrap the file of a root element in a MappedFile (see ebml.util), so
+    # that reads and small writes go through a memory map, and EBMLData
+    # children are read as memoryviews into the map. Those are copied to
+    # bytes before their data is moved, overwritten or truncated away.
+    mapped = False
+
+    # Otherwise, if pageCacheSize is set, wrap the file of a root element in
+    # a PagedFile (see ebml.util), so that small reads (of headers, etc.) are
+    # served from up to pageCacheSize bytes of cached pageSize-byte pages.
+    pageCacheSize = 0
+    pageSize = 64*1024
+
+    # Log writes made to the file of a root element to a write-ahead journal
+    # (see ebml.journal) at "<file name>.wal", replayed when the element is
+    # next created or opened. journalSync is the sync policy of the journal:
+    # "operation", "count" (every journalSyncEvery operations), "time" (at
+    # most every journalSyncInterval seconds) or "none".
+    journaled = False
+    journalSync = "operation"
+    journalSyncEvery = 64
+    journalSyncInterval = 1.0
+
+    # Keep up to cacheSize bytes (as encoded in the file) of the most
+    # recently used children, other than master elements, in memory, in a
+    # cache shared by the whole file (see cacheInfo()), rather than reading
+    # them again as soon as they are dropped. 0 disables the cache.
+    cacheSize = 0
+
     __ebmlproperties__ = (
-            EBMLProperty("offsetInParent", int, optional=True),
-            EBMLProperty("dataSize", int, optional=True)
+            EBMLProperty("offsetInParent", int, optional=True, encoded=False),
+            EBMLProperty("dataSize", int, optional=True, encoded=False)
         )
 
     def __init_subclass__(cls):
@@ -50,14 +274,21 @@ class EBMLMasterElementInFile(EBMLElement):
             self.ebmlID = ebmlID
 
         self._init(parent, offset, size, sizeLength)
+        parent = self.parent
 
-        with self.lock:
+        if isfile(parent) and self.journaled:
+            self._journal = self._openJournal(parent)
+
+        # Adding a child takes an exclusive lock on the parent anyway.
+        lock = (parent.lock if isinstance(parent, EBMLMasterElementInFile)
+                else self.lock)
+
+        with lock:
             if isinstance(parent, EBMLMasterElementInFile):
                 parent.addChildElement(self, offset)
 
-            parent.seek(offset)
-            self.file.write(self.ebmlID)
-            self.file.write(toVint(size, sizeLength))
+            self._write(-self.dataOffset,
+                        self.ebmlID + toVint(size, sizeLength))
 
             if size > 0:
                 self._writeVoid(0, size)
@@ -75,6 +306,13 @@ class EBMLMasterElementInFile(EBMLElement):
         if size >= 2**(7*sizeLength) - 1:
             raise ValueError(f"Size of {size} too large for sizeLength {sizeLength}.")
 
+        if self.mapped and isfile(parent) and not isinstance(parent, MappedFile):
+            parent = MappedFile(parent)
+
+        elif (self.pageCacheSize and isfile(parent)
+                and not isinstance(parent, (MappedFile, PagedFile))):
+            parent = PagedFile(parent, self.pageSize, self.pageCacheSize)
+
         self.parent = parent
 
         if isfile(parent) and hasattr(parent, "name"):
@@ -86,25 +324,243 @@ class EBMLMasterElementInFile(EBMLElement):
         self._sizeLength = sizeLength
         self.dataSize = size
         self.offsetInParent = offset
-        self._children = {}
-        self._childoffsets = []
+        self._children = ChildIndex()
+        self._free = None
+        self._liveChildren = weakref.WeakSet()
+        self._indexOffset = self._indexEnd = None
+        self._indexCurrent = False
+
+        # Children are discovered lazily: every child starting before
+        # _scanned is in _children. A new element holds only Void.
+        self._scanned = size
         self._pos = 0
 
+        # Writes queued by batch(), the journal, the cache of children and
+        # the children read as views into the map (with their ranges in the
+        # file, see _detachViews), on root elements only.
+        self._batch = None
+        self._journal = None
+        self._cache = (ChildCache(self.cacheSize)
+                       if self.cacheSize and isfile(parent) else None)
+        self._views = (weakref.WeakKeyDictionary()
+                       if isinstance(parent, MappedFile) else None)
+
+    @classmethod
+    def _openJournal(cls, file):
+        """
+        Opens the journal of a root element in 'file', replaying it if not
+        empty. Returns None if 'file' is read-only, as nothing will be
+        written to it, unless the journal has to be replayed first.
+        """
+
+        name = getattr(file, "name", None)
+
+        if not isinstance(name, (str, bytes, os.PathLike)):
+            raise ValueError("Journaling requires a file with a name.")
+
+        path = f"{os.fsdecode(name)}.wal"
+
+        if not file.writable():
+            if Journal.pending(path):
+                raise JournalError(f"Journal {path!r} has to be replayed, "
+                                   "which requires the file to be writable.")
+
+            return None
+
+        journal = Journal(path, cls.journalSync, cls.journalSyncEvery,
+                          cls.journalSyncInterval)
+
+        if len(journal):
+            journal.replay(file)
+
+        return journal
+
     def _writeVoid(self, offset, size):
+        batch = self.root._batch
+
+        if batch is not None:
+            batch.void(self, offset, offset + size)
+
+        else:
+            self._write(offset, self._voidHeader(size))
+
+    @staticmethod
+    def _voidHeader(size):
         for k in range(1, 9):
             if size - 1 - k < 128**k - 1:
                 break
 
-        self.file.seek(self.dataOffsetInFile + offset)
-        self.file.write(b"\xec")
-        self.file.write(toVint(size - 1 - k, k))
+        return b"\xec" + toVint(size - 1 - k, k)
+
+    def _gaps(self, ranges):
+        """
+        Yields (start, end) for each gap between children (or the
+        OffsetIndex) that overlaps any of the (start, end) pairs in 'ranges',
+        once.
+        """
+
+        children = self._children
+        merged = []
+
+        for (start, end) in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+
+            else:
+                merged.append([start, end])
+
+        lastGap = None
+
+        for (start, end) in merged:
+            prev = children.prev(start + 1)
+            gapStart = children[prev][2] if prev is not None else 0
+
+            while gapStart < end:
+                nextChild = children.next(gapStart - 1)
+
+                if nextChild is not None:
+                    (gapEnd, nextEnd) = (nextChild, children[nextChild][2])
+
+                else:
+                    (gapEnd, nextEnd) = (self.dataSize, None)
+
+                if (self._indexOffset is not None
+                        and gapStart <= self._indexOffset < gapEnd):
+                    (gapEnd, nextEnd) = (self._indexOffset, self._indexEnd)
+
+                if gapEnd > gapStart and gapStart != lastGap:
+                    lastGap = gapStart
+                    yield (gapStart, gapEnd)
+
+                if nextEnd is None:
+                    break
+
+                gapStart = nextEnd
+
+    def _write(self, offset, data):
+        """
+        Writes 'data' at 'offset' (relative to the start of the data), or
+        queues the write if a batch is in progress.
+        """
+
+        root = self.root
+
+        if root._batch is not None:
+            root._batch.write(self.dataOffsetInFile + offset, data)
+            return
+
+        with root._metaLock:
+            if root._journal is not None:
+                root._journal.append([(self.dataOffsetInFile + offset,
+                                       bytes(data))])
+
+            self.seek(offset)
+            self.file.write(data)
+
+            if root._journal is not None:
+                root._journal.applied(self.file)
+
+    def _commitWrites(self):
+        """
+        Performs writes queued by a batch in progress. Must be called before
+        reading from the file, or modifying it other than through _write.
+        """
+
+        batch = self.root._batch
+
+        if batch is not None:
+            batch.commit()
+
+    def _checkpoint(self):
+        """
+        Performs queued writes and, if journaled, syncs the file and empties
+        the journal. Must be called before and after modifying the file in a
+        way that is not journaled (moving data, fallocate, truncate), as
+        replaying journaled writes across such a change would corrupt it.
+        """
+
+        self._commitWrites()
+        journal = self.root._journal
+
+        if journal is not None:
+            journal.checkpoint(self.file)
+
+    def _flush(self):
+        if self.root._batch is None:
+            self.file.flush()
+
+    def _noInterrupt(self):
+        # Queued writes are performed all at once by the batch itself.
+        if self.root._batch is not None:
+            return contextlib.nullcontext()
+
+        # Each operation goes to the journal as a single transaction.
+        if self.root._journal is not None:
+            return self.batch()
+
+        return NoInterrupt()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Context manager that groups edits to this element and its
+        relatives (addChildElement, removeChildElement, resize, etc.) into a
+        single commit:
+
+            with element.batch():
+                ...
+
+        Small writes are queued rather than performed right away, and are
+        performed in order of offset, with one Void element per gap between
+        children and a single flush, when the outermost batch exits (even on
+        an exception, as the changes have already been made in memory).
+        Queued writes are performed early whenever the file has to be read
+        or moved around.
+        """
+
+        root = self.root
+
+        with root.lock:
+            if root._batch is not None:
+                yield
+                return
+
+            root._batch = _PendingWrites(self.file, root._journal)
+
+            try:
+                yield
+
+            finally:
+                batch = root._batch
+                root._batch = None
+
+                with NoInterrupt():
+                    batch.commit()
+
+                self.file.flush()
 
     @property
     def lock(self):
-        if isinstance(self.parent, EBMLMasterElementInFile):
-            return self.parent.lock
+        """
+        Exclusive lock on this element and its descendants, held by
+        operations that modify them. Ancestors are only locked with intent,
+        so that other subtrees can be read and written in the meantime.
+        Operations that shift data elsewhere in the file (collapseRange,
+        insertRange, batch, etc.), and every write to a journaled file, lock
+        the root element instead.
+        """
 
-        return self._lock
+        return _SubtreeLock(self, "X")
+
+    @property
+    def readLock(self):
+        """
+        Shared lock on this element and its descendants, held by operations
+        that only read from them (getChildElement, iterChildren, etc.), so
+        that any number of threads can read at once.
+        """
+
+        return _SubtreeLock(self, "S")
 
     @property
     def file(self):
@@ -126,22 +582,25 @@ class EBMLMasterElementInFile(EBMLElement):
 
     @parent.setter
     def parent(self, value):
-        if isinstance(value, EBMLMasterElementInFile):
-            self._lock = None
-
-        elif isfile(value):
-            self._lock = Lock()
+        if isfile(value):
+            # Guards the file position, scans, and child indices read under
+            # readLock, and parent indices updated by children, among
+            # threads working on different subtrees.
+            self._metaLock = RLock()
 
-        else:
+        elif not isinstance(value, EBMLMasterElementInFile):
             raise TypeError(
                 "Parent must either be instance of EBMLMasterElementInFile, "
                 "or a seekable file-like object opened in binary mode.")
 
+        if getattr(self, "_lock", None) is None:
+            self._lock = IntentLock()
+            self._lockPaths = {}
+
         self._parent = value
 
-    def _destroy(self):
+    def _destroy(self, cache=None):
         self._parent = None
-        self._lock = None
 
         for (ebmlID, ref, endOffset) in self._children.values():
             if not isinstance(ref, weakref.ref):
@@ -150,7 +609,10 @@ class EBMLMasterElementInFile(EBMLElement):
             obj = ref()
 
             if isinstance(obj, EBMLMasterElementInFile):
-                obj._destroy()
+                obj._destroy(cache)
+
+            elif obj is not None and cache is not None:
+                cache.discard(obj)
 
     def size(self):
         return self.dataOffset + self.dataSize
@@ -180,20 +642,96 @@ class EBMLMasterElementInFile(EBMLElement):
     def getChildElement(self, offset):
         """Returns child element at 'offset'."""
 
-        with self.lock:
+        with self.readLock:
             return self._getChildElement(offset)
 
     def _getChildElement(self, offset):
-        child = self._getExistingChildElement(offset)
+        metaLock = self.root._metaLock
 
-        if child is None:
+        with metaLock:
+            self._scanTo(offset)
             ebmlID, ref, endOffset = self._children[offset]
-            child = self._readChildElement(offset)
+            child = ref() if isinstance(ref, weakref.ref) else None
+
+            if child is not None:
+                cache = self.root._cache
+
+                if (cache is not None
+                        and not isinstance(child, EBMLMasterElementInFile)):
+                    cache.hit(child, endOffset - offset)
+
+                return child
+
+            childcls = self._getChildCls(ebmlID)
+
+            if not self._canPreadChild(childcls):
+                return self._addLiveChild(
+                    offset, self._readChildElement(offset))
+
+            # Positional reads bypass the buffers of the file object, so
+            # writes (including those queued by a batch) have to reach the
+            # file descriptor first.
+            self._commitWrites()
+            self.file.flush()
+
+        # The file cannot change under readLock, so only the bookkeeping
+        # needs metaLock. Should another thread have read the same child in
+        # the meantime, its copy is kept.
+        child = self._preadChildElement(offset, ebmlID, endOffset, childcls)
+
+        with metaLock:
+            return self._addLiveChild(offset, child)
+
+    def _addLiveChild(self, offset, child):
+        ebmlID, ref, endOffset = self._children[offset]
+        existing = ref() if isinstance(ref, weakref.ref) else None
+        cache = self.root._cache
+
+        if existing is not None:
+            # Read by another thread in the meantime.
+            child = existing
+
+        else:
             self._children[offset] = (ebmlID, weakref.ref(child), endOffset)
-            return child
+            self._liveChildren.add(child)
+
+        if not isinstance(child, EBMLMasterElementInFile):
+            self._trackView(child, offset, endOffset)
+
+            if cache is not None:
+                cache.miss(child, endOffset - offset)
 
         return child
 
+    def _trackView(self, child, offset, endOffset):
+        """
+        Notes the range in the file of 'child' (at 'offset' in this
+        element) if it was read as a view into the map.
+        """
+
+        views = self.root._views
+
+        if views is not None and isinstance(child, EBMLData):
+            start = self.dataOffsetInFile
+            views[child] = (start + offset, start + endOffset)
+
+    def _detachViews(self, start, end=None):
+        """
+        Copies the payloads of children read as views into the map that
+        overlap [start, end) in the file (up to its end if None), before
+        that range is overwritten, moved or truncated away.
+        """
+
+        views = self.root._views
+
+        if not views:
+            return
+
+        for (child, (s, e)) in list(views.items()):
+            if e > start and (end is None or s < end):
+                child._detachView()
+                del views[child]
+
     def _getExistingChildElement(self, offset):
         ebmlID, ref, endOffset = self._children[offset]
 
@@ -208,15 +746,21 @@ class EBMLMasterElementInFile(EBMLElement):
         occur.
         """
 
-        with self.lock:
-            offset = self._childoffsets[0]
+        with self.readLock:
+            with self.root._metaLock:
+                offset = self._nextChild(-1)
+
+            if offset is None:
+                return
+
             child = self._getChildElement(offset)
 
         yield child
 
         while True:
-            with self.lock:
-                offset = self._nextChild(child.offsetInParent)
+            with self.readLock:
+                with self.root._metaLock:
+                    offset = self._nextChild(child.offsetInParent)
 
                 if offset is None:
                     break
@@ -225,17 +769,48 @@ class EBMLMasterElementInFile(EBMLElement):
 
             yield child
 
+    def prefetchChildren(self, readahead=4*1024**2):
+        """
+        Return iterator that yields all child elements, like iterChildren(),
+        but reads and decodes them ahead on a worker thread, up to
+        'readahead' bytes of children past those consumed so far.
+
+        Children are read under readLock by the worker, so whenever the
+        calling thread holds any lock on the file (including within
+        batch()), children are read inline, as by iterChildren(), instead,
+        and any worker is stopped. Close the iterator to stop the worker
+        early.
+        """
+
+        if self.root._lock.isHeld():
+            # The worker could wait on us (or on a writer waiting on us).
+            yield from self.iterChildren()
+            return
+
+        prefetcher = Prefetcher(self, readahead)
+
+        try:
+            yield from prefetcher
+
+        finally:
+            prefetcher.close()
+
     def _iterChildren(self):
-        for offset in self._childoffsets:
+        offset = self._nextChild(-1)
+
+        while offset is not None:
             yield self._getChildElement(offset)
+            offset = self._nextChild(offset)
 
     def scan(self):
-        with self.lock:
+        with self.lock, self.root._metaLock:
             self._scan()
 
     def _scan(self):
-        self._children = {}
-        self._childoffsets = []
+        self._children = ChildIndex()
+        self._free = None
+        self._indexOffset = self._indexEnd = None
+        self._indexCurrent = False
 
         self.file.seek(self.dataOffsetInFile)
 
@@ -243,7 +818,11 @@ class EBMLMasterElementInFile(EBMLElement):
              dataOffsetInFile, isize) in parseFile(
                  self.file, self.dataSize):
 
-            if ebmlID != Void.ebmlID:
+            if ebmlID == OffsetIndex.ebmlID:
+                self._indexOffset = offsetInFile - self.dataOffsetInFile
+                self._indexEnd = dataOffsetInFile + isize - self.dataOffsetInFile
+
+            elif ebmlID != Void.ebmlID:
                 self._scanchild(
                     offsetInFile - self.dataOffsetInFile, ebmlID, vsize,
                     dataOffsetInFile - self.dataOffsetInFile, isize)
@@ -252,35 +831,233 @@ class EBMLMasterElementInFile(EBMLElement):
         _file._scan(self)
 
     def _scanchild(self, offset, ebmlID, vsize, dataoffset, isize):
-        self._children[offset] = (
-            ebmlID, None, dataoffset + isize)
-        # bisect.insort(self._childoffsets, offset)
-
         # It is safe to assume that this function is being called on
         # increasing values of offset, so we will go with the less-
         # expensive append operation.
-        self._childoffsets.append(offset)
+        self._children.append(offset, (ebmlID, None, dataoffset + isize))
 
     def _scanchild(self, offset, ebmlID, vsize, dataoffset, isize):
         _file._scanchild(self, offset, ebmlID, vsize, dataoffset, isize)
 
-    def _readChildElement(self, offset=-1):
+    def _scanTo(self, offset):
+        """
+        Scans ahead, if needed, so that every child starting at or before
+        'offset' is in the child index.
+        """
+
+        if self._scanned <= offset and self._scanned < self.dataSize:
+            with self.root._metaLock:
+                if self._scanned <= offset and self._scanned < self.dataSize:
+                    self._commitWrites()
+                    _file._scanmore(self, offset + 1)
+
+    def _scanAll(self):
+        self._scanTo(self.dataSize)
+
+    def _loadIndex(self):
+        """
+        Builds the child index from the OffsetIndex at the end of the element.
+        Returns False if there is none, or if it is out of date.
+        """
+
+        index = readIndex(self.file, self.dataOffsetInFile, self.dataSize)
+
+        if index is None:
+            return False
+
+        (offset, offsets, ebmlIDs, ends) = index
+        self._children = ChildIndex.fromSorted(
+            offsets, [(ebmlID, None, end)
+                      for (ebmlID, end) in zip(ebmlIDs, ends)])
+        self._free = None
+        self._indexOffset = offset
+        self._indexEnd = self.dataSize
+        self._indexCurrent = True
+        self._scanned = self.dataSize
+        return True
+
+    def _dropIndex(self):
+        """
+        Overwrites the OffsetIndex, if any, with a Void element. Must be called
+        before any change to the children of this element.
+        """
+
+        if self._indexOffset is not None:
+            size = self._indexEnd - self._indexOffset
+            batch = self.root._batch
+
+            if batch is not None:
+                # The Void covering the index may end up starting further
+                # back, so its header has to be overwritten regardless.
+                batch.void(self, self._indexOffset, self._indexEnd)
+
+            self._write(self._indexOffset, self._voidHeader(size))
+            self._indexOffset = self._indexEnd = None
+            self._indexCurrent = False
+
+    def flush(self):
+        """
+        Flushes file. If 'indexed' is set, an OffsetIndex is first written to
+        the end of this element (and likewise in any descendants currently in
+        memory), growing the element if needed. If journaled, the file is
+        synced and the journal emptied, so that it is not replayed again.
+        """
+
         with self.lock:
+            self._writeIndices()
+            self._commitWrites()
+            self.file.flush()
+            journal = self.root._journal
+
+            if journal is not None and len(journal):
+                journal.checkpoint(self.file)
+
+    def _writeIndices(self):
+        for child in list(self._liveChildren):
+            if isinstance(child, EBMLMasterElementInFile):
+                child._writeIndices()
+
+        if self.indexed and not self._indexCurrent:
+            self._writeIndex()
+
+    def _writeIndex(self):
+        self._scanAll()
+        self._dropIndex()
+
+        offsets = []
+        ebmlIDs = []
+        ends = []
+
+        for (offset, (ebmlID, ref, endOffset)) in self._children.items():
+            offsets.append(offset)
+            ebmlIDs.append(ebmlID)
+            ends.append(endOffset)
+
+        lastEnd = self._endOfLastChild()
+        index = OffsetIndex.fromChildren(offsets, ebmlIDs, ends, self.dataSize)
+        length = index.indexLength
+        space = self.dataSize - lastEnd
+
+        if space != length and space < length + 2:
+            try:
+                self._canResize(lastEnd + length)
+
+            except ResizeError:
+                return False
+
+            self._resize(lastEnd + length)
+            index.indexedSize = self.dataSize
+
+        offset = self.dataSize - length
+
+        with self._noInterrupt():
+            if offset > lastEnd:
+                self._writeVoid(lastEnd, offset - lastEnd)
+
+            self._write(offset, index.toBytes())
+
+        self._indexOffset = offset
+        self._indexEnd = self.dataSize
+        self._indexCurrent = True
+        return True
+
+    def _readChildElement(self, offset=-1):
+        with self.root._metaLock:
             if offset < 0:
                 offset = self._pos
 
+            self._scanTo(offset)
+            self._commitWrites()
             ebmlID, ref, endOffset = self._children[offset]
             childcls = self._getChildCls(ebmlID)
             self.seek(offset)
             self._pos = endOffset
-            child = childcls.fromFile(self.file, parent=self)
+
+            if (isinstance(self.file, MappedFile)
+                    and issubclass(childcls, EBMLData)):
+                child = self._readMappedData(childcls)
+
+            else:
+                child = childcls.fromFile(self.file, parent=self)
             child.offsetInParent = offset
 
             if not isinstance(child, EBMLMasterElementInFile):
                 child.readonly = True
+                self._trackView(child, offset, endOffset)
 
             return child
 
+    def _readMappedData(self, childcls):
+        """
+        Reads an EBMLData child at the current file offset, keeping its
+        payload in the memory map instead of copying it.
+        """
+
+        (offset, ebmlID, size) = childcls._readHead(self.file)
+        size = fromVint(size)
+        data = self.file.view(size)
+
+        if len(data) < size:
+            raise UnexpectedEndOfData
+
+        if childcls.ebmlID is not None:
+            return childcls._fromView(data, parent=self)
+
+        return childcls._fromView(data, ebmlID=ebmlID, parent=self)
+
+    @staticmethod
+    def _canPreadChild(childcls):
+        """
+        Checks if children of class 'childcls' can be decoded from bytes
+        read with _pread(), rather than read from the file object.
+        """
+
+        return (not issubclass(childcls, EBMLMasterElementInFile)
+                and childcls.fromFile.__func__ is EBMLElement.fromFile.__func__
+                and (childcls._fromFile.__func__
+                     is EBMLElement._fromFile.__func__))
+
+    def _preadChildElement(self, offset, ebmlID, endOffset, childcls):
+        """
+        Reads the child at 'offset' with a positional read (a view into the
+        map, for a MappedFile), without using the file position, so that
+        threads holding readLock can do so at once.
+        """
+
+        start = self.dataOffsetInFile + offset
+        size = endOffset - offset
+        data = _pread(self.file, size, start)
+
+        if len(data) < size:
+            raise UnexpectedEndOfData
+
+        try:
+            k = len(ebmlID)
+            data = data[k + 9 - data[k].bit_length():]
+
+            if isinstance(data, memoryview):
+                if childcls.ebmlID is not None:
+                    child = childcls._fromView(data, parent=self)
+
+                else:
+                    child = childcls._fromView(data, ebmlID=ebmlID,
+                                               parent=self)
+
+            elif childcls.ebmlID is not None:
+                child = childcls._fromBytes(data, parent=self)
+
+            else:
+                child = childcls._fromBytes(data, ebmlID=ebmlID, parent=self)
+
+        except Exception:
+            raise DecodeError(
+                f"Error decoding EBML Element at offset {start}.",
+                childcls, start, *sys.exc_info())
+
+        child.offsetInParent = offset
+        child.readonly = True
+        return child
+
     def _canAddChildElement(self, child, offset):
         if offset < 0:
             raise WriteError(f"Invalid offset: {offset}.", self, offset)
@@ -353,6 +1130,7 @@ class EBMLMasterElementInFile(EBMLElement):
             return self._addChildElement(child, offset)
 
     def _addChildElement(self, child, offset):
+        self._dropIndex()
         childsize = child.size()
         prevChild = self._prevChild(offset)
         nextChild = self._nextChild(offset - 1)
@@ -369,7 +1147,7 @@ class EBMLMasterElementInFile(EBMLElement):
         else:
             s = self.dataSize
 
-        with NoInterrupt():
+        with self._noInterrupt():
             if offset > e:
                 self._writeVoid(e, offset - e)
 
@@ -378,17 +1156,26 @@ class EBMLMasterElementInFile(EBMLElement):
                 self._writeVoid(offset + childsize, s - offset - childsize)
 
             if not isinstance(child, EBMLMasterElementInFile):
-                self.file.seek(self.dataOffsetInFile + offset)
-                child.toFile(self.file)
+                if self.root._batch is not None:
+                    self._write(offset, child.toBytes())
+
+                else:
+                    with self.root._metaLock:
+                        self.file.seek(self.dataOffsetInFile + offset)
+                        child.toFile(self.file)
+
                 child.parent = self
                 child.offsetInParent = offset
                 child.readonly = True
 
             self._children[offset] = (child.ebmlID, weakref.ref(child),
                                     offset + childsize)
-            bisect.insort(self._childoffsets, offset)
 
-            self.file.flush()
+            if self._free is not None:
+                self._free.allocate(offset, offset + childsize)
+            self._liveChildren.add(child)
+
+            self._flush()
 
         return offset + childsize
 
@@ -404,7 +1191,9 @@ class EBMLMasterElementInFile(EBMLElement):
             self._removeChildElement(offset)
 
     def _removeChildElement(self, offset):
+        self._scanTo(offset)
         ebmlID, ref, _ = self._children[offset]
+        self._dropIndex()
 
         prevChild = self._prevChild(offset)
         nextChild = self._nextChild(offset)
@@ -421,19 +1210,33 @@ class EBMLMasterElementInFile(EBMLElement):
         else:
             s = self.dataSize
 
-        with NoInterrupt():
+        with self._noInterrupt():
+            (_, _, endOffset) = self._children[offset]
+            self._detachViews(self.dataOffsetInFile + offset,
+                              self.dataOffsetInFile + endOffset)
+
             if s > e:
                 self._writeVoid(e, s - e)
 
-            del self._children[offset]
-            self._childoffsets.remove(offset)
+            (_, _, endOffset) = self._children.pop(offset)
+
+            if self._free is not None:
+                self._free.free(offset, endOffset)
 
             obj = ref() if isinstance(ref, weakref.ref) else None
 
+            cache = self.root._cache
+
+            if obj is not None:
+                self._liveChildren.discard(obj)
+
             if isinstance(obj, EBMLMasterElementInFile):
-                obj._destroy()
+                obj._destroy(cache)
 
-            self.file.flush()
+            elif obj is not None and cache is not None:
+                cache.discard(obj)
+
+            self._flush()
 
     def canMoveChildElement(self, offset, newoffset):
         with self.lock:
@@ -450,10 +1253,19 @@ class EBMLMasterElementInFile(EBMLElement):
             raise WriteError(f"Invalid offset: {newoffset}.",
                              self, newoffset)
 
+        self._scanTo(max(offset, newoffset))
         ebmlID, ref, endoffset = self._children[offset]
 
-        prevChild = self._prevChild(offset)
-        nextChild = self._nextChild(offset - 1)
+        # Siblings around the destination, other than the child itself.
+        prevChild = self._prevChild(newoffset + 1)
+
+        if prevChild == offset:
+            prevChild = self._prevChild(offset)
+
+        nextChild = self._nextChild(newoffset)
+
+        if nextChild == offset:
+            nextChild = self._nextChild(offset)
 
         if prevChild is not None:
             (_, _, e) = self._children[prevChild]
@@ -467,7 +1279,7 @@ class EBMLMasterElementInFile(EBMLElement):
             if newoffset == e + 1:
                 raise WriteError(
                     "Child needs to start immediately after, or at least "
-                    f"two bytes past the end of sibling at offset {s}"
+                    f"two bytes past the end of sibling at offset {prevChild}"
                     f" (end offset {e}).", self, newoffset)
 
         elif newoffset == 1:
@@ -481,7 +1293,7 @@ class EBMLMasterElementInFile(EBMLElement):
             if newoffset + childsize > s:
                 raise WriteError(
                     f"Writing element at offset {newoffset} with size {childsize} "
-                    f"collides with sibling at offset {s} (end offset {e}).",
+                    f"collides with sibling at offset {s}.",
                     self, newoffset)
 
             if newoffset + childsize == s - 1:
@@ -514,35 +1326,26 @@ class EBMLMasterElementInFile(EBMLElement):
             self._moveChildElement(offset, newoffset)
 
     def _moveChildElement(self, offset, newoffset):
+        self._scanTo(max(offset, newoffset))
         ebmlID, ref, endoffset = self._children[offset]
+        self._dropIndex()
         childsize = endoffset - offset
 
-        blksize = self.bsize
-
-        if newoffset < offset:
-            iterator = zip(range(offset, endoffset, blksize),
-                        range(newoffset, newoffset + childsize, blksize))
-
-        else:
-            iterator = zip(
-                range(endoffset - blksize, offset - blksize, -blksize),
-                range(newoffset + childsize - blksize,
-                        newoffset - blksize, -blksize))
-
         prevChildOld = self._prevChild(offset)
         nextChildOld = self._nextChild(offset)
 
+        # Gap left behind at the old position.
         if prevChildOld is not None:
-            (_, _, e1) = self._children[prevChildOld]
+            (_, _, e0) = self._children[prevChildOld]
 
         else:
-            e1 = 0
+            e0 = 0
 
         if nextChildOld is not None:
-            s1 = nextChildOld
+            s0 = nextChildOld
 
         else:
-            s1 = self.dataSize
+            s0 = self.dataSize
 
         prevChildNew = self._prevChild(newoffset)
         nextChildNew = self._nextChild(newoffset)
@@ -553,58 +1356,67 @@ class EBMLMasterElementInFile(EBMLElement):
         if nextChildNew == offset:
             nextChildNew = self._nextChild(offset)
 
+        # Gap the child is moved into.
         if prevChildNew is not None:
             (_, _, e1) = self._children[prevChildNew]
 
         else:
             e1 = 0
 
-        if nextChildOld is not None:
+        if nextChildNew is not None:
             s1 = nextChildNew
 
         else:
             s1 = self.dataSize
 
+        # Blocks are copied right away, so queued writes must go first.
+        self._checkpoint()
+
         with NoInterrupt():
-            for o1, o2 in iterator:
-                size = min(blksize, endoffset - o1)
+            with self.root._metaLock:
+                # The old position is overwritten by Void or other children.
+                self._detachViews(self.dataOffsetInFile + offset,
+                                  self.dataOffsetInFile + endoffset)
+                _copyRange(self.file, self.dataOffsetInFile + offset,
+                           self.dataOffsetInFile + newoffset, childsize,
+                           self.bsize)
 
-                (o1, size, o2) = max([
-                    (o1, size, o2),
-                    (offset, size - (offset - o1), o2 + (offset - o1))])
+            # The copy must be durable before the journal refers to it.
+            self._checkpoint()
 
-                self.seek(o1)
-                data = self.file.read(size)
-                self.seek(o2)
-                self.file.write(data)
+            with self._noInterrupt():
+                if not (e0 <= newoffset < s0):
+                    self._writeVoid(e0, s0 - e0)
 
-            if not (e1 <= newoffset < s1):
-                self._writeVoid(e1, s1 - e1)
+                if newoffset > e1:
+                    self._writeVoid(e1, newoffset - e1)
 
-            if newoffset > e1:
-                self._writeVoid(e1, newoffset - e1)
+                if newoffset + childsize < s1:
+                    self._writeVoid(newoffset + childsize, s1 - (newoffset + childsize))
 
-            if newoffset + childsize < s1:
-                self._writeVoid(newoffset + childsize, s1 - (newoffset + childsize))
+                del self._children[offset]
+                self._children[newoffset] = (ebmlID, ref, newoffset + childsize)
 
-            del self._children[offset]
-            self._childoffsets.remove(offset)
+                if self._free is not None:
+                    self._free.free(offset, endoffset)
+                    self._free.allocate(newoffset, newoffset + childsize)
 
-            self._children[newoffset] = (ebmlID, ref, newoffset + childsize)
-            bisect.insort(self._childoffsets, newoffset)
+                obj = ref() if ref is not None else ref
 
-            obj = ref() if ref is not None else ref
+                if isinstance(obj, EBMLMasterElementInFile):
+                    obj.offsetInParent = newoffset
 
-            if isinstance(obj, EBMLMasterElementInFile):
-                obj.offsetInParent = newoffset
+                elif isinstance(obj, EBMLElement):
+                    ro = obj.readonly
+                    obj._readonly = False
+                    obj.offsetInParent = newoffset
+                    obj._readonly = ro
 
-            elif isinstance(obj, EBMLElement):
-                ro = obj.readonly
-                obj._readonly = False
-                obj.offsetInParent = newoffset
-                obj._readonly = ro
+                    # It may hold a view of its former location in the map.
+                    if self.root._cache is not None:
+                        self.root._cache.discard(obj)
 
-            self.file.flush()
+                self._flush()
 
     def startOfFirstChild(self):
         """
@@ -613,12 +1425,16 @@ class EBMLMasterElementInFile(EBMLElement):
         If no children elements exist, will return dataSize.
         """
 
-        with self.lock:
+        with self.readLock, self.root._metaLock:
             return self._startOfFirstChild()
 
     def _startOfFirstChild(self):
-        if len(self._childoffsets):
-            return self._childoffsets[-1]
+        offset = self._nextChild(-1)
+
+        if offset is None:
+            return self.dataSize
+
+        return offset
 
     def endOfLastChild(self):
         """
@@ -627,29 +1443,37 @@ class EBMLMasterElementInFile(EBMLElement):
         If no children elements exist, will return 0.
         """
 
-        with self.lock:
+        with self.readLock, self.root._metaLock:
             return self._endOfLastChild()
 
     def _endOfLastChild(self):
-        if len(self._childoffsets):
-            lastchild = self._childoffsets[-1]
+        self._scanAll()
+
+        if len(self._children):
+            lastchild = self._children.last()
             (_, _, endOffset) = self._children[lastchild]
             return endOffset
 
         return 0
 
     def nextChild(self, offset, strict=True):
-        with self.lock:
+        with self.readLock, self.root._metaLock:
             return self._nextChild(offset, strict)
 
     def _nextChild(self, offset, strict=True):
-        if not strict and offset in self._childoffsets:
+        self._scanTo(offset + 1)
+
+        if not strict and offset in self._children:
             return offset
 
-        k = bisect.bisect(self._childoffsets, offset)
+        nextChild = self._children.next(offset)
+
+        # Keep scanning until a child turns up, or there is nothing left.
+        while nextChild is None and self._scanned < self.dataSize:
+            self._scanTo(self._scanned)
+            nextChild = self._children.next(offset)
 
-        if k < len(self._childoffsets):
-            return self._childoffsets[k]
+        return nextChild
 
     def prevChild(self, offset, strict=True):
         """
@@ -657,17 +1481,16 @@ class EBMLMasterElementInFile(EBMLElement):
         if none exists.
         """
 
-        with self.lock:
+        with self.readLock, self.root._metaLock:
             return self._prevChild(offset, strict)
 
     def _prevChild(self, offset, strict=True):
-        if not strict and offset in self._childoffsets:
-            return offset
+        self._scanTo(offset)
 
-        k = bisect.bisect_left(self._childoffsets, offset) - 1
+        if not strict and offset in self._children:
+            return offset
 
-        if k >= 0:
-            return self._childoffsets[k]
+        return self._children.prev(offset)
 
     def canResizeChild(self, offset, newsize):
         with self.lock:
@@ -708,8 +1531,10 @@ class EBMLMasterElementInFile(EBMLElement):
             return True
 
     def _canResize(self, newsize):
-        if len(self._childoffsets):
-            lastChild = self._childoffsets[-1]
+        self._scanAll()
+
+        if len(self._children):
+            lastChild = self._children.last()
             ebmlID, ref, endOffset = self._children[lastChild]
 
             if newsize < endOffset or newsize == endOffset + 1:
@@ -720,7 +1545,8 @@ class EBMLMasterElementInFile(EBMLElement):
             raise ResizeError(f"Cannot resize to size {newsize}.")
 
         if isinstance(self.parent, EBMLMasterElementInFile):
-            self.parent._canResizeChild(self, newsize)
+            with self.root._metaLock:
+                self.parent._canResizeChild(self, newsize)
 
     def resize(self, newsize):
         """
@@ -735,80 +1561,108 @@ class EBMLMasterElementInFile(EBMLElement):
             self._resize(newsize)
 
     def _resize(self, newsize):
-        offset = self.offsetInParent
+        # Siblings resized at the same time update the index of the parent.
+        with self.root._metaLock:
+            offset = self.offsetInParent
+            self._scanAll()
+            self._dropIndex()
 
-        if len(self._childoffsets):
-            lastChild = self._childoffsets[-1]
-            ebmlID, ref, lastChildEnd = self._children[lastChild]
+            if isinstance(self.parent, EBMLMasterElementInFile):
+                self.parent._dropIndex()
 
-        elif newsize > 0:
-            lastChildEnd = 0
+            if len(self._children):
+                lastChild = self._children.last()
+                ebmlID, ref, lastChildEnd = self._children[lastChild]
 
-        if isinstance(self.parent, EBMLMasterElementInFile):
-            endOffset = self.dataOffsetInParent + newsize
+            elif newsize > 0:
+                lastChildEnd = 0
 
-            # Write void after element
-            nextSibling = self.parent._nextChild(self.offsetInParent)
+            if isinstance(self.parent, EBMLMasterElementInFile):
+                endOffset = self.dataOffsetInParent + newsize
 
-            if nextSibling is not None:
-                o = nextSibling
+                # Write void after element
+                nextSibling = self.parent._nextChild(self.offsetInParent)
 
-            else:
-                o = self.parent.dataSize
+                if nextSibling is not None:
+                    o = nextSibling
 
-        with NoInterrupt():
-            # Set element size in header
-            self.seek(-self._sizeLength)
-            self.file.write(toVint(newsize, self._sizeLength))
+                else:
+                    o = self.parent.dataSize
 
-            # Write void at end
-            if newsize > lastChildEnd:
-                self._writeVoid(lastChildEnd, newsize - lastChildEnd)
+            with self._noInterrupt():
+                # Set element size in header
+                self._write(-self._sizeLength,
+                            toVint(newsize, self._sizeLength))
 
-            if isinstance(self.parent, EBMLMasterElementInFile):
-                # Write void after element
-                if o > endOffset:
-                    self.parent._writeVoid(endOffset, o - endOffset)
+                # Write void at end
+                if newsize > lastChildEnd:
+                    self._writeVoid(lastChildEnd, newsize - lastChildEnd)
 
-                ebmlID, ref, _ = self.parent._children[offset]
-                self.parent._children[offset] = (ebmlID, ref, endOffset)
+                if isinstance(self.parent, EBMLMasterElementInFile):
+                    # Write void after element
+                    if o > endOffset:
+                        self.parent._writeVoid(endOffset, o - endOffset)
 
-            elif isfile(self.parent):
-                # Truncate file
-                self.seek(newsize)
-                self.file.truncate()
+                    ebmlID, ref, oldEnd = self.parent._children[offset]
+                    self.parent._children[offset] = (ebmlID, ref, endOffset)
 
-            self.dataSize = newsize
-            self.file.flush()
+                    if self.parent._free is not None:
+                        if endOffset > oldEnd:
+                            self.parent._free.allocate(oldEnd, endOffset)
 
-    def findFree(self, size, start=0):
-        with self.lock:
-            return self._findFree(size, start)
+                        else:
+                            self.parent._free.free(endOffset, oldEnd)
 
-    def _findFree(self, size, start=0):
-        if start == 1:
-            start = 2
+                elif isfile(self.parent):
+                    # Truncate file
+                    self._checkpoint()
+                    self._detachViews(self.dataOffsetInFile + newsize)
+                    self.seek(newsize)
+                    self.file.truncate()
 
-        for o in self._childoffsets:
-            (ebmlID, ref, endOffset) = self._children[o]
+                if self._free is not None:
+                    self._free.resize(self.dataSize, newsize)
 
-            if start == endOffset + 1:
-                start += 1
+                self.dataSize = newsize
+                self._scanned = newsize
+                self._flush()
 
-            if start > o:
-                continue
+    def findFree(self, size, start=0, fit="first", aligned=False):
+        """
+        Finds an offset at or after 'start' where a child of size 'size' can
+        be added, or returns None.
 
-            s = o - start
+        'fit' is "first" (lowest offset) or "best" (start of the smallest
+        gap that can hold it). If 'aligned' is set, the offset returned lies
+        on a block boundary in the file (first fit).
+        """
 
-            if s == size or s >= size + 2:
-                return start
+        with self.lock:
+            return self._findFree(size, start, fit, aligned)
+
+    def _freeSpace(self):
+        """Returns the FreeSpaceMap of this element, building it if needed."""
+        if self._free is None:
+            self._scanAll()
+            self._free = FreeSpaceMap.fromChildren(self._children.items(),
+                                                   self.dataSize)
+
+        return self._free
 
-            start = endOffset
+    def _findFree(self, size, start=0, fit="first", aligned=False):
+        free = self._freeSpace()
 
-        s = self.dataSize - start
+        if aligned:
+            return free.alignedFit(size, start, self.bsize,
+                                   self.dataOffsetInFile)
 
-        if s == size or s >= size + 2:
-            return start
+        if fit == "first":
+            return free.firstFit(size, start)
+
+        if fit == "best":
+            return free.bestFit(size, start)
+
+        raise ValueError(f"Invalid fit: {fit!r}.")
 
     def tell(self):
         """Returns file offset relative to start of offset."""
@@ -820,6 +1674,14 @@ class EBMLMasterElementInFile(EBMLElement):
     @classmethod
     def fromFile(cls, file, parent=None):
         offset = file.tell()
+        journal = None
+
+        if not isinstance(parent, EBMLMasterElementInFile) and cls.journaled:
+            # Operations cut short by a crash are completed before anything
+            # is read.
+            journal = cls._openJournal(file)
+            file.seek(offset)
+
         ebmlID = readVint(file)
         size = readVint(file)
 
@@ -842,8 +1704,13 @@ class EBMLMasterElementInFile(EBMLElement):
         else:
             offsetInParent = offset
             self._init(file, offsetInParent, fromVint(size), len(size))
+            self._journal = journal
+
+        with self.root._metaLock:
+            if not self._loadIndex():
+                # Children will be scanned for as they are needed.
+                self._scanned = 0
 
-        self.scan()
         return self
 
     def canPunchHole(self, offset, size):
@@ -888,9 +1755,12 @@ class EBMLMasterElementInFile(EBMLElement):
             self._punchHole(offset, size)
 
     def _punchHole(self, offset, size):
-        self.file.flush()
-        _fallocate(self.file, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
-                   self.dataOffsetInFile + offset, size)
+        self._checkpoint()
+
+        with self.root._metaLock:
+            self.file.flush()
+            _fallocate(self.file, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                       self.dataOffsetInFile + offset, size)
 
         prevChild = self.prevChild(offset)
         _, _, prevEnd = self._children.get(prev, (None, None, 0))
@@ -951,7 +1821,7 @@ class EBMLMasterElementInFile(EBMLElement):
 
     def collapseRange(self, offset, size):
         """Remove blocks via fallocate()."""
-        with self.lock:
+        with self.root.lock:
             self._canCollapseRange(offset, size)
             self._collapseRange(offset, size)
 
@@ -963,6 +1833,9 @@ class EBMLMasterElementInFile(EBMLElement):
         if nextChild is None:
             nextChild = self.dataSize
 
+        self._dropIndex()
+        self._invalidateFrom(offset)
+        self._checkpoint()
         self.file.flush()
         eof = self.file.seek(0, 2)
         self.seek(offset)
@@ -976,39 +1849,41 @@ class EBMLMasterElementInFile(EBMLElement):
                 _fallocate(self.file, FALLOC_FL_COLLAPSE_RANGE,
                         self.dataOffsetInFile + offset, size)
 
-            if nextChild - prevEnd - size >= 2:
-                self._writeVoid(prevEnd, nextChild - prevEnd - size)
+            self._checkpoint()
 
-            self._rangeCollapsed(offset, size)
+            with self._noInterrupt():
+                if nextChild - prevEnd - size >= 2:
+                    self._writeVoid(prevEnd, nextChild - prevEnd - size)
 
-    def _rangeCollapsed(self, offset, size):
-        K = bisect.bisect_left(self._childoffsets, offset)
+                self._rangeCollapsed(offset, size)
 
-        for k in range(K, len(self._childoffsets)):
-            o = self._childoffsets[k]
-            (ebmlID, ref, e) = self._children[o]
-            self._children[o - size] = (ebmlID, ref, e - size)
-            del self._children[o]
-            self._childoffsets[k] = o - size
+    def _invalidateFrom(self, offset):
+        """
+        Drops cached children starting at or past 'offset', and detaches
+        those read as views into the map, before data there is shifted in
+        (or truncated from) the file.
+        """
 
-            # Update .offsetInParent attribute in any child element
-            if isinstance(ref, weakref.ref):
-                obj = ref()
+        cache = self.root._cache
 
-                if isinstance(obj, EBMLMasterElementInFile):
-                    obj.offsetInParent -= size
+        if cache is not None:
+            cache.discardFrom(self.dataOffsetInFile + offset)
 
-                elif isinstance(obj, EBMLElement):
-                    ro = obj._readonly
-                    obj._readonly = False
-                    obj.offsetInParent -= size
-                    obj._readonly = ro
+        self._detachViews(self.dataOffsetInFile + offset)
+
+    def _rangeCollapsed(self, offset, size):
+        self._children.shift(offset, -size)
+        self._free = None
 
+        if self._scanned >= offset:
+            self._scanned -= size
+
+        self._liveChildrenMoved(offset, -size)
+        self._indexMoved(offset, -size)
 
         self.dataSize -= size
-        self.seek(-self._sizeLength)
-        self.file.write(toVint(self.dataSize, self._sizeLength))
-        self.file.flush()
+        self._write(-self._sizeLength, toVint(self.dataSize, self._sizeLength))
+        self._flush()
 
         if isinstance(self.parent, EBMLMasterElementInFile):
             (ebmlID, ref, endOffset) = self.parent._children[
@@ -1017,6 +1892,33 @@ class EBMLMasterElementInFile(EBMLElement):
             self.parent._children[self.offsetInParent] = (
                 ebmlID, ref, endOffset - size)
 
+    def _liveChildrenMoved(self, offset, delta):
+        """
+        Updates .offsetInParent in child elements that currently exist in
+        memory and start at or past 'offset'. (Offsets of the remaining
+        children are shifted lazily by the child index.)
+        """
+
+        for obj in list(self._liveChildren):
+            if obj.offsetInParent < offset:
+                continue
+
+            if isinstance(obj, EBMLMasterElementInFile):
+                obj.offsetInParent += delta
+
+            else:
+                ro = obj._readonly
+                obj._readonly = False
+                obj.offsetInParent += delta
+                obj._readonly = ro
+
+    def _indexMoved(self, offset, delta):
+        if self._indexOffset is not None and self._indexOffset >= offset:
+            self._indexOffset += delta
+            self._indexEnd += delta
+
+        self._dropIndex()
+
     def canInsertRange(self, offset, size):
         with self.lock:
             try:
@@ -1064,7 +1966,7 @@ class EBMLMasterElementInFile(EBMLElement):
 
     def insertRange(self, offset, size):
         """Insert blocks via fallocate()."""
-        with self.lock:
+        with self.root.lock:
             self._canInsertRange(offset, size)
             self._insertRange(offset, size)
 
@@ -1077,6 +1979,10 @@ class EBMLMasterElementInFile(EBMLElement):
         if nextChild is None:
             nextChild = self.dataSize
 
+        self._dropIndex()
+        self._invalidateFrom(offset)
+        self._checkpoint()
+        self.file.flush()
         eof = self.file.seek(0, 2)
         self.seek(offset)
 
@@ -1089,36 +1995,25 @@ class EBMLMasterElementInFile(EBMLElement):
                 _fallocate(self.file, FALLOC_FL_INSERT_RANGE,
                         self.dataOffsetInFile + offset, size)
 
-            self._writeVoid(prevEnd, nextChild - prevEnd + size)
-            self._rangeInserted(offset, size)
-
-    def _rangeInserted(self, offset, size):
-        K = bisect.bisect_left(self._childoffsets, offset)
+            self._checkpoint()
 
-        for k in reversed(range(K, len(self._childoffsets))):
-            o = self._childoffsets[k]
-            (ebmlID, ref, e) = self._children[o]
-            self._children[o + size] = (ebmlID, ref, e + size)
-            del self._children[o]
-            self._childoffsets[k] = o + size
+            with self._noInterrupt():
+                self._writeVoid(prevEnd, nextChild - prevEnd + size)
+                self._rangeInserted(offset, size)
 
-            # Update .offsetInParent attribute in any child element
-            if isinstance(ref, weakref.ref):
-                obj = ref()
+    def _rangeInserted(self, offset, size):
+        self._children.shift(offset, size)
+        self._free = None
 
-                if isinstance(obj, EBMLMasterElementInFile):
-                    obj.offsetInParent += size
+        if self._scanned >= offset:
+            self._scanned += size
 
-                elif isinstance(obj, EBMLElement):
-                    ro = obj._readonly
-                    obj._readonly = False
-                    obj.offsetInParent += size
-                    obj._readonly = ro
+        self._liveChildrenMoved(offset, size)
+        self._indexMoved(offset, size)
 
         self.dataSize += size
-        self.seek(-self._sizeLength)
-        self.file.write(toVint(self.dataSize, self._sizeLength))
-        self.file.flush()
+        self._write(-self._sizeLength, toVint(self.dataSize, self._sizeLength))
+        self._flush()
 
         if isinstance(self.parent, EBMLMasterElementInFile):
             (ebmlID, ref, endOffset) = self.parent._children[
@@ -1245,10 +2140,11 @@ class EBMLMasterElementInFile(EBMLElement):
         EBMLMasterElementInFile.
         """
 
-        with self.lock:
+        with self.readLock, self.root._metaLock:
             return self._childIsElementInFile(offset)
 
     def _childIsElementInFile(self, offset):
+        self._scanTo(offset)
         (ebmlID, _, _) = self._children[offset]
         cls = self._childTypes.get(ebmlID)
 
@@ -1262,14 +2158,14 @@ class EBMLMasterElementInFile(EBMLElement):
         and end to block boundaries.
         """
 
-        with self.lock:
+        with self.root.lock:
             return self._tryCollapseRange(start, end)
 
     def _tryCollapseRange(self, start, end):
         start = self._findOpenBoundary(start)
         end = self._rfindOpenBoundary(end)
 
-        if start < end:
+        if start is not None and end is not None and start < end:
             try:
                 self._canCollapseRange(start, end - start)
 
@@ -1299,22 +2195,60 @@ class EBMLMasterElementInFile(EBMLElement):
         self._moveChildElement(offset, newoffset)
         return True
 
+    def cacheInfo(self):
+        """
+        Returns statistics of the cache of children of the file (see
+        cacheSize), as a CacheInfo(hits, misses, evictions, count, size,
+        maxsize) named tuple, or None if there is no cache.
+        """
+
+        cache = self.root._cache
+
+        if cache is not None:
+            return cache.info()
+
+    def clearCache(self):
+        """Empties the cache of children of the file, if any."""
+        cache = self.root._cache
+
+        if cache is not None:
+            cache.clear()
+
+    def compactor(self, maxsize=4*1024**2, rate=None):
+        """
+        Returns a Compactor (see ebml.compact), for compacting this element
+        in steps, moving only children of up to 'maxsize' bytes, and copying
+        at most 'rate' bytes per second.
+        """
+
+        return Compactor(self, maxsize, rate)
+
+    def compact(self, maxsize=4*1024**2, rate=None):
+        """
+        Compacts this element and its descendants (see compactor()). The
+        lock is only held for one step at a time.
+        """
+
+        self.compactor(maxsize, rate).run()
+
     def quickTrim(self, maxsize=4*1024**2):
         """
         Make element smaller by moving only small elements and
         removing blocks from file.
         """
 
-        with self.lock:
+        with self.root.lock:
             self._quickTrim(maxsize)
 
     def _quickTrim(self, maxsize=4*1024**2):
-        for k in range(len(self._childoffsets)):
-            offset = self._childoffsets[k]
+        self._scanAll()
+
+        for k in range(len(self._children)):
+            offset = self._children.at(k)
             (ebmlID, _, endOffset) = self._children[offset]
 
             if k > 0:
-                prevChild = self._childoffsets[k-1]
+                prevChild = self._children.at(k - 1)
                 (prevEbmlID, _, prevEnd) = self._children[prevChild]
 
             else:
@@ -1335,7 +2269,7 @@ class EBMLMasterElementInFile(EBMLElement):
                       and self._childIsElementInFile(prevChild)):
                     newoffset = self._findOpenBoundary(prevEnd)
 
-                    if newOffset < offset:
+                    if newoffset is not None and newoffset < offset:
                         self._tryMoveChildElement(offset, newoffset)
 
                 elif prevEnd < offset:
@@ -1344,8 +2278,8 @@ class EBMLMasterElementInFile(EBMLElement):
             else:
                 self._tryCollapseRange(prevEnd, offset)
 
-        if len(self._childoffsets):
-            offset = self._childoffsets[-1]
+        if len(self._children):
+            offset = self._children.last()
             (_, _, offset) = self._children[offset]
             offset = self._findOpenBoundary(offset)
 
@@ -1356,8 +2290,7 @@ class EBMLMasterElementInFile(EBMLElement):
             try:
                 self._canResize(offset)
 
-            except WriteError:
-                print(self)
+            except (ResizeError, WriteError):
                 pass
 
             else:
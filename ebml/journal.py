@@ -0,0 +1,216 @@
+"""
+Write-ahead journal for EBMLMasterElementInFile.
+
+Writes made to a file (Void headers, size fields, child data, etc.) are
+first appended to a sidecar journal as transactions, one per operation, and
+only then performed on the file itself. Should the process (or, depending
+on the sync policy, the machine) crash part way through an operation, the
+journal is replayed the next time the file is opened, so that no operation
+is left half-written.
+
+Each transaction is stored as a header (b"EWAL" and the length of the
+payload), a payload consisting of (offset, length, data) records, and the
+CRC-32 of the payload. A torn transaction at the end of the journal is
+ignored on replay. The journal is emptied whenever the file is flushed
+(see EBMLMasterElementInFile.flush()), so that a journal that is not empty
+is left behind by a crash (or by a writer that has yet to flush).
+"""
+
+import os
+import struct
+import time
+import zlib
+
+__all__ = ["Journal"]
+
+
+class Journal(object):
+    """
+    Journal(path, policy="operation", every=64, interval=1.0,
+            limit=64*1024**2)
+
+    Write-ahead journal stored at 'path'. 'policy' controls when the journal
+    is synced to disk with os.fsync():
+
+        "operation": after every transaction.
+        "count": after every 'every' transactions.
+        "time": after a transaction, if more than 'interval' seconds have
+            passed since the last sync.
+        "none": never (only process crashes are survived).
+
+    Once the journal grows past 'limit' bytes, the file it protects is
+    synced and the journal emptied (see checkpoint()).
+    """
+
+    policies = ("operation", "count", "time", "none")
+    magic = b"EWAL"
+    _header = struct.Struct(">4sQ")
+    _record = struct.Struct(">QI")
+    _crc = struct.Struct(">I")
+
+    def __init__(self, path, policy="operation", every=64, interval=1.0,
+                 limit=64*1024**2):
+        if policy not in self.policies:
+            raise ValueError(f"Invalid sync policy: {policy!r}.")
+
+        self.path = path
+        self.policy = policy
+        self.every = every
+        self.interval = interval
+        self.limit = limit
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+
+    @staticmethod
+    def pending(path):
+        """Checks if the journal at 'path' holds any transactions."""
+
+        try:
+            return os.path.getsize(path) > 0
+
+        except FileNotFoundError:
+            return False
+
+    def __len__(self):
+        return self._size
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def append(self, writes):
+        """
+        Appends a transaction consisting of (offset, data) pairs, and syncs
+        the journal if the sync policy calls for it. The writes must not be
+        performed on the file before this returns.
+        """
+
+        parts = []
+
+        for (offset, data) in writes:
+            parts.append(self._record.pack(offset, len(data)))
+            parts.append(data)
+
+        payload = b"".join(parts)
+        transaction = memoryview(b"".join([
+            self._header.pack(self.magic, len(payload)), payload,
+            self._crc.pack(zlib.crc32(payload))]))
+
+        while transaction:
+            transaction = transaction[os.write(self._fd, transaction):]
+
+        self._size += self._header.size + len(payload) + self._crc.size
+        self._unsynced += 1
+
+        if (self.policy == "operation"
+                or (self.policy == "count" and self._unsynced >= self.every)
+                or (self.policy == "time" and time.monotonic()
+                    - self._lastSync >= self.interval)):
+            self.sync()
+
+    def applied(self, file):
+        """
+        To be called once the writes of a transaction have been performed
+        on 'file'. Checkpoints if the journal has grown past its limit.
+        """
+
+        if self._size > self.limit:
+            self.checkpoint(file)
+
+    def sync(self):
+        """Makes every transaction appended so far durable."""
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = 0
+
+        self._lastSync = time.monotonic()
+
+    def checkpoint(self, file):
+        """
+        Syncs 'file' and empties the journal. Must be done before 'file' is
+        changed in any way that is not journaled (e.g., by moving data or by
+        fallocate), as replaying earlier transactions afterwards would
+        corrupt it.
+        """
+
+        file.flush()
+        os.fsync(file.fileno())
+
+        if self._size:
+            os.ftruncate(self._fd, 0)
+            os.fsync(self._fd)
+            self._size = 0
+
+        self._unsynced = 0
+        self._lastSync = time.monotonic()
+
+    def transactions(self):
+        """
+        Yields the committed transactions in the journal, as lists of
+        (offset, data) pairs, stopping at the first torn one.
+        """
+
+        pos = 0
+        header = self._header
+        record = self._record
+
+        while True:
+            head = os.pread(self._fd, header.size, pos)
+
+            if len(head) < header.size:
+                return
+
+            (magic, length) = header.unpack(head)
+
+            if magic != self.magic:
+                return
+
+            payload = os.pread(self._fd, length + self._crc.size,
+                               pos + header.size)
+
+            if len(payload) < length + self._crc.size:
+                return
+
+            (crc,) = self._crc.unpack_from(payload, length)
+            payload = memoryview(payload)[:length]
+
+            if zlib.crc32(payload) != crc:
+                return
+
+            writes = []
+            k = 0
+
+            while k < length:
+                (offset, size) = record.unpack_from(payload, k)
+                k += record.size
+                writes.append((offset, payload[k:k + size]))
+                k += size
+
+            yield writes
+            pos += header.size + length + self._crc.size
+
+    def replay(self, file):
+        """
+        Performs the writes of every committed transaction on 'file', then
+        checkpoints. Returns the number of transactions replayed.
+        """
+
+        count = 0
+
+        for writes in self.transactions():
+            for (offset, data) in writes:
+                file.seek(offset)
+                file.write(data)
+
+            count += 1
+
+        if self._size:
+            self.checkpoint(file)
+
+        return count
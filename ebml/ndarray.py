@@ -1,6 +1,7 @@
 import numpy
 from ebml.base import EBMLInteger, EBMLString, EBMLData, EBMLMasterElement, EBMLList, EBMLProperty
-from ebml.util import toVint, fromVint, parseVints, parseElements
+from ebml.util import (toVint, fromVint, parseVints, parseElements,
+                       encodeVints, encodeVintsInto, decodeVints, vintsSize)
 
 class TypeString(EBMLString):
     ebmlID = b"\x91"
@@ -20,13 +21,19 @@ class Shape(EBMLData):
 
     @classmethod
     def _fromBytes(cls, data, parent=None):
-        return cls(tuple(fromVint(b) for b in parseVints(data)), parent=parent)
+        return cls(tuple(decodeVints(data).tolist()), parent=parent)
 
     def _toBytes(self):
-        return b"".join(toVint(k) for k in self.data)
+        return bytes(encodeVints(self.data))
+
+    def _encodeInto(self, buffer, offset):
+        if type(self)._toBytes is not Shape._toBytes:
+            return super()._encodeInto(buffer, offset)
+
+        return encodeVintsInto(self.data, buffer, offset)
 
     def _size(self):
-        return sum(len(toVint(k)) for k in self.data)
+        return vintsSize(self.data)
 
 class FieldName(EBMLString):
     ebmlID = b"\xa1"
@@ -188,6 +195,42 @@ class EBMLNDArray(EBMLData):
     def _toBytes(self):
         return self.dtype.toBytes() + self.shape.toBytes() + EBMLArrayData(bytes(self.data)).toBytes()
 
+    def _encodeInto(self, buffer, offset):
+        if type(self)._toBytes is not EBMLNDArray._toBytes:
+            return super()._encodeInto(buffer, offset)
+
+        offset = self.dtype._encodeElementInto(buffer, offset)
+        offset = self.shape._encodeElementInto(buffer, offset)
+
+        # Copy array data straight into the buffer rather than through
+        # an intermediate EBMLArrayData element.
+        data = numpy.ascontiguousarray(self.data)
+        head = EBMLArrayData.ebmlID + toVint(data.nbytes)
+        buffer[offset:offset + len(head)] = head
+        offset += len(head)
+
+        if data.nbytes:
+            buffer[offset:offset + data.nbytes] = memoryview(data).cast("B")
+
+        return offset + data.nbytes
+
+    def _writeContents(self, writer):
+        cls = type(self)
+
+        if (cls._toBytes is not EBMLNDArray._toBytes
+                or cls._encodeInto is not EBMLNDArray._encodeInto):
+            return super()._writeContents(writer)
+
+        self.dtype._writeElement(writer)
+        self.shape._writeElement(writer)
+
+        # Hand the array memory to the writer as-is instead of copying it.
+        data = numpy.ascontiguousarray(self.data)
+        writer.write(EBMLArrayData.ebmlID + toVint(data.nbytes))
+
+        if data.nbytes:
+            writer.write(memoryview(data).cast("B"))
+
     def _size(self):
         datasize = self.data.size*self.data.itemsize
         return self.dtype.size() + self.shape.size() + len(EBMLArrayData.ebmlID) + len(toVint(datasize)) + datasize
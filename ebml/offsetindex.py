@@ -0,0 +1,157 @@
+"""
+Offset index for master elements in a file.
+
+An OffsetIndex element is written as the last child of a master element,
+listing the offset, end offset and EBML ID of every other child (similar to
+Matroska's SeekHead/Cues), so that the element can be opened without reading
+every child header. It ends with a fixed-width IndexLength element, so that
+it can be found by reading the last few bytes of its parent.
+"""
+
+from .base import EBMLInteger, EBMLData, EBMLMasterElement, EBMLProperty
+from .vint import encodeVints, decodeVints, parseVints, readVint, fromVint
+
+__all__ = ["IndexedSize", "IndexedIDs", "IndexedChildren", "IndexLength",
+           "OffsetIndex", "readIndex"]
+
+
+class IndexedSize(EBMLInteger):
+    """Data size of the parent element when the index was written."""
+    ebmlID = b"\x81"
+
+    def _size(self):
+        return 8
+
+class IndexedIDs(EBMLData):
+    """EBML IDs of indexed children, concatenated."""
+    ebmlID = b"\x82"
+
+class IndexedChildren(EBMLData):
+    """
+    Vint triples (gap, size, k) for each child in order, where 'gap' is the
+    distance from the end of the previous child, and 'k' indexes
+    IndexedIDs.
+    """
+    ebmlID = b"\x83"
+
+class IndexLength(EBMLInteger):
+    """Total size of the OffsetIndex element, including its header."""
+    ebmlID = b"\x84"
+
+    def _size(self):
+        return 8
+
+class OffsetIndex(EBMLMasterElement):
+    ebmlID = b"\x1f\x1d\xe8\x5a"
+    __ebmlchildren__ = (
+            EBMLProperty("indexedSize", IndexedSize),
+            EBMLProperty("indexedIDs", IndexedIDs),
+            EBMLProperty("indexedChildren", IndexedChildren),
+            EBMLProperty("indexLength", IndexLength),
+        )
+
+    # ID, size and data of IndexLength.
+    footerSize = 10
+
+    @classmethod
+    def fromChildren(cls, offsets, ebmlIDs, ends, dataSize):
+        """
+        Builds an index of children with the given offsets, EBML IDs and end
+        offsets (in increasing order of offset), for a parent element of data
+        size 'dataSize'.
+        """
+        # NumPy is slow to import, so this is deferred until an index is
+        # actually used.
+        import numpy
+
+        ids = {}
+        idindices = [ids.setdefault(ebmlID, len(ids)) for ebmlID in ebmlIDs]
+
+        offsets = numpy.array(offsets, dtype=numpy.int64)
+        ends = numpy.array(ends, dtype=numpy.int64)
+        triples = numpy.empty((len(offsets), 3), dtype=numpy.int64)
+        triples[:, 0] = offsets
+        triples[1:, 0] -= ends[:-1]
+        triples[:, 1] = ends - offsets
+        triples[:, 2] = idindices
+
+        self = cls(IndexedSize(dataSize), IndexedIDs(b"".join(ids)),
+                   IndexedChildren(bytes(encodeVints(triples.ravel()))),
+                   IndexLength(0))
+        self.indexLength = self.size()
+        return self
+
+    def toChildren(self):
+        """
+        Returns lists (offsets, ebmlIDs, ends) of the indexed children.
+        """
+        import numpy
+
+        ids = list(parseVints(self.indexedIDs))
+        triples = decodeVints(self.indexedChildren).astype(numpy.int64)
+        triples = triples.reshape(-1, 3)
+        ends = numpy.cumsum(triples[:, 0] + triples[:, 1])
+        offsets = ends - triples[:, 1]
+        ebmlIDs = [ids[k] for k in triples[:, 2].tolist()]
+        return (offsets.tolist(), ebmlIDs, ends.tolist())
+
+
+def readIndex(file, dataOffsetInFile, dataSize):
+    """
+    readIndex(file, dataOffsetInFile, dataSize)
+
+    Reads the OffsetIndex at the end of the data of a master element, if one
+    is present and was written for an element of size 'dataSize'. The first
+    and last indexed children are checked against the headers found in the
+    file. Returns (offset, offsets, ebmlIDs, ends), with offsets relative to
+    the start of the data, or None.
+    """
+
+    footerSize = OffsetIndex.footerSize
+
+    if dataSize < footerSize:
+        return
+
+    file.seek(dataOffsetInFile + dataSize - footerSize)
+    footer = file.read(footerSize)
+
+    if footer[:2] != IndexLength.ebmlID + b"\x88":
+        return
+
+    length = int.from_bytes(footer[2:], "big")
+
+    if not footerSize < length <= dataSize:
+        return
+
+    offset = dataSize - length
+    file.seek(dataOffsetInFile + offset)
+
+    try:
+        index = OffsetIndex.fromBytes(file.read(length))
+
+    except Exception:
+        return
+
+    if index.indexedSize != dataSize or index.indexLength != length:
+        return
+
+    (offsets, ebmlIDs, ends) = index.toChildren()
+
+    if offsets and ends[-1] > offset:
+        return
+
+    for k in {0, len(offsets) - 1} if offsets else ():
+        file.seek(dataOffsetInFile + offsets[k])
+
+        try:
+            ebmlID = readVint(file)
+            size = readVint(file)
+
+        except Exception:
+            return
+
+        if (ebmlID != ebmlIDs[k] or offsets[k] + len(ebmlID) + len(size)
+                + fromVint(size) != ends[k]):
+            return
+
+    return (offset, offsets, ebmlIDs, ends)
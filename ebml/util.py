@@ -1,23 +1,31 @@
 import ast
+import collections
+import io
+import os
+import mmap
+import sys
 import types
 import signal
-import ctypes
-import ctypes.util
+import marshal
+import atexit
 import threading
 
-c_off_t = ctypes.c_int64
-
 
 from ebml.exceptions import UnexpectedEndOfData
 
 # Imports for compatibility purposes, in case some modules still expect these
 # functions to still be here.
 from .vint import (detectVintSize, getVintSize, fromVint, toVint, parseVint,
-                   parseVints, readVint, peekVint, parseFile, parseElements)
+                   parseVints, readVint, peekVint, parseFile, parseElements,
+                   asBuffer)
+from .vint import encodeVints, encodeVintsInto, decodeVints, vintsSize
 
 
 def toVints(a):
-    return b"".join(map(toVint, a))
+    if not hasattr(a, "__len__"):
+        a = list(a)
+
+    return bytes(encodeVints(a))
 
 
 def formatBytes(data):
@@ -35,6 +43,12 @@ class Constant(object):
         return self.value
 
 def make_fallocate():
+    # ctypes (and ctypes.util in particular) is slow to import, so this is
+    # deferred until fallocate is first needed.
+    import ctypes
+    import ctypes.util
+
+    c_off_t = ctypes.c_int64
     libc_name = ctypes.util.find_library('c')
     libc = ctypes.CDLL(libc_name)
 
@@ -52,14 +66,239 @@ def make_fallocate():
 
     return fallocate
 
-_fallocate = make_fallocate()
-del make_fallocate
+_fallocateImpl = None
+
+def _fallocate(fd, mode, offset, len_):
+    global _fallocateImpl
+
+    if _fallocateImpl is None:
+        _fallocateImpl = make_fallocate()
+
+    result = _fallocateImpl(fd, mode, offset, len_)
+
+    if isinstance(fd, MappedFile):
+        # Collapsing or inserting a range changes the size of the file.
+        fd._remap()
+
+    elif isinstance(fd, PagedFile):
+        # Collapsing or inserting a range shifts the rest of the file.
+        fd.invalidate(offset, None if mode & (FALLOC_FL_COLLAPSE_RANGE
+                                              | FALLOC_FL_INSERT_RANGE)
+                      else len_)
+
+    return result
 
 FALLOC_FL_KEEP_SIZE = 0x01
 FALLOC_FL_PUNCH_HOLE = 0x02
 FALLOC_FL_COLLAPSE_RANGE = 0x08
 FALLOC_FL_INSERT_RANGE = 0x20
 
+# ioctl request for cloning (reflinking) a range of blocks between files.
+FICLONERANGE = 0x4020940d
+
+def _cloneRange(fd, src, dst, size):
+    """
+    Makes [dst, dst + size) in file descriptor 'fd' share the blocks of
+    [src, src + size) with FICLONERANGE. Returns False if the file system
+    does not support it (or the ranges are not block-aligned or overlap).
+    """
+
+    import fcntl
+    import struct
+
+    try:
+        fcntl.ioctl(fd, FICLONERANGE, struct.pack("qQQQ", fd, src, size, dst))
+
+    except (OSError, ValueError):
+        return False
+
+    return True
+
+def _pieces(size, chunk, reverse):
+    """
+    Yields (start, length) of the 'chunk'-sized pieces of 'size' bytes,
+    last to first if 'reverse' is set.
+    """
+
+    starts = range(0, size, chunk)
+
+    for start in reversed(starts) if reverse else starts:
+        yield (start, min(chunk, size - start))
+
+def _copyRange(file, src, dst, size, blksize=None, bufsize=8*1024**2):
+    """
+    Copies 'size' bytes within 'file' from offset 'src' to offset 'dst' (the
+    ranges may overlap). Block-aligned copies are cloned where the file
+    system supports it, and other copies are made in the kernel with
+    os.copy_file_range(), falling back to copying through a buffer of up to
+    'bufsize' bytes. When moving data forward, it is copied last piece
+    first, so that no piece overwrites data yet to be copied.
+    """
+
+    if size <= 0 or src == dst:
+        return
+
+    # Cached pages of the destination are dropped once the copy is done.
+    changed = (dst, size)
+
+    distance = abs(dst - src)
+    forward = dst > src
+    file.flush()
+
+    try:
+        fd = file.fileno()
+
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fd = None
+
+    # Kernel copies within a file must not overlap, so each is at most
+    # 'distance' bytes; not worth it if that makes for many small ones.
+    kernel = fd is not None and distance >= min(size, 1024**2)
+
+    if (kernel and blksize and distance >= size
+            and not (src % blksize or dst % blksize or size % blksize)
+            and _cloneRange(fd, src, dst, size)):
+        size = 0
+
+    elif kernel and hasattr(os, "copy_file_range"):
+        for (start, n) in _pieces(size, min(distance, 1024**3), forward):
+            while n:
+                try:
+                    copied = os.copy_file_range(fd, fd, n, src + start,
+                                                dst + start)
+
+                except OSError:
+                    copied = 0
+
+                if not copied:
+                    break
+
+                (start, n) = (start + copied, n - copied)
+
+            if n:
+                # Copy what is left of this piece, and the pieces still to
+                # come, through a buffer.
+                if forward:
+                    size = start + n
+
+                else:
+                    (src, dst, size) = (src + start, dst + start,
+                                        size - start)
+
+                break
+
+        else:
+            size = 0
+
+    if size:
+        buf = memoryview(bytearray(min(size, bufsize)))
+
+        for (start, n) in _pieces(size, len(buf), forward):
+            view = buf[:n]
+            file.seek(src + start)
+            got = file.readinto(view)
+
+            if got != n:
+                raise UnexpectedEndOfData(
+                    f"Expected {n} bytes at offset {src + start}, got {got}.")
+
+            file.seek(dst + start)
+            file.write(view)
+
+    if fd is not None:
+        file.flush()
+
+        # Drops any data the file object has read ahead from before the
+        # copy (seeking to the end bypasses its buffer).
+        file.seek(0, 2)
+
+        if isinstance(file, PagedFile):
+            file.invalidate(*changed)
+
+
+# Cache of compiled generated code (see compileCached), optionally persisted
+# to disk with enableCodeCache() or the EBML_CODE_CACHE environment variable.
+_codeCache = {}
+_codeCachePath = None
+_codeCacheDirty = False
+
+
+def compileCached(key, build, filename):
+    """
+    compileCached(key, build, filename)
+
+    Returns the code object cached under 'key' (a string). On a miss, 'build()'
+    is called to produce source or an AST module, which is compiled and cached.
+    """
+    global _codeCacheDirty
+
+    code = _codeCache.get(key)
+
+    if code is None:
+        code = _codeCache[key] = compile(build(), filename, "exec")
+        _codeCacheDirty = _codeCachePath is not None
+
+    return code
+
+
+def enableCodeCache(path):
+    """
+    enableCodeCache(path)
+
+    Persists generated code (e.g., the __init__ and _decodeData methods of
+    element classes) in a file under directory 'path', so that later imports
+    of the same schema skip code generation and compilation. The cache is
+    loaded immediately and saved at exit.
+
+    Call before any element classes are defined, or set the EBML_CODE_CACHE
+    environment variable instead.
+    """
+    global _codeCachePath
+
+    os.makedirs(path, exist_ok=True)
+    _codeCachePath = os.path.join(path, f"ebml-codegen.{sys.implementation.cache_tag}.marshal")
+
+    try:
+        with open(_codeCachePath, "rb") as f:
+            cached = marshal.load(f)
+
+    except (OSError, EOFError, ValueError, TypeError):
+        cached = {}
+
+    if isinstance(cached, dict):
+        for key, code in cached.items():
+            _codeCache.setdefault(key, code)
+
+    atexit.register(saveCodeCache)
+
+
+def saveCodeCache():
+    """Writes the code cache enabled with enableCodeCache() if anything changed."""
+    global _codeCacheDirty
+
+    if _codeCachePath is None or not _codeCacheDirty:
+        return
+
+    tmp = f"{_codeCachePath}.{os.getpid()}.tmp"
+
+    try:
+        with open(tmp, "wb") as f:
+            marshal.dump(_codeCache, f)
+
+        os.replace(tmp, _codeCachePath)
+        _codeCacheDirty = False
+
+    except OSError:
+        try:
+            os.unlink(tmp)
+
+        except OSError:
+            pass
+
+
+if os.environ.get("EBML_CODE_CACHE"):
+    enableCodeCache(os.environ["EBML_CODE_CACHE"])
+
 
 class NoInterrupt(object):
     """
@@ -84,3 +323,700 @@ class NoInterrupt(object):
                 self._old_handler(*self._signal_received)
 
 
+class IntentLock(object):
+    """
+    Reentrant lock for hierarchical (multi-granularity) locking, with modes
+    "IS" (intent shared), "IX" (intent exclusive), "S" (shared) and "X"
+    (exclusive). Locking a node of a tree in "S" or "X" mode covers its
+    whole subtree, provided every ancestor is first locked, from the top
+    down, in "IS" or "IX" mode respectively. A mode is granted to a thread
+    once it is compatible with the modes held by every other thread:
+
+              IS  IX  S   X
+        IS    y   y   y   -
+        IX    y   y   -   -
+        S     y   -   y   -
+        X     -   -   -   -
+
+    A thread can acquire the lock several times, in any mode, except that a
+    thread holding it only in "IS" or "S" mode cannot acquire it in "IX" or
+    "X" mode (RuntimeError), as two such threads would deadlock. (Two
+    threads that both hold "IX" and both request "X" deadlock likewise.)
+    Threads waiting for "X" are given priority over threads that do not
+    hold the lock yet. Used as a context manager, it is held in "X" mode.
+    """
+
+    _compatible = {"IS": ("IS", "IX", "S"), "IX": ("IS", "IX"),
+                   "S": ("IS", "S"), "X": ()}
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._counts = dict.fromkeys(self._compatible, 0)
+        self._held = {}
+        self._waiting = 0
+
+    def _grantable(self, mode, mine):
+        compatible = self._compatible[mode]
+
+        for (m, count) in self._counts.items():
+            if count > mine.get(m, 0) and m not in compatible:
+                return False
+
+        return True
+
+    def acquire(self, mode="X", blocking=True, timeout=-1):
+        me = threading.get_ident()
+
+        with self._cond:
+            mine = self._held.get(me)
+
+            if mine is None:
+                mine = {}
+                ready = lambda: (self._grantable(mode, mine)
+                                 and (mode == "X" or not self._waiting))
+
+            elif mine.get("X"):
+                ready = lambda: True
+
+            else:
+                if (mode in ("IX", "X")
+                        and not mine.get("IX") and not mine.get("X")):
+                    raise RuntimeError(
+                        f"Cannot acquire lock in mode {mode!r} while "
+                        "holding it only in shared modes.")
+
+                ready = lambda: self._grantable(mode, mine)
+
+            if ready():
+                acquired = True
+
+            elif not blocking:
+                acquired = False
+
+            else:
+                if mode == "X":
+                    self._waiting += 1
+
+                try:
+                    acquired = self._cond.wait_for(
+                        ready, None if timeout < 0 else timeout)
+
+                finally:
+                    if mode == "X":
+                        self._waiting -= 1
+
+                        if not self._waiting:
+                            # Let in threads held back for us.
+                            self._cond.notify_all()
+
+            if acquired:
+                mine[mode] = mine.get(mode, 0) + 1
+                self._held[me] = mine
+                self._counts[mode] += 1
+
+            return acquired
+
+    def isHeld(self):
+        """Checks if the current thread holds the lock, in any mode."""
+        return threading.get_ident() in self._held
+
+    def release(self, mode="X"):
+        me = threading.get_ident()
+
+        with self._cond:
+            mine = self._held.get(me)
+
+            if not mine or not mine.get(mode):
+                raise RuntimeError(
+                    f"Cannot release lock not held in mode {mode!r}.")
+
+            mine[mode] -= 1
+            self._counts[mode] -= 1
+
+            if not mine[mode]:
+                del mine[mode]
+
+                if not mine:
+                    del self._held[me]
+
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+
+def _pread(file, size, offset):
+    """
+    Reads up to 'size' bytes at 'offset' in 'file' without using or moving
+    its file position, so that several threads can read from it at once.
+    Returns a memoryview into the map if 'file' is a MappedFile.
+    """
+
+    if isinstance(file, MappedFile):
+        return file.pview(size, offset)
+
+    if isinstance(file, PagedFile):
+        return file.pread(size, offset)
+
+    return os.pread(file.fileno(), size, offset)
+
+
+def _willneed(file, offset, size):
+    """
+    Advises the kernel that 'size' bytes at 'offset' in 'file' will be read
+    soon (POSIX_FADV_WILLNEED), so that it starts reading them in. Does
+    nothing where posix_fadvise() is unavailable.
+    """
+
+    if not hasattr(os, "posix_fadvise") or size <= 0:
+        return
+
+    try:
+        os.posix_fadvise(file.fileno(), offset, size, os.POSIX_FADV_WILLNEED)
+
+    except (AttributeError, io.UnsupportedOperation, OSError):
+        pass
+
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+if IOV_MAX <= 0:
+    IOV_MAX = 1024
+
+
+class VectorWriter(object):
+    """
+    Gathers buffers and writes them to a file in batches, so that element
+    trees can be streamed to disk without being encoded into a single buffer
+    first. When the file is backed by a file descriptor, each batch is
+    written with a single os.writev() call.
+
+    Buffers passed to write() must not be modified until flush() is called.
+    """
+
+    def __init__(self, file, batchsize=1048576):
+        self.file = file
+        self.batchsize = batchsize
+        self._buffers = []
+        self._pending = 0
+
+        try:
+            self._fd = file.fileno() if hasattr(os, "writev") else None
+
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            self._fd = None
+
+        try:
+            self._seekable = self._fd is not None and file.seekable()
+
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            self._seekable = False
+
+    def write(self, data):
+        data = memoryview(data).cast("B") if not isinstance(data, bytes) else data
+        size = len(data)
+
+        if not size:
+            return
+
+        if len(self._buffers) >= IOV_MAX or self._pending + size > self.batchsize:
+            self.flush()
+
+        self._buffers.append(data)
+        self._pending += size
+
+    def flush(self):
+        buffers = self._buffers
+
+        if not buffers:
+            return
+
+        self._buffers = []
+        self._pending = 0
+
+        if self._fd is None:
+            if len(buffers) == 1:
+                self.file.write(buffers[0])
+
+            else:
+                self.file.write(b"".join(buffers))
+
+            return
+
+        # Anything still sitting in the file object's own buffer has to
+        # reach the descriptor before we write to it directly.
+        self.file.flush()
+
+        if self._seekable:
+            offset = self.file.tell()
+
+        else:
+            offset = None
+
+        written = self._writev(buffers, offset)
+
+        if isinstance(self.file, PagedFile):
+            # Written behind the back of the page cache.
+            self.file.invalidate(offset, written)
+
+        if self._seekable:
+            # Move the file object past what was written.
+            self.file.seek(offset + written)
+
+    def _writev(self, buffers, offset=None):
+        total = 0
+        k = 0
+
+        while k < len(buffers):
+            if offset is not None and hasattr(os, "pwritev"):
+                # Write at the offset of the file object rather than that of
+                # the descriptor, which file-like wrappers (e.g., MappedFile)
+                # need not keep in sync.
+                n = os.pwritev(self._fd, buffers[k:k + IOV_MAX],
+                               offset + total)
+
+            else:
+                n = os.writev(self._fd, buffers[k:k + IOV_MAX])
+
+            total += n
+
+            # Drop buffers that were written in full, and retry the rest
+            # of a partially written buffer.
+            while k < len(buffers) and n >= len(buffers[k]):
+                n -= len(buffers[k])
+                k += 1
+
+            if n:
+                buffers[k] = memoryview(buffers[k])[n:]
+
+        return total
+
+
+class MappedFile(object):
+    """
+    File-like wrapper around a shared memory map of 'file'. Reads and
+    in-place writes are served from the map, without system calls, and
+    view() returns read-only memoryviews of file contents without copying.
+    Writes past the end of the map and truncate() go to the file
+    descriptor, and the map is recreated as needed.
+
+    Once wrapped, 'file' should only be accessed through the wrapper, as its
+    own buffers are bypassed. Views obtained from view() or getbuffer() must
+    not be used past the end of the file after it has been truncated.
+    """
+
+    def __init__(self, file):
+        file.flush()
+        self.file = file
+        self.mode = file.mode
+
+        if hasattr(file, "name"):
+            self.name = file.name
+
+        self._fd = file.fileno()
+        self._writable = file.writable()
+        self._pos = file.tell()
+        self._map = None
+        self._remap()
+
+    def _remap(self):
+        size = os.fstat(self._fd).st_size
+
+        if self._map is not None and len(self._map) == size:
+            return
+
+        if size == 0:
+            # Empty files cannot be mapped.
+            self._map = None
+            return
+
+        access = mmap.ACCESS_WRITE if self._writable else mmap.ACCESS_READ
+
+        # The old map is not closed, as views of it may still be in use. It
+        # is unmapped once they are released.
+        self._map = mmap.mmap(self._fd, size, access=access)
+
+    def _span(self, size):
+        pos = self._pos
+
+        if (self._map is None or size is None or size < 0
+                or pos + size > len(self._map)):
+            self._remap()
+
+        if self._map is None:
+            return (pos, pos)
+
+        n = len(self._map)
+
+        if size is None or size < 0:
+            return (pos, max(pos, n))
+
+        return (pos, max(pos, min(pos + size, n)))
+
+    def read(self, size=-1):
+        (start, end) = self._span(size)
+        self._pos = end
+
+        if start == end:
+            return b""
+
+        return self._map[start:end]
+
+    def view(self, size=-1):
+        """Like read(), but returns a read-only memoryview into the map."""
+        (start, end) = self._span(size)
+        self._pos = end
+
+        if start == end:
+            return memoryview(b"")
+
+        return memoryview(self._map)[start:end].toreadonly()
+
+    def pview(self, size, offset):
+        """
+        Like view(), but at 'offset', leaving the file position alone (see
+        os.pread()).
+        """
+
+        m = self._map
+
+        if m is None or offset + size > len(m):
+            self._remap()
+            m = self._map
+
+        if m is None or offset >= len(m):
+            return memoryview(b"")
+
+        return memoryview(m)[offset:offset + size].toreadonly()
+
+    def readinto(self, buffer):
+        buffer = memoryview(buffer).cast("B")
+        (start, end) = self._span(len(buffer))
+
+        if end > start:
+            buffer[:end - start] = self._map[start:end]
+
+        self._pos = end
+        return end - start
+
+    def getbuffer(self):
+        """Returns a memoryview of the entire file."""
+        self._remap()
+
+        if self._map is None:
+            return memoryview(b"")
+
+        return memoryview(self._map)
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        n = len(data)
+        pos = self._pos
+
+        if (self._writable and self._map is not None
+                and pos + n <= len(self._map)):
+            self._map[pos:pos + n] = data
+
+        else:
+            while data:
+                k = os.pwrite(self._fd, data, pos)
+                data = data[k:]
+                pos += k
+
+        self._pos += n
+        return n
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._pos
+
+        os.ftruncate(self._fd, size)
+        self._remap()
+        return size
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+
+        elif whence == 2:
+            offset += os.fstat(self._fd).st_size
+
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}.")
+
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        # Writes to the map are visible to other readers of the file right
+        # away, like writes to a file object once flushed. Use os.fsync() on
+        # fileno() for durability.
+        pass
+
+    def fileno(self):
+        return self._fd
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return self._writable
+
+    def close(self):
+        self._map = None
+        self.file.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+
+class PagedFile(object):
+    """
+    File-like wrapper around 'file' that serves small reads from a cache of
+    'pagesize'-byte pages of the file, read with os.pread() and evicted in
+    least-recently-used order once more than 'maxsize' bytes are cached.
+    Reads of a page or more bypass the cache.
+
+    Writes go straight to the file descriptor (os.pwrite()), updating any
+    cached pages they touch, so that the cache stays coherent with writes
+    made through the wrapper. invalidate() must be called after the file is
+    changed by other means (_fallocate() and _copyRange() do so). Once
+    wrapped, 'file' should only be accessed through the wrapper, as its own
+    buffers are bypassed.
+    """
+
+    def __init__(self, file, pagesize=64*1024, maxsize=64*1024**2):
+        file.flush()
+        self.file = file
+        self.mode = file.mode
+
+        if hasattr(file, "name"):
+            self.name = file.name
+
+        self.pagesize = pagesize
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fd = file.fileno()
+        self._writable = file.writable()
+        self._pos = file.tell()
+        self._pages = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        # Bumped by every change, so that a page read while the file is
+        # being changed is not cached.
+        self._version = 0
+
+        # Index of the cached page cut short by the end of the file, if any.
+        # It has to go once the file is extended past it.
+        self._short = None
+
+    def _page(self, k):
+        with self._lock:
+            page = self._pages.get(k)
+
+            if page is not None:
+                self._pages.move_to_end(k)
+                self.hits += 1
+                return page
+
+            self.misses += 1
+            version = self._version
+
+        page = bytearray(os.pread(self._fd, self.pagesize, k*self.pagesize))
+
+        with self._lock:
+            if self._version == version and k not in self._pages:
+                self._pages[k] = page
+
+                if len(page) < self.pagesize:
+                    self._short = k
+
+                while len(self._pages)*self.pagesize > self.maxsize:
+                    if self._pages.popitem(last=False)[0] == self._short:
+                        self._short = None
+
+        return page
+
+    def pread(self, size, offset):
+        """
+        Like os.pread(), at 'offset', leaving the file position alone. Safe
+        to call from several threads at once.
+        """
+
+        pagesize = self.pagesize
+
+        if size >= pagesize:
+            return os.pread(self._fd, size, offset)
+
+        k = offset // pagesize
+        a = offset - k*pagesize
+        page = self._page(k)
+
+        if a + size <= len(page) or len(page) < pagesize:
+            return bytes(page[a:a + size])
+
+        # Spans two pages.
+        return bytes(page[a:]) + bytes(self._page(k + 1)[:a + size - pagesize])
+
+    def read(self, size=-1):
+        pos = self._pos
+
+        if size is None or size < 0:
+            size = max(0, os.fstat(self._fd).st_size - pos)
+
+        data = self.pread(size, pos)
+        self._pos = pos + len(data)
+        return data
+
+    def readinto(self, buffer):
+        buffer = memoryview(buffer).cast("B")
+
+        if len(buffer) >= self.pagesize:
+            n = os.preadv(self._fd, [buffer], self._pos)
+
+        else:
+            data = self.pread(len(buffer), self._pos)
+            n = len(data)
+            buffer[:n] = data
+
+        self._pos += n
+        return n
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        n = len(data)
+        pos = self._pos
+        pagesize = self.pagesize
+
+        with self._lock:
+            self._version += 1
+            view = data
+
+            while view:
+                view = view[os.pwrite(self._fd, view, pos + n - len(view)):]
+
+            if self._short is not None and self._short < pos // pagesize:
+                # The file now extends past the page.
+                del self._pages[self._short]
+                self._short = None
+
+            for k in range(pos // pagesize, (pos + n - 1) // pagesize + 1):
+                page = self._pages.get(k)
+
+                if page is None:
+                    continue
+
+                start = k*pagesize
+                a = max(pos, start) - start
+                b = min(pos + n, start + pagesize) - start
+
+                if a <= len(page):
+                    page[a:b] = data[start + a - pos:start + b - pos]
+
+                    if k == self._short and len(page) == pagesize:
+                        self._short = None
+
+                else:
+                    # There would be a hole in the page.
+                    del self._pages[k]
+
+                    if k == self._short:
+                        self._short = None
+
+        self._pos = pos + n
+        return n
+
+    def invalidate(self, offset=0, size=None):
+        """
+        Drops cached pages overlapping 'size' bytes at 'offset' (up to the
+        end of the file if None).
+        """
+
+        with self._lock:
+            self._version += 1
+            first = offset // self.pagesize
+
+            if size is None:
+                drop = [k for k in self._pages if k >= first]
+
+            else:
+                last = (offset + size - 1) // self.pagesize
+                drop = [k for k in self._pages if first <= k <= last]
+
+            for k in drop:
+                del self._pages[k]
+
+            if self._short in drop:
+                self._short = None
+
+    def truncate(self, size=None):
+        if size is None:
+            size = self._pos
+
+        os.ftruncate(self._fd, size)
+        start = size - size % self.pagesize
+
+        if self._short is not None:
+            # Extending the file past the page, if it was short.
+            start = min(start, self._short*self.pagesize)
+
+        self.invalidate(start)
+        return size
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+
+        elif whence == 2:
+            offset += os.fstat(self._fd).st_size
+
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}.")
+
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        # Writes go to the file descriptor right away. Use os.fsync() on
+        # fileno() for durability.
+        pass
+
+    def fileno(self):
+        return self._fd
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return self._writable
+
+    def close(self):
+        self._pages.clear()
+        self._short = None
+        self.file.close()
+
+    @property
+    def closed(self):
+        return self.file.closed
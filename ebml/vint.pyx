@@ -1,6 +1,8 @@
 from libc.stdio cimport *
 from ebml.exceptions import UnexpectedEndOfData
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, realloc, free
+from libc.string cimport memcpy
+cimport cython
 
 
 cdef unsigned char _getVintSize(unsigned char b) nogil except *:
@@ -155,16 +157,287 @@ cdef class parseFile:
         return val
 
 
+cdef packed struct ElementHeader:
+    unsigned long long offset
+    unsigned long long ebmlID
+    unsigned char idLength
+    unsigned char headerLength
+    unsigned long long dataSize
+
+cdef enum:
+    SCAN_MORE = 0
+    SCAN_DONE = 1
+    SCAN_BADVINT = -1
+    SCAN_NOMEM = -2
+    SCAN_OVERRUN = -3
+
+cdef object _headerDtype = None
+
+def headerDtype():
+    """
+    Returns the NumPy dtype of the structured arrays returned by scanFile.
+    """
+    global _headerDtype
+
+    if _headerDtype is None:
+        import numpy
+
+        _headerDtype = numpy.dtype([("offset", "=u8"), ("ebmlID", "=u8"),
+                                    ("idLength", "u1"),
+                                    ("headerLength", "u1"),
+                                    ("dataSize", "=u8")])
+
+    return _headerDtype
+
+cdef unsigned char _vintWidth(unsigned char b) nogil:
+    cdef unsigned char k
+
+    for k in range(8):
+        if b & (128 >> k):
+            return k + 1
+
+    return 0
+
+cdef int _decodeHeaders(const unsigned char *buf, Py_ssize_t n,
+                        unsigned long long base, unsigned long long limit,
+                        unsigned long long *nextoffset,
+                        ElementHeader **records, Py_ssize_t *count,
+                        Py_ssize_t *capacity) nogil:
+    """
+    Decodes consecutive element headers from 'buf' (which holds the file
+    data starting at offset 'base'), beginning at '*nextoffset', until the
+    next header falls outside of the buffer or 'limit' is reached.
+    """
+    cdef:
+        Py_ssize_t pos
+        unsigned char idLength, sizeLength, k
+        unsigned long long ebmlID, dataSize
+        ElementHeader *newrecords
+        ElementHeader *rec
+
+    while True:
+        if nextoffset[0] >= limit:
+            return SCAN_DONE
+
+        if nextoffset[0] - base >= <unsigned long long>n:
+            return SCAN_MORE
+
+        pos = nextoffset[0] - base
+        idLength = _vintWidth(buf[pos])
+
+        if idLength == 0:
+            return SCAN_BADVINT
+
+        if pos + idLength >= n:
+            return SCAN_MORE
+
+        sizeLength = _vintWidth(buf[pos + idLength])
+
+        if sizeLength == 0:
+            return SCAN_BADVINT
+
+        if pos + idLength + sizeLength > n:
+            return SCAN_MORE
+
+        ebmlID = 0
+
+        for k in range(idLength):
+            ebmlID = (ebmlID << 8) | buf[pos + k]
+
+        dataSize = buf[pos + idLength] & ((128 >> (sizeLength - 1)) - 1)
+
+        for k in range(1, sizeLength):
+            dataSize = (dataSize << 8) | buf[pos + idLength + k]
+
+        if count[0] == capacity[0]:
+            newrecords = <ElementHeader *>realloc(
+                records[0], 2*capacity[0]*sizeof(ElementHeader))
+
+            if newrecords == NULL:
+                return SCAN_NOMEM
+
+            records[0] = newrecords
+            capacity[0] *= 2
+
+        rec = records[0] + count[0]
+        rec.offset = nextoffset[0]
+        rec.ebmlID = ebmlID
+        rec.idLength = idLength
+        rec.headerLength = idLength + sizeLength
+        rec.dataSize = dataSize
+        count[0] += 1
+
+        nextoffset[0] += idLength + sizeLength + dataSize
+
+        if nextoffset[0] > limit:
+            return SCAN_OVERRUN
+
+
+def scanFile(object file, long long size=-1, Py_ssize_t blocksize=1048576,
+             long long stop=-1):
+    """
+    scanFile(file, size=-1, blocksize=1048576, stop=-1)
+
+    Scans element headers in 'file', starting at the current file offset,
+    until 'size' bytes have been covered (or until end of file if 'size'
+    is negative). If 'stop' is nonnegative, no further blocks are read once
+    headers have been decoded past 'stop' bytes from the start, so that a
+    scan can be resumed later from the offset the file is left at.
+
+    Reads 'blocksize' bytes at a time and decodes headers without holding
+    the GIL. If 'file' has a getbuffer() method (e.g., io.BytesIO or
+    ebml.util.MappedFile), headers are decoded in place from the buffer it
+    returns instead. Returns a structured NumPy array (see headerDtype()) with
+    fields 'offset' (offset in file), 'ebmlID' (the ID vint as an
+    unsigned integer), 'idLength', 'headerLength' and 'dataSize'.
+    """
+    cdef:
+        unsigned long long start = file.tell()
+        unsigned long long limit
+        unsigned long long stopoffset
+        unsigned long long nextoffset = start
+        unsigned long long base
+        Py_ssize_t n
+        Py_ssize_t count = 0
+        Py_ssize_t capacity = 1024
+        int status = SCAN_MORE
+        ElementHeader *records
+        bytearray buf
+        unsigned char[::1] bufview
+        const unsigned char[::1] mem
+        const unsigned char *ptr
+        bint inplace = False
+        unsigned char[::1] dest
+
+    if blocksize < 16:
+        raise ValueError("Block size must be at least 16 bytes.")
+
+    if size >= 0:
+        limit = start + size
+
+    else:
+        limit = <unsigned long long>-1
+
+    if stop >= 0:
+        stopoffset = min(start + stop, limit)
+
+    else:
+        stopoffset = limit
+
+    getbuffer = getattr(file, "getbuffer", None)
+
+    if getbuffer is not None:
+        mem = getbuffer()
+        inplace = True
+
+    else:
+        buf = bytearray(blocksize)
+        bufview = buf
+
+    records = <ElementHeader *>malloc(capacity*sizeof(ElementHeader))
+
+    if records == NULL:
+        raise MemoryError
+
+    try:
+        while nextoffset < stopoffset:
+            base = nextoffset
+
+            if inplace:
+                if base >= <unsigned long long>mem.shape[0]:
+                    break
+
+                n = min(<unsigned long long>blocksize, mem.shape[0] - base)
+                ptr = &mem[base]
+
+            else:
+                file.seek(base)
+                n = file.readinto(buf)
+
+                if n == 0:
+                    break
+
+                ptr = &bufview[0]
+
+            with nogil:
+                status = _decodeHeaders(ptr, n, base, limit,
+                                        &nextoffset, &records, &count,
+                                        &capacity)
+
+            if status == SCAN_BADVINT:
+                raise ValueError(
+                    f"Invalid data for vint at offset {nextoffset}.")
+
+            elif status == SCAN_NOMEM:
+                raise MemoryError
+
+            elif status == SCAN_OVERRUN:
+                raise UnexpectedEndOfData(
+                    "EBML Element extends past end of data.")
+
+            elif status == SCAN_DONE:
+                break
+
+            elif nextoffset == base and n < blocksize:
+                raise UnexpectedEndOfData(
+                    "Unexpected End of Data while scanning "
+                    "variable-length integer.")
+
+        headers = _emptyHeaders(count)
+
+        if count:
+            dest = headers.view("u1")
+            memcpy(&dest[0], records, count*sizeof(ElementHeader))
+
+    finally:
+        free(records)
+
+    file.seek(nextoffset)
+    return headers
+
+cdef object _emptyHeaders(Py_ssize_t count):
+    import numpy
+    return numpy.empty(count, dtype=headerDtype())
+
+
+cpdef object asBuffer(object data):
+    """
+    Returns a one-dimensional, unsigned-byte memoryview of 'data', which can
+    be any object supporting the buffer protocol (bytes, bytearray,
+    memoryview, mmap, NumPy array, ...). No data is copied.
+    """
+    cdef object view = memoryview(data)
+
+    if view.ndim != 1 or view.format != "B":
+        view = view.cast("B")
+
+    return view
+
+
 cdef class parseElements:
+    """
+    parseElements(data, offsets=False)
+
+    Iterates over the elements encoded in 'data' (any object supporting the
+    buffer protocol), yielding (offset, ebmlID, sizesize, payload) tuples,
+    where 'payload' is a memoryview slice of 'data' (no copy is made).
+
+    If 'offsets' is True, yields (offset, ebmlID, sizesize, start, end)
+    instead, where 'start' and 'end' delimit the payload in 'data'.
+    """
     cdef:
-        object _data
+        object _view
+        const unsigned char[::1] _data
         unsigned long long _offset
         unsigned long long _size
+        bint _offsets
 
-    def __cinit__(self, bytes data):
-        self._data = data
-        self._size = len(data)
+    def __cinit__(self, object data, bint offsets=False):
+        self._view = asBuffer(data)
+        self._data = self._view
+        self._size = len(self._view)
         self._offset = 0
+        self._offsets = offsets
 
     def __iter__(self):
         return self
@@ -172,56 +445,67 @@ cdef class parseElements:
     def __next__(self):
         cdef:
             bytes ebmlID
-            bytes esize
             unsigned long long size
-            unsigned char vintsize
+            unsigned long long start
+            unsigned long long end
             unsigned char sizeoffset
-            unsigned char dataoffset
-            bytes data
+            unsigned char vintsize
+            unsigned char k
+            unsigned long long offset = self._offset
 
-        if self._offset >= self._size:
+        if offset >= self._size:
             raise StopIteration
 
-        sizeoffset = _getVintSize(self._data[self._offset])
-        ebmlID = self._data[self._offset: self._offset + sizeoffset]
+        sizeoffset = _getVintSize(self._data[offset])
 
-        if len(ebmlID) < vintsize:
+        if offset + sizeoffset >= self._size:
             raise UnexpectedEndOfData(
                 "Unexpected End of Data while scanning variable-length integer.")
 
-        vintsize = _getVintSize(self._data[self._offset + sizeoffset])
-        esize = self._data[self._offset + sizeoffset:
-                               self._offset + sizeoffset + vintsize]
+        ebmlID = (<const char *>&self._data[offset])[:sizeoffset]
+        vintsize = _getVintSize(self._data[offset + sizeoffset])
+        start = offset + sizeoffset + vintsize
 
-        if len(esize) < vintsize:
+        if start > self._size:
             raise UnexpectedEndOfData(
                 "Unexpected End of Data while scanning variable-length integer.")
 
-        size = fromVint(esize)
-        dataoffset = sizeoffset + vintsize
+        size = self._data[offset + sizeoffset] & ((128 >> (vintsize - 1)) - 1)
+
+        for k in range(1, vintsize):
+            size = (size << 8) | self._data[offset + sizeoffset + k]
 
-        data = self._data[self._offset + dataoffset: self._offset + dataoffset + size]
+        end = start + size
 
-        if len(data) < size:
+        if end > self._size:
             raise UnexpectedEndOfData(
                 "Unexpected End of Data while scanning data.")
-            
-        try:
-            return (self._offset, ebmlID, vintsize, data)
 
-        finally:
-            self._offset += dataoffset + size
+        self._offset = end
+
+        if self._offsets:
+            return (offset, ebmlID, vintsize, start, end)
+
+        return (offset, ebmlID, vintsize, self._view[start:end])
 
 
 cdef class parseVints:
+    """
+    parseVints(data)
+
+    Iterates over the vints packed in 'data' (any object supporting the
+    buffer protocol), yielding each one as a bytes object.
+    """
     cdef:
-        bytes _data
+        object _view
+        const unsigned char[::1] _data
         unsigned long long _size
         unsigned long long _offset
 
-    def __cinit__(self, bytes data):
-        self._data = data
-        self._size = len(data)
+    def __cinit__(self, object data):
+        self._view = asBuffer(data)
+        self._data = self._view
+        self._size = len(self._view)
         self._offset = 0
 
     def __iter__(self):
@@ -231,25 +515,260 @@ cdef class parseVints:
         cdef:
             unsigned char size
             bytes vint
-            cdef unsigned char b
 
-        with nogil:
-            if self._offset == self._size:
-                with gil:
-                    raise StopIteration
+        if self._offset == self._size:
+            raise StopIteration
 
-            with gil:
-                b = self._data[self._offset]
+        size = _getVintSize(self._data[self._offset])
 
-            size = _getVintSize(b)
+        if self._offset + size > self._size:
+            raise UnexpectedEndOfData()
 
-            if self._offset + size > self._size:
-                with gil:
-                    raise UnexpectedEndOfData()
+        vint = (<const char *>&self._data[self._offset])[:size]
+        self._offset += size
+        return vint
 
-            with gil:
-                vint = self._data[self._offset: self._offset + size]
 
-            self._offset += size
+cdef enum:
+    VINTS_OK = 0
+    VINTS_NEGATIVE = -1
+    VINTS_OVERFLOW = -2
+    VINTS_SHORT = -3
+    VINTS_BADVINT = -4
+    VINTS_WRONGWIDTH = -5
 
-        return vint
+cdef unsigned char _minVintWidth(unsigned long long n) nogil:
+    cdef unsigned char k
+    cdef unsigned long long o = 1
+
+    for k in range(1, 9):
+        if n < (o << (7*k)) - 1:
+            return k
+
+    return 0
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _vintsSize(const long long[::1] values, unsigned char size,
+                    Py_ssize_t *total) nogil:
+    cdef:
+        Py_ssize_t i
+        unsigned char k
+        unsigned long long o = 1
+
+    total[0] = 0
+
+    for i in range(values.shape[0]):
+        if values[i] < 0:
+            return VINTS_NEGATIVE
+
+        if size:
+            if <unsigned long long>values[i] >= (o << (7*size)) - 1:
+                return VINTS_OVERFLOW
+
+            k = size
+
+        else:
+            k = _minVintWidth(values[i])
+
+            if k == 0:
+                return VINTS_OVERFLOW
+
+        total[0] += k
+
+    return VINTS_OK
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _encodeVints(const long long[::1] values, unsigned char[::1] out,
+                      Py_ssize_t *offset, unsigned char size) nogil:
+    cdef:
+        Py_ssize_t i
+        Py_ssize_t pos = offset[0]
+        unsigned char j, k
+        unsigned long long x
+        unsigned long long o = 1
+
+    for i in range(values.shape[0]):
+        if values[i] < 0:
+            return VINTS_NEGATIVE
+
+        x = values[i]
+
+        if size:
+            if x >= (o << (7*size)) - 1:
+                return VINTS_OVERFLOW
+
+            k = size
+
+        else:
+            k = _minVintWidth(x)
+
+            if k == 0:
+                return VINTS_OVERFLOW
+
+        if pos + k > out.shape[0]:
+            return VINTS_SHORT
+
+        x |= o << (7*k)
+
+        for j in range(k):
+            out[pos + k - 1 - j] = x & 0xff
+            x >>= 8
+
+        pos += k
+        offset[0] = pos
+
+    return VINTS_OK
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _countVints(const unsigned char[::1] data, unsigned char size,
+                     Py_ssize_t *count) nogil:
+    cdef:
+        Py_ssize_t pos = 0
+        Py_ssize_t n = data.shape[0]
+        unsigned char k
+
+    count[0] = 0
+
+    while pos < n:
+        k = _vintWidth(data[pos])
+
+        if k == 0:
+            return VINTS_BADVINT
+
+        if size and k != size:
+            return VINTS_WRONGWIDTH
+
+        pos += k
+
+        if pos > n:
+            return VINTS_SHORT
+
+        count[0] += 1
+
+    return VINTS_OK
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _decodeVints(const unsigned char[::1] data,
+                       unsigned long long[::1] out) nogil:
+    cdef:
+        Py_ssize_t i
+        Py_ssize_t pos = 0
+        unsigned char j, k
+        unsigned long long x
+
+    for i in range(out.shape[0]):
+        k = _vintWidth(data[pos])
+        x = data[pos] & ((128 >> (k - 1)) - 1)
+
+        for j in range(1, k):
+            x = (x << 8) | data[pos + j]
+
+        out[i] = x
+        pos += k
+
+cdef _raiseVintsError(int status):
+    if status == VINTS_NEGATIVE:
+        raise ValueError("Cannot encode negative integers as vints.")
+
+    elif status == VINTS_OVERFLOW:
+        raise OverflowError
+
+    elif status == VINTS_SHORT:
+        raise UnexpectedEndOfData(
+            "Unexpected End of Data while scanning variable-length integer.")
+
+    elif status == VINTS_BADVINT:
+        raise ValueError("Invalid data for vint.")
+
+    elif status == VINTS_WRONGWIDTH:
+        raise ValueError("Vint width does not match expected width.")
+
+cdef object _asInt64Array(object values):
+    import numpy
+    return numpy.ascontiguousarray(values, dtype=numpy.int64)
+
+def vintsSize(object values, unsigned char size=0):
+    """
+    vintsSize(values, size=0)
+
+    Returns the number of bytes needed to encode a sequence of integers as
+    vints, each of minimal width, or of width 'size' if nonzero.
+    """
+    cdef:
+        const long long[::1] v = _asInt64Array(values)
+        Py_ssize_t total
+        int status
+
+    with nogil:
+        status = _vintsSize(v, size, &total)
+
+    _raiseVintsError(status)
+    return total
+
+def encodeVintsInto(object values, object buffer, Py_ssize_t offset=0,
+                    unsigned char size=0):
+    """
+    encodeVintsInto(values, buffer, offset=0, size=0)
+
+    Encodes a sequence of integers (converted to an int64 array) as vints
+    into a writable buffer (bytearray, memoryview, mmap, ...) starting at
+    'offset'. Each vint has minimal width, or width 'size' if nonzero.
+
+    Returns the offset immediately following the last vint written.
+    """
+    cdef:
+        const long long[::1] v = _asInt64Array(values)
+        unsigned char[::1] out = asBuffer(buffer)
+        int status
+
+    if offset < 0 or offset > out.shape[0]:
+        raise ValueError(f"Offset {offset} outside of buffer.")
+
+    with nogil:
+        status = _encodeVints(v, out, &offset, size)
+
+    _raiseVintsError(status)
+    return offset
+
+def encodeVints(object values, unsigned char size=0):
+    """
+    encodeVints(values, size=0)
+
+    Encodes a sequence of integers as vints, each of minimal width, or of
+    width 'size' if nonzero. Returns a bytearray.
+    """
+    cdef bytearray out = bytearray(vintsSize(values, size))
+    encodeVintsInto(values, out, 0, size)
+    return out
+
+def decodeVints(object data, unsigned char size=0):
+    """
+    decodeVints(data, size=0)
+
+    Decodes vints packed in 'data' (any object supporting the buffer
+    protocol) into a uint64 NumPy array. If 'size' is nonzero, every vint
+    is expected to have that width.
+    """
+    import numpy
+
+    cdef:
+        const unsigned char[::1] view = asBuffer(data)
+        unsigned long long[::1] out
+        Py_ssize_t count
+        int status
+
+    with nogil:
+        status = _countVints(view, size, &count)
+
+    _raiseVintsError(status)
+    result = numpy.empty(count, dtype=numpy.uint64)
+    out = result
+
+    with nogil:
+        _decodeVints(view, out)
+
+    return result
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 from Cython.Build import cythonize
 
 setup(
@@ -9,5 +9,6 @@ setup(
     author_email='caretaker82@gmail.com',
     url='https://github.com/shersonb/python-ebml',
     packages=['ebml'],
+    install_requires=['numpy'],
     ext_modules=cythonize("ebml/*.pyx")
 )
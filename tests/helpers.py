@@ -0,0 +1,51 @@
+"""Element classes and test case base classes shared by the tests."""
+
+import gc
+import os
+import tempfile
+import unittest
+
+from ebml.base import EBMLData, EBMLInteger
+from ebml.file import EBMLMasterElementInFile
+
+
+class Kid(EBMLInteger):
+    ebmlID = b"\x81"
+
+
+class Blob(EBMLData):
+    ebmlID = b"\x82"
+
+
+class Root(EBMLMasterElementInFile):
+    ebmlID = b"\x18\x53\x80\x67"
+    __ebmlchildren__ = (Kid, Blob)
+
+
+class CachedRoot(Root):
+    cacheSize = 1 << 20
+
+
+class FileTestCase(unittest.TestCase):
+    """
+    Test case with a temporary file at self.path, opened as self.file in
+    'mode' (unless None), and removed along with its journal afterwards.
+    """
+
+    mode = "wb+"
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.file = open(self.path, self.mode) if self.mode else None
+
+    def tearDown(self):
+        # Journals are closed once the elements using them are collected.
+        gc.collect()
+
+        if self.file is not None:
+            self.file.close()
+
+        for path in (self.path, self.path + ".wal"):
+            if os.path.exists(path):
+                os.unlink(path)
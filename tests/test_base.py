@@ -0,0 +1,101 @@
+import unittest
+
+from ebml.base import (EBMLElement, EBMLInteger, EBMLList, EBMLMasterElement,
+                       EBMLProperty)
+
+from .helpers import Blob, Kid
+
+
+Kids = EBMLList.makesubclass("Kids", Kid)
+Rest = EBMLList.makesubclass("Rest", EBMLElement)
+
+
+class Master(EBMLMasterElement):
+    ebmlID = b"\x40\x01"
+    __ebmlchildren__ = (EBMLProperty("kids", Kids, optional=True),
+                        EBMLProperty("rest", Rest, optional=True))
+
+
+class ListSizeTests(unittest.TestCase):
+    def make(self):
+        m = Master(kids=[1, 2, 3], rest=[Blob(b"a"), Blob(b"bb"), Kid(5)])
+        m.toBytes()
+        return m
+
+    def check(self, m, kids, rest):
+        data = m.toBytes()
+        self.assertEqual(len(data), m.size())
+        self.assertEqual(data, Master(kids=kids, rest=rest).toBytes())
+
+    def test_pop(self):
+        m = self.make()
+        self.assertEqual(m.kids.pop(), 3)
+        self.assertEqual(m.rest.pop().data, 5)
+        m.rest.pop(0)
+        self.check(m, [1, 2], [Blob(b"bb")])
+
+    def test_clear(self):
+        m = self.make()
+        m.kids.clear()
+        m.rest.clear()
+        self.check(m, [], [])
+
+    def test_iadd_imul(self):
+        m = self.make()
+        m.kids += [4, 5]
+        m.rest += [Kid(6)]
+        m.kids *= 2
+        self.check(m, [1, 2, 3, 4, 5]*2,
+                   [Blob(b"a"), Blob(b"bb"), Kid(5), Kid(6)])
+
+    def test_delitem_and_remove(self):
+        m = self.make()
+        del m.kids[0]
+        m.rest.remove(m.rest[0])
+        self.check(m, [2, 3], [Blob(b"bb"), Kid(5)])
+
+
+class SlotsTests(unittest.TestCase):
+    def test_subclass_keeps_dict(self):
+        class Foo(EBMLInteger):
+            ebmlID = b"\x81"
+
+        foo = Foo(1)
+        foo.tag = "x"
+        self.assertEqual(foo.tag, "x")
+        self.assertEqual(foo.data, 1)
+
+    def test_compact_opt_in(self):
+        class Compact(EBMLInteger):
+            ebmlID = b"\x81"
+            __compact__ = True
+
+        class Sub(Compact):
+            ebmlID = b"\x82"
+
+        class Declared(EBMLInteger):
+            ebmlID = b"\x81"
+            __slots__ = ()
+
+        for cls in (Compact, Sub, Declared):
+            obj = cls(1)
+            self.assertFalse(hasattr(obj, "__dict__"))
+            self.assertEqual(obj.data, 1)
+
+            with self.assertRaises(AttributeError):
+                obj.tag = "x"
+
+    def test_compact_master(self):
+        class Compact(EBMLMasterElement):
+            ebmlID = b"\x40\x02"
+            __compact__ = True
+            __ebmlchildren__ = (EBMLProperty("kid", Kid, optional=True),)
+
+        m = Compact(kid=3)
+        self.assertFalse(hasattr(m, "__dict__"))
+        self.assertEqual(m.kid, 3)
+        self.assertEqual(Compact.fromBytes(m.toBytes()).kid, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import gc
+import unittest
+
+from .helpers import Blob, CachedRoot, FileTestCase, Root
+
+
+class SmallCacheRoot(Root):
+    cacheSize = 1000
+
+
+class CacheTests(FileTestCase):
+    rootcls = CachedRoot
+
+    def setUp(self):
+        super().setUp()
+        root = Root(self.file, 0, 4*4096)
+
+        for i in range(20):
+            root.addChildElement(Blob(bytes([i])*100), 200*i)
+
+        root.addChildElement(Blob(b"z"*100), 3*4096)
+        self.file.flush()
+        del root
+        gc.collect()
+        self.root = self.open()
+
+    def open(self):
+        self.file.seek(0)
+        return self.rootcls.fromFile(self.file)
+
+    def info(self):
+        info = self.root.cacheInfo()
+        return (info.hits, info.misses, info.evictions, info.count, info.size)
+
+    def test_counts(self):
+        root = self.root
+        self.assertEqual(self.info(), (0, 0, 0, 0, 0))
+        self.assertEqual(root.cacheInfo().maxsize, 1 << 20)
+
+        child = root.getChildElement(0)
+        self.assertEqual(self.info(), (0, 1, 0, 1, 102))
+        self.assertIs(root.getChildElement(0), child)
+        self.assertEqual(self.info(), (1, 1, 0, 1, 102))
+
+        # Kept alive by the cache alone.
+        del child
+        gc.collect()
+        root.getChildElement(0)
+        self.assertEqual(self.info(), (2, 1, 0, 1, 102))
+
+        root.getChildElement(200)
+        self.assertEqual(self.info(), (2, 2, 0, 2, 204))
+
+        root.clearCache()
+        self.assertEqual(self.info(), (2, 2, 0, 0, 0))
+
+    def test_evictions(self):
+        self.rootcls = SmallCacheRoot
+        root = self.root = self.open()
+
+        for i in range(20):
+            root.getChildElement(200*i)
+
+        # Room for 9 children of 102 bytes.
+        self.assertEqual(self.info(), (0, 20, 11, 9, 918))
+        gc.collect()
+        root.getChildElement(200*19)
+        root.getChildElement(0)
+        self.assertEqual(self.info(), (1, 21, 12, 9, 918))
+
+    def test_no_cache(self):
+        self.rootcls = Root
+        self.root = self.open()
+        self.root.getChildElement(0)
+        self.assertIsNone(self.root.cacheInfo())
+        self.root.clearCache()
+
+    def test_discard_on_move(self):
+        root = self.root
+        child = root.getChildElement(0)
+        root.moveChildElement(0, 4096)
+        self.assertEqual(self.info()[3:], (0, 0))
+        self.assertIs(root.getChildElement(4096), child)
+        self.assertEqual(self.info()[3:], (1, 102))
+
+    def test_discard_on_remove(self):
+        root = self.root
+        root.getChildElement(0)
+        root.getChildElement(200)
+        root.removeChildElement(0)
+        self.assertEqual(self.info()[3:], (1, 102))
+        gc.collect()
+        self.assertEqual(bytes(root.getChildElement(200).data), b"\x01"*100)
+        self.assertEqual(self.info()[:2], (1, 2))
+
+    def test_discard_on_collapse(self):
+        root = self.root
+        root.getChildElement(0)
+        root.getChildElement(3*4096)
+        root.collapseRange(4084, 4096)
+        self.assertEqual(self.info()[3:], (1, 102))
+
+        child = root.getChildElement(2*4096)
+        self.assertEqual(bytes(child.data), b"z"*100)
+        self.assertEqual(self.info()[1:], (3, 0, 2, 204))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import random
+import unittest
+
+from ebml._childindex import ChildIndex
+
+
+class ChildIndexTests(unittest.TestCase):
+    def check(self, index, model):
+        offsets = sorted(model)
+        self.assertEqual(len(index), len(model))
+        self.assertEqual(list(index), offsets)
+        self.assertEqual(list(index.items()),
+                         [(o, model[o]) for o in offsets])
+        self.assertEqual(index.first(), offsets[0] if offsets else None)
+        self.assertEqual(index.last(), offsets[-1] if offsets else None)
+
+        for (k, offset) in enumerate(offsets):
+            self.assertIn(offset, index)
+            self.assertEqual(index[offset], model[offset])
+            self.assertEqual(index.at(k), offset)
+
+    def entry(self, offset, size=5):
+        return (b"\x81", None, offset + size)
+
+    def test_fromSorted(self):
+        offsets = list(range(0, 1000, 10))
+        index = ChildIndex.fromSorted(offsets, [self.entry(o) for o in offsets],
+                                      load=4)
+        self.check(index, {o: self.entry(o) for o in offsets})
+
+    def test_neighbors(self):
+        index = ChildIndex(load=2)
+
+        for offset in range(0, 100, 10):
+            index[offset] = self.entry(offset)
+
+        self.assertEqual(index.next(-1), 0)
+        self.assertEqual(index.next(0), 10)
+        self.assertEqual(index.next(15), 20)
+        self.assertIsNone(index.next(90))
+        self.assertIsNone(index.prev(0))
+        self.assertEqual(index.prev(15), 10)
+        self.assertEqual(index.prev(10), 0)
+        self.assertEqual(list(index.irange(25, 55)), [30, 40, 50])
+        self.assertIsNone(index.get(5))
+
+        with self.assertRaises(KeyError):
+            index[5]
+
+    def test_shift(self):
+        index = ChildIndex(load=2)
+        model = {}
+
+        for offset in range(0, 200, 10):
+            index[offset] = model[offset] = self.entry(offset)
+
+        # Within a block, at the start of one, past the end, and backwards.
+        for (offset, delta) in ((35, 100), (0, 7), (1000, 5), (147, -3)):
+            index.shift(offset, delta)
+            model = {(o + delta if o >= offset else o):
+                     ((e, r, end + delta) if o >= offset else (e, r, end))
+                     for (o, (e, r, end)) in model.items()}
+            self.check(index, model)
+
+    def test_delete(self):
+        index = ChildIndex(load=2)
+        model = {}
+
+        for offset in range(0, 100, 10):
+            index[offset] = model[offset] = self.entry(offset)
+
+        index.shift(50, 1000)
+        model = {(o + 1000 if o >= 50 else o): v if o < 50
+                 else (v[0], v[1], v[2] + 1000) for (o, v) in model.items()}
+
+        for offset in (0, 1060, 1090, 30, 1050):
+            del index[offset]
+            del model[offset]
+            self.check(index, model)
+
+        self.assertEqual(index.pop(10), model.pop(10))
+        self.assertIsNone(index.pop(10, None))
+
+        with self.assertRaises(KeyError):
+            del index[10]
+
+        self.check(index, model)
+
+    def test_random(self):
+        rand = random.Random(0)
+        index = ChildIndex(load=4)
+        model = {}
+
+        for step in range(3000):
+            r = rand.random()
+
+            if r < 0.45 or not model:
+                offset = rand.randrange(10000)
+                index[offset] = model[offset] = self.entry(offset, step)
+
+            elif r < 0.8:
+                offset = rand.choice(list(model))
+                del index[offset]
+                del model[offset]
+
+            else:
+                offset = rand.randrange(10000)
+                before = [o for o in model if o < offset]
+                # Never move an entry onto or before the one preceding it.
+                low = (max(before) + 1 if before else 0) - min(
+                    (o for o in model if o >= offset), default=offset)
+                delta = rand.randrange(max(low, -50), 50)
+                index.shift(offset, delta)
+                model = {(o + delta if o >= offset else o):
+                         ((e, r, end + delta) if o >= offset
+                          else (e, r, end))
+                         for (o, (e, r, end)) in model.items()}
+
+            if step % 100 == 0:
+                self.check(index, model)
+
+            probe = rand.randrange(-10, 10100)
+            after = [o for o in model if o > probe]
+            before = [o for o in model if o < probe]
+            self.assertEqual(index.next(probe), min(after, default=None))
+            self.assertEqual(index.prev(probe), max(before, default=None))
+
+        self.check(index, model)
+
+
+if __name__ == "__main__":
+    unittest.main()
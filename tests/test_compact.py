@@ -0,0 +1,154 @@
+import unittest
+from unittest import mock
+
+from ebml import compact
+from ebml.compact import _collapsible, _Throttle
+from ebml.file import EBMLMasterElementInFile
+
+from .helpers import Blob, FileTestCase, Kid, Root
+
+
+class Sub(EBMLMasterElementInFile):
+    ebmlID = b"\x1a\x45\xdf\xa3"
+    __ebmlchildren__ = (Kid, Blob)
+
+
+class Top(EBMLMasterElementInFile):
+    ebmlID = b"\x18\x53\x80\x67"
+    __ebmlchildren__ = (Kid, Blob, Sub)
+
+
+class CollapsibleTests(unittest.TestCase):
+    def test_whole_blocks(self):
+        self.assertEqual(_collapsible(100, 3*4096, 4096, 0), (4096, 3*4096))
+        self.assertEqual(_collapsible(4084, 3*4096, 4096, 12),
+                         (4084, 3*4096 - 12))
+        self.assertIsNone(_collapsible(100, 4096 + 100, 4096, 0))
+
+    def test_no_one_byte_gap(self):
+        # A 1-byte gap left before the range moves its start a block on.
+        self.assertEqual(_collapsible(4095, 3*4096, 4096, 0),
+                         (2*4096, 3*4096))
+        self.assertIsNone(_collapsible(4095, 2*4096, 4096, 0))
+
+        # A single byte left over at its start and end together moves its
+        # end a block back.
+        self.assertEqual(_collapsible(0, 2*4096 + 1, 4096, 0), (0, 4096))
+        self.assertIsNone(_collapsible(0, 4096 + 1, 4096, 0))
+        self.assertEqual(_collapsible(0, 4096 + 2, 4096, 0), (0, 4096))
+
+
+class ThrottleTests(unittest.TestCase):
+    def test_delay(self):
+        self.assertEqual(_Throttle().delay(), 0)
+        throttle = _Throttle(1000)
+        self.assertEqual(throttle.delay(), 0)
+        throttle.copied = 500
+        self.assertTrue(0.4 < throttle.delay() <= 0.5)
+
+
+class CompactorTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = Root(self.file, 0, 4*4096)
+        self.root.addChildElement(Blob(b"a"*100), 0)
+        self.root.addChildElement(Blob(b"b"*100), 500)
+        self.root.addChildElement(Blob(b"c"*100), 3*4096 + 100)
+
+    def contents(self, element):
+        return sorted(bytes(c.data) for c in element.iterChildren())
+
+    def test_plan(self):
+        root = self.root
+        self.assertEqual(root.compactor().plan(),
+                         [("move", 3*4096 + 100, 102, 102), ("resize", 602)])
+
+        # Too large to be moved, so only the blocks before it go.
+        self.assertEqual(root.compactor(maxsize=101).plan(),
+                         [("resize", 3*4096 + 202),
+                          ("collapse", 4084, 2*4096)])
+
+    def test_compact(self):
+        root = self.root
+        expected = self.contents(root)
+        root.compact()
+        self.assertEqual(root.dataSize, 602)
+        self.assertEqual(self.contents(root), expected)
+
+        self.file.flush()
+        self.file.seek(0)
+        self.assertEqual(self.contents(Root.fromFile(self.file)), expected)
+
+    def test_stale_steps_skipped(self):
+        root = self.root
+        compactor = root.compactor()
+
+        while compactor._steps is None:
+            compactor.step()
+
+        # The child to be moved has since grown, so the move (and with it,
+        # the resize) no longer applies.
+        root.removeChildElement(3*4096 + 100)
+        root.addChildElement(Blob(b"d"*200), 3*4096 + 100)
+        expected = self.contents(root)
+
+        while compactor.step():
+            pass
+
+        self.assertEqual(root.dataSize, 4*4096)
+        self.assertEqual(self.contents(root), expected)
+        self.assertEqual(compactor.copied, 0)
+
+    def test_stale_collapse_skipped(self):
+        root = self.root
+        compactor = root.compactor(maxsize=101)
+
+        while compactor._steps is None:
+            compactor.step()
+
+        root.addChildElement(Kid(7), 2*4096)
+        expected = self.contents(root)
+
+        while compactor.step():
+            pass
+
+        self.assertEqual(self.contents(root), expected)
+        self.assertEqual(root._children[2*4096][0], Kid.ebmlID)
+
+    def test_throttle(self):
+        delays = []
+
+        with mock.patch.object(compact.time, "sleep", delays.append):
+            self.assertTrue(self.root.compactor(rate=1000).run())
+
+        self.assertTrue(0 < max(delays) <= 102/1000)
+        self.assertTrue(all(delay <= 102/1000 for delay in delays))
+
+    def test_no_throttle(self):
+        delays = []
+
+        with mock.patch.object(compact.time, "sleep", delays.append):
+            self.assertTrue(self.root.compactor().run())
+
+        self.assertEqual(set(delays), {0})
+
+
+class QuickTrimTests(FileTestCase):
+    def test_cannot_resize_child(self):
+        # Shrinking the subelement to its open boundary would leave a 1-byte
+        # gap before its next sibling.
+        top = Top(self.file, 0, 3*4096)
+        sub = Sub(top, 0, 4077, 4)
+        sub.addChildElement(Blob(b"x"*8), 0)
+        top.addChildElement(Kid(5), 4085)
+        self.assertEqual(sub.dataOffsetInFile + sub._findOpenBoundary(10),
+                         4096)
+
+        top.quickTrim()
+        self.assertEqual(sub.dataSize, 4077)
+        self.assertEqual([c.offsetInParent for c in top.iterChildren()],
+                         [0, 4085])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import unittest
+from unittest import mock
+
+from ebml.document import EBMLBody, EBMLDocument
+from ebml.head import EBMLHead
+
+from .helpers import FileTestCase, Kid
+
+
+class IndexedBodyTests(FileTestCase):
+    mode = None
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(EBMLBody, "indexed", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, count):
+        doc = EBMLDocument(self.path, "w")
+        doc.writeEBMLHead(EBMLHead(
+            docType="test", docTypeReadVersion=1, docTypeVersion=1,
+            ebmlMaxIDLength=4, ebmlMaxSizeLength=8, ebmlReadVersion=1,
+            ebmlVersion=1))
+        doc.beginWriteEBMLBody(b"\x18\x53\x80\x67")
+
+        for i in range(count):
+            doc.writeChildElement(Kid(i))
+
+        doc.close()
+
+    def read(self):
+        doc = EBMLDocument(self.path, "r")
+        children = []
+
+        try:
+            doc.seek(0)
+
+            while True:
+                child = doc.readChildElement()
+
+                if child is None:
+                    break
+
+                children.append(int.from_bytes(bytes(child.data), "big"))
+
+        finally:
+            doc.close()
+
+        return children
+
+    def test_append_reuses_index_space(self):
+        self.create(200)
+        sizes = [os.path.getsize(self.path)]
+
+        for k in range(5):
+            doc = EBMLDocument(self.path, "r+")
+            doc.seek(0, 2)
+            doc.writeChildElement(Kid(1000 + k))
+            doc.close()
+            sizes.append(os.path.getsize(self.path))
+
+        # Each cycle only adds the child and its entry in the index.
+        growth = [b - a for (a, b) in zip(sizes, sizes[1:])]
+        self.assertEqual(len(set(growth)), 1, sizes)
+        self.assertLess(growth[0], 16, sizes)
+        self.assertEqual(self.read(),
+                         list(range(200)) + list(range(1000, 1005)))
+
+    def test_append_at_tell_after_index(self):
+        self.create(10)
+        doc = EBMLDocument(self.path, "r+")
+        doc.seek(0, 2)
+        end = doc.tell()
+        doc.writeChildElement(Kid(10))
+        doc.writeChildElement(Kid(11))
+        doc.close()
+        self.assertEqual(self.read(), list(range(12)))
+
+        doc = EBMLDocument(self.path, "r+")
+        doc.seek(0, 2)
+        self.assertGreater(doc.tell(), end)
+        doc.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
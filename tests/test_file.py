@@ -0,0 +1,87 @@
+import gc
+import random
+import unittest
+
+from .helpers import Blob, CachedRoot, FileTestCase, Kid, Root
+
+
+class BatchReadTests(FileTestCase):
+    rootcls = Root
+
+    def setUp(self):
+        super().setUp()
+        self.root = self.rootcls(self.file, 0, 4096)
+
+    def test_read_child_added_in_batch(self):
+        root = self.root
+
+        with root.batch():
+            root.addChildElement(Blob(b"hello"*10), 100)
+            gc.collect()
+            self.assertEqual(bytes(root.getChildElement(100).data),
+                             b"hello"*10)
+
+        gc.collect()
+        self.assertEqual(bytes(root.getChildElement(100).data), b"hello"*10)
+
+    def test_read_after_batch(self):
+        root = self.root
+
+        with root.batch():
+            for i in range(20):
+                root.addChildElement(Kid(i), 10*i)
+
+        self.file.flush()
+        root = self.rootcls.fromFile(open(self.path, "rb"))
+
+        try:
+            self.assertEqual([c.data for c in root.iterChildren()],
+                             list(range(20)))
+
+        finally:
+            root.file.close()
+
+    def test_random_edits_in_batches(self):
+        root = self.root
+        rand = random.Random(0)
+        model = {}
+
+        for step in range(100):
+            with root.batch():
+                for _ in range(5):
+                    offset = 40*rand.randrange(90)
+
+                    if offset in model:
+                        root.removeChildElement(offset)
+                        del model[offset]
+
+                    else:
+                        data = bytes([step % 256])*rand.randrange(1, 30)
+                        root.addChildElement(Blob(data), offset)
+                        model[offset] = data
+
+                    gc.collect()
+                    offset = rand.choice(sorted(model))
+                    self.assertEqual(bytes(root.getChildElement(offset).data),
+                                     model[offset])
+
+            self.assertEqual({c.offsetInParent: bytes(c.data)
+                              for c in root.iterChildren()}, model)
+
+        self.file.flush()
+        root = self.rootcls.fromFile(open(self.path, "rb"))
+
+        try:
+            self.assertEqual({c.offsetInParent: bytes(c.data)
+                              for c in root.iterChildren()}, model)
+
+        finally:
+            root.file.close()
+
+
+class CachedBatchReadTests(BatchReadTests):
+    rootcls = CachedRoot
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import random
+import unittest
+
+from ebml._freemap import FreeSpaceMap
+
+
+def gapsOf(used, size):
+    """Returns the (start, end) of runs of free bytes in 'used'."""
+    gaps = []
+    start = None
+
+    for offset in range(size + 1):
+        free = offset < size and not used[offset]
+
+        if free and start is None:
+            start = offset
+
+        elif not free and start is not None:
+            gaps.append((start, offset))
+            start = None
+
+    return gaps
+
+
+class FreeSpaceMapTests(unittest.TestCase):
+    def test_fromChildren(self):
+        children = [(o, (b"\x81", None, o + 10)) for o in (0, 20, 30, 60)]
+        free = FreeSpaceMap.fromChildren(children, 100)
+        self.assertEqual(list(free), [(10, 20), (40, 60), (70, 100)])
+        self.assertEqual(free.containing(45), (40, 60))
+        self.assertIsNone(free.containing(30))
+
+    def test_free_merges(self):
+        free = FreeSpaceMap(load=2)
+        free.free(10, 20)
+        free.free(30, 40)
+        free.free(20, 30)
+        self.assertEqual(list(free), [(10, 40)])
+        free.allocate(15, 25)
+        self.assertEqual(list(free), [(10, 15), (25, 40)])
+
+        with self.assertRaises(ValueError):
+            free.allocate(12, 30)
+
+    def test_fits(self):
+        free = FreeSpaceMap()
+        free.free(0, 11)
+        self.assertEqual(free.firstFit(11), 0)
+        self.assertEqual(free.firstFit(9), 0)
+        # Would leave a 1-byte gap behind.
+        self.assertIsNone(free.firstFit(10))
+        self.assertEqual(free.firstFit(5, 1), 2)
+
+    def test_random(self):
+        rand = random.Random(0)
+        size = 600
+        used = [True]*size
+        free = FreeSpaceMap(load=3)
+
+        for step in range(2000):
+            start = rand.randrange(size)
+            end = min(size, start + rand.randrange(1, 40))
+
+            if rand.random() < 0.5:
+                if not used[start]:
+                    continue
+
+                # Free part of a run of used bytes, as a removed child.
+                end = start + 1
+
+                while end < size and used[end] and rand.random() < 0.95:
+                    end += 1
+
+                for k in range(start, end):
+                    used[k] = False
+
+                free.free(start, end)
+
+            else:
+                if any(used[start:end]):
+                    continue
+
+                for k in range(start, end):
+                    used[k] = True
+
+                free.allocate(start, end)
+
+            gaps = gapsOf(used, size)
+            self.assertEqual(list(free), gaps)
+            self.check(free, gaps, rand.randrange(1, 30),
+                       rand.randrange(size), rand.choice((1, 4, 16)))
+
+    def check(self, free, gaps, need, start, align):
+        fits = FreeSpaceMap.fits
+        first = best = aligned = None
+
+        for (s, e) in gaps:
+            if s <= start < e:
+                offset = start + 1 if start == s + 1 else start
+
+            elif s > start:
+                offset = s
+
+            else:
+                continue
+
+            if first is None and fits(need, e - offset):
+                first = offset
+
+            if fits(need, e - offset) and (
+                    best is None or (e - offset, offset) < best):
+                best = (e - offset, offset)
+
+            for offset in range(max(s, start), e - need + 1):
+                if (aligned is None and offset % align == 0
+                        and offset != s + 1 and e - offset - need != 1):
+                    aligned = offset
+
+        self.assertEqual(free.firstFit(need, start), first)
+        self.assertEqual(free.bestFit(need, start),
+                         None if best is None else best[1])
+        self.assertEqual(free.alignedFit(need, start, align), aligned)
+
+
+if __name__ == "__main__":
+    unittest.main()
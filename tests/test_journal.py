@@ -0,0 +1,114 @@
+import os
+import unittest
+
+from ebml.exceptions import JournalError
+from ebml.journal import Journal
+
+from .helpers import FileTestCase, Kid, Root as BaseRoot
+
+
+class Root(BaseRoot):
+    journaled = True
+
+
+class JournalTests(FileTestCase):
+    mode = None
+
+    def setUp(self):
+        super().setUp()
+        self.wal = self.path + ".wal"
+
+    def create(self, offsets):
+        with open(self.path, "wb+") as f:
+            root = Root(f, 0, 1000)
+
+            for offset in offsets:
+                root.addChildElement(Kid(offset), offset)
+
+            root.flush()
+            root.root._journal.close()
+
+    def read(self, mode="rb"):
+        with open(self.path, mode) as f:
+            root = Root.fromFile(f)
+            offsets = [c.data for c in root.iterChildren()]
+
+            if root._journal is not None:
+                root._journal.close()
+
+            return offsets
+
+    def test_flush_empties_journal(self):
+        self.create(range(0, 500, 50))
+        self.assertEqual(os.path.getsize(self.wal), 0)
+
+    def test_read_only_reopen(self):
+        self.create(range(0, 500, 50))
+        self.assertEqual(self.read(), list(range(0, 500, 50)))
+
+    def test_reopen_does_not_rewrite(self):
+        self.create(range(0, 500, 50))
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertEqual(self.read("rb+"), list(range(0, 500, 50)))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+
+    def test_replay_torn_tail(self):
+        self.create(range(0, 500, 50))
+
+        with open(self.path, "rb") as f:
+            before = f.read()
+
+        # Log a change without ever performing it on the file, as though the
+        # process had crashed while writing it, and tear the next one.
+        with open(self.path, "rb+") as f:
+            root = Root.fromFile(f)
+            journal = root._journal
+            journal.limit = 1 << 30
+            root.addChildElement(Kid(7), 600)
+            root.removeChildElement(100)
+            f.flush()
+
+            with open(self.wal, "rb") as w:
+                wal = w.read()
+
+            journal.close()
+
+        with open(self.path, "wb") as f:
+            f.write(before)
+
+        with open(self.wal, "wb") as w:
+            w.write(wal + b"EWAL\x00\x00\x00\x00\x00\x00\x00\x50garbage")
+
+        with self.assertRaises(JournalError):
+            self.read()
+
+        offsets = [0, 50, 150, 200, 250, 300, 350, 400, 450, 7]
+        self.assertEqual(self.read("rb+"), offsets)
+        self.assertEqual(os.path.getsize(self.wal), 0)
+        self.assertEqual(self.read(), offsets)
+
+    def test_corrupt_transaction_ignored(self):
+        self.create(range(0, 500, 50))
+        journal = Journal(self.wal)
+        journal.append([(0, b"XXXX")])
+        journal.close()
+
+        with open(self.wal, "rb+") as w:
+            w.seek(-1, os.SEEK_END)
+            last = w.read(1)
+            w.seek(-1, os.SEEK_END)
+            w.write(bytes([last[0] ^ 1]))
+
+        journal = Journal(self.wal)
+
+        try:
+            self.assertEqual(list(journal.transactions()), [])
+
+        finally:
+            journal.close()
+
+        self.assertEqual(self.read("rb+"), list(range(0, 500, 50)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import gc
+import os
+import unittest
+
+from .helpers import Blob, FileTestCase, Root
+
+
+class MappedRoot(Root):
+    mapped = True
+
+
+class MappedViewTests(FileTestCase):
+    """Children read as views into the map, held across edits."""
+
+    def setUp(self):
+        super().setUp()
+        root = MappedRoot(self.file, 0, 6*4096)
+        root.addChildElement(Blob(b"A"*100), 0)
+        root.addChildElement(Blob(b"Z"*100), 4*4096)
+        del root
+        gc.collect()
+        self.file.flush()
+        self.root = MappedRoot.fromFile(self.file)
+
+    def tearDown(self):
+        del self.root
+        super().tearDown()
+
+    def getView(self, offset):
+        child = self.root.getChildElement(offset)
+        self.assertIsInstance(child.data, memoryview)
+        return child
+
+    def test_move(self):
+        root = self.root
+        child = self.getView(0)
+        root.moveChildElement(0, 1000)
+        self.assertIs(root.getChildElement(1000), child)
+        self.assertEqual(bytes(child.data), b"A"*100)
+        root.addChildElement(Blob(b"B"*100), 0)
+        self.assertEqual(bytes(child.data), b"A"*100)
+
+    def test_remove(self):
+        root = self.root
+        child = self.getView(0)
+        root.removeChildElement(0)
+        root.addChildElement(Blob(b"B"*100), 0)
+        self.assertEqual(bytes(child.data), b"A"*100)
+
+    def test_collapse(self):
+        root = self.root
+        child = self.getView(4*4096)
+        other = self.getView(0)
+        self.assertTrue(root.tryCollapseRange(200, 4*4096))
+        self.assertLess(child.offsetInParent, 4*4096)
+        self.assertIs(root.getChildElement(child.offsetInParent), child)
+        self.assertEqual(bytes(child.data), b"Z"*100)
+        # Data before the collapsed range stays in the map.
+        self.assertIsInstance(other.data, memoryview)
+
+    def test_compact_truncates(self):
+        root = self.root
+        child = self.getView(4*4096)
+        root.removeChildElement(4*4096)
+        root.compact()
+        self.assertLess(os.path.getsize(self.path), 4*4096)
+        # Would fault (SIGBUS) if still a view past the end of the file.
+        self.assertEqual(bytes(child.data), b"Z"*100)
+
+
+if __name__ == "__main__":
+    unittest.main()
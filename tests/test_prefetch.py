@@ -0,0 +1,123 @@
+import gc
+import threading
+import unittest
+
+from .helpers import Blob, FileTestCase, Kid, Root
+
+
+class PrefetchTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = Root(self.file, 0, 40*200)
+
+        for i in range(200):
+            if i % 3:
+                self.root.addChildElement(Kid(i), 40*i)
+
+            else:
+                self.root.addChildElement(Blob(bytes([i])*30), 40*i)
+
+    def offsets(self, children):
+        return [c.offsetInParent for c in children]
+
+    def inThread(self, func):
+        # A deadlock fails the test instead of hanging it.
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()),
+                                  daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "deadlocked")
+        return result[0]
+
+    def test_same_children(self):
+        expected = self.offsets(self.root.iterChildren())
+        self.assertEqual(len(expected), 200)
+
+        for readahead in (1, 100, 1 << 20):
+            self.assertEqual(
+                self.offsets(self.root.prefetchChildren(readahead)),
+                expected)
+
+    def test_close_stops_worker(self):
+        before = threading.active_count()
+        children = self.root.prefetchChildren(100)
+        next(children)
+        children.close()
+        children = self.root.prefetchChildren(100)
+        next(children)
+        del children
+        gc.collect()
+        self.assertEqual(threading.active_count(), before)
+
+    def test_in_batch(self):
+        root = self.root
+
+        def run():
+            with root.batch():
+                root.removeChildElement(0)
+                return self.offsets(root.prefetchChildren())
+
+        self.assertEqual(self.inThread(run), list(range(40, 40*200, 40)))
+
+    def test_under_locks(self):
+        root = self.root
+        expected = self.offsets(root.iterChildren())
+
+        for lock in (root.lock, root.readLock):
+            def run():
+                with lock:
+                    return self.offsets(root.prefetchChildren())
+
+            self.assertEqual(self.inThread(run), expected)
+
+    def test_consume_in_batch(self):
+        root = self.root
+        expected = self.offsets(root.iterChildren())
+
+        for lock in (root.batch, lambda: root.lock):
+            children = root.prefetchChildren(100)
+            first = next(children)
+
+            def run():
+                with lock():
+                    return [first] + list(children)
+
+            self.assertEqual(self.offsets(self.inThread(run)), expected)
+
+    def test_close_in_batch(self):
+        root = self.root
+        children = root.prefetchChildren(100)
+        next(children)
+
+        def run():
+            with root.batch():
+                root.removeChildElement(40)
+                children.close()
+                return self.offsets(root.iterChildren())
+
+        self.assertEqual(self.inThread(run),
+                         [0] + list(range(80, 40*200, 40)))
+
+    def test_worker_error(self):
+        root = self.root
+        getChildElement = root._getChildElement
+
+        def failing(offset):
+            if offset >= 400:
+                raise ValueError(offset)
+
+            return getChildElement(offset)
+
+        root._getChildElement = failing
+        children = []
+
+        with self.assertRaises(ValueError):
+            for child in root.prefetchChildren():
+                children.append(child)
+
+        self.assertEqual(len(children), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from .helpers import FileTestCase, Kid, Root
+
+
+class PartialScanTests(FileTestCase):
+    """Edits to an element scanned only up to part of its children."""
+
+    # Kids every 10 bytes before and after a Void, the Void spanning two
+    # whole blocks of the file (the data of Root starts at file offset 12).
+    # There are enough after it to take more than one read by scanFile.
+    head = 408
+    tail = 150000
+    gap = (4080, 4084 + 2*4096)
+
+    def setUp(self):
+        super().setUp()
+        (start, end) = self.gap
+        size = end + 10*self.tail
+        self.file.write(Root.ebmlID + (1 << 56 | size).to_bytes(8, "big"))
+
+        for i in range(self.head):
+            self.file.write(Kid.ebmlID + b"\x88" + i.to_bytes(8, "big"))
+
+        self.file.write(b"\xec" + (1 << 56 | end - start - 9).to_bytes(8, "big")
+                        + bytes(end - start - 9))
+
+        for i in range(self.tail):
+            self.file.write(Kid.ebmlID + b"\x88" + i.to_bytes(8, "big"))
+
+        self.file.flush()
+        self.expected = ([10*i for i in range(self.head)]
+                         + [end + 10*i for i in range(self.tail)])
+
+    def open(self):
+        self.file.seek(0)
+        return Root.fromFile(self.file)
+
+    def offsets(self, root):
+        root._scanAll()
+        return list(root._children)
+
+    def test_collapse(self):
+        root = self.open()
+        self.assertEqual(root.getChildElement(1000).data, 100)
+        root.collapseRange(4084, 2*4096)
+        self.assertLess(root._scanned, root.dataSize)
+
+        expected = [offset if offset < 4084 else offset - 2*4096
+                    for offset in self.expected]
+        self.assertEqual(self.offsets(root), expected)
+        self.assertEqual(root.getChildElement(expected[-1]).data,
+                         self.tail - 1)
+        self.assertEqual(self.offsets(self.open()), expected)
+
+    def test_insert(self):
+        root = self.open()
+        self.assertEqual(root.getChildElement(1000).data, 100)
+        root.insertRange(4084, 4096)
+        self.assertLess(root._scanned, root.dataSize)
+
+        expected = [offset if offset < 4084 else offset + 4096
+                    for offset in self.expected]
+        self.assertEqual(self.offsets(root), expected)
+        self.assertEqual(root.getChildElement(expected[-1]).data,
+                         self.tail - 1)
+        self.assertEqual(self.offsets(self.open()), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
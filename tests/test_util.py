@@ -0,0 +1,175 @@
+import io
+import os
+import random
+import unittest
+from unittest import mock
+
+from ebml.util import (FALLOC_FL_COLLAPSE_RANGE, FALLOC_FL_INSERT_RANGE,
+                       FALLOC_FL_KEEP_SIZE, FALLOC_FL_PUNCH_HOLE, PagedFile,
+                       _copyRange, _fallocate)
+
+from .helpers import FileTestCase
+
+
+class CopyRangeTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = bytearray(random.Random(0).randbytes(4*1024**2))
+        self.file.write(self.data)
+
+    def copy(self, src, dst, size, file=None, **kwargs):
+        file = file or self.file
+        _copyRange(file, src, dst, size, 4096, **kwargs)
+        self.data[dst:dst + size] = self.data[src:src + size]
+        file.seek(0)
+        self.assertEqual(file.read(), self.data)
+
+    def test_overlapping(self):
+        # In the kernel, in pieces no larger than the distance.
+        self.copy(100, 100 + 1536*1024, 2*1024**2)
+        self.copy(100 + 1536*1024, 5, 2*1024**2)
+
+        # Through a buffer.
+        self.copy(1000, 1007, 5000, bufsize=100)
+        self.copy(1007, 1000, 5000, bufsize=100)
+
+    def test_disjoint(self):
+        self.copy(0, 2*1024**2, 1024**2)
+        self.copy(2*1024**2 + 1, 1, 1024**2)
+        self.copy(4096, 3*4096, 8192)
+
+    def test_no_fileno(self):
+        file = io.BytesIO(bytes(self.data))
+        self.copy(10, 1536*1024, 2*1024**2, file)
+        self.copy(1536*1024, 10, 2*1024**2, file, bufsize=1000)
+
+    def test_copy_file_range_fails(self):
+        def failing(*args):
+            raise OSError(18, "Invalid cross-device link")
+
+        with mock.patch.object(os, "copy_file_range", failing, create=True):
+            self.copy(100, 100 + 1536*1024, 2*1024**2)
+            self.copy(100 + 1536*1024, 5, 2*1024**2)
+
+    def test_copy_file_range_stops_short(self):
+        # Copies part of the first piece, then nothing more.
+        calls = []
+        copy_file_range = os.copy_file_range
+
+        def short(src, dst, count, offset_src, offset_dst):
+            calls.append(count)
+
+            if len(calls) > 1:
+                return 0
+
+            return copy_file_range(src, dst, count // 3, offset_src,
+                                   offset_dst)
+
+        for (src, dst) in ((100, 100 + 1536*1024), (100 + 1536*1024, 5)):
+            calls.clear()
+
+            with mock.patch.object(os, "copy_file_range", short):
+                self.copy(src, dst, 2*1024**2)
+
+            self.assertEqual(len(calls), 2)
+
+
+class PagedFileTests(FileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = bytearray(random.Random(0).randbytes(8*4096 + 100))
+        self.file.write(self.data)
+        self.paged = PagedFile(self.file, 4096, 4*4096)
+
+    def check(self):
+        # In pieces smaller than a page, so that they go through the cache.
+        paged = self.paged
+        paged.seek(0)
+        data = b"".join(iter(lambda: paged.read(1000), b""))
+        self.assertEqual(data, self.data)
+        self.assertEqual(os.pread(paged.fileno(), len(data) + 1, 0), data)
+
+    def write(self, offset, data):
+        self.paged.seek(offset)
+        self.assertEqual(self.paged.write(data), len(data))
+        end = offset + len(data)
+
+        if end > len(self.data):
+            self.data.extend(bytes(end - len(self.data)))
+
+        self.data[offset:end] = data
+
+    def test_cached(self):
+        paged = self.paged
+        self.assertEqual(paged.pread(100, 4000), self.data[4000:4100])
+        self.assertEqual((paged.hits, paged.misses), (0, 2))
+        self.assertEqual(paged.pread(10, 4090), self.data[4090:4100])
+        self.assertEqual((paged.hits, paged.misses), (2, 2))
+
+        # Reads of a page or more bypass the cache.
+        self.assertEqual(paged.pread(4096, 10), self.data[10:4106])
+        self.assertEqual((paged.hits, paged.misses), (2, 2))
+
+        # No more than 4 pages are kept.
+        self.check()
+        self.assertEqual(len(paged._pages), 4)
+
+    def test_read_after_write(self):
+        self.check()
+        self.write(4000, b"a"*200)
+        self.write(100, b"b"*5000)
+        self.check()
+
+        # Past the end of the file, extending its last page.
+        self.write(8*4096 + 50, b"c"*100)
+        self.check()
+
+        # Leaving a hole in the last page.
+        self.write(8*4096 + 1000, b"d"*10)
+        self.check()
+
+    def test_read_after_truncate(self):
+        self.check()
+        self.paged.truncate(3*4096 + 10)
+        del self.data[3*4096 + 10:]
+        self.check()
+
+        self.write(5*4096, b"e"*10)
+        self.check()
+
+        self.paged.seek(100)
+        self.assertEqual(self.paged.truncate(), 100)
+        del self.data[100:]
+        self.check()
+
+        # Extending the file.
+        self.paged.truncate(4096 + 5)
+        self.data.extend(bytes(4096 + 5 - 100))
+        self.check()
+
+    def test_read_after_fallocate(self):
+        paged = self.paged
+        self.check()
+
+        _fallocate(paged, FALLOC_FL_COLLAPSE_RANGE, 4096, 2*4096)
+        del self.data[4096:3*4096]
+        self.check()
+
+        _fallocate(paged, FALLOC_FL_INSERT_RANGE, 2*4096, 4096)
+        self.data[2*4096:2*4096] = bytes(4096)
+        self.check()
+
+        _fallocate(paged, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                   0, 4096)
+        self.data[:4096] = bytes(4096)
+        self.check()
+
+    def test_read_after_copy(self):
+        self.check()
+        _copyRange(self.paged, 100, 3*4096 + 7, 5000, 4096)
+        self.data[3*4096 + 7:3*4096 + 5007] = self.data[100:5100]
+        self.check()
+
+
+if __name__ == "__main__":
+    unittest.main()